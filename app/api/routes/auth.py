@@ -8,7 +8,13 @@ from typing import Optional
 from fastapi import APIRouter, Depends, Header, HTTPException
 from sqlalchemy.orm import Session
 
-from app.core.auth import AuthContext, mint_user_jwt, require_auth_context, require_workspace_key
+from app.core.auth import (
+    AuthContext,
+    invalidate_workspace_key,
+    mint_user_jwt,
+    require_auth_context,
+    require_workspace_key,
+)
 from app.db.models import Workspace, WorkspaceApiKey
 from app.db.session import get_db
 from app.schemas.auth import (
@@ -100,6 +106,34 @@ def create_workspace_key(
     )
 
 
+@router.post("/workspaces/{workspace_id}/keys/{key_id}/revoke", response_model=WorkspaceKeyOut)
+def revoke_workspace_key(
+    workspace_id: str,
+    key_id: str,
+    x_bootstrap_token: Optional[str] = Header(default=None, alias="X-Bootstrap-Token"),
+    db: Session = Depends(get_db),
+):
+    if not _bootstrap_allowed(x_bootstrap_token):
+        raise HTTPException(status_code=403, detail="bootstrap token required")
+
+    rec = db.get(WorkspaceApiKey, key_id)
+    if rec is None or rec.workspace_id != workspace_id:
+        raise HTTPException(status_code=404, detail="workspace key not found")
+    rec.status = "revoked"
+    db.commit()
+    db.refresh(rec)
+    invalidate_workspace_key(key_id)
+
+    return WorkspaceKeyOut(
+        workspace_id=workspace_id,
+        key_id=rec.key_id,
+        env=rec.env,
+        prefix=rec.prefix,
+        status=rec.status,
+        created_at=rec.created_at.isoformat(),
+    )
+
+
 @router.post("/token", response_model=MintTokenResponse)
 def mint_token(
     body: MintTokenRequest,
@@ -1,29 +1,46 @@
 from __future__ import annotations
 
-from typing import Optional
+import json
+from typing import Any, Iterator, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+from app.core.aio import AnySession
 from app.core.auth import (
     AuthContext,
     effective_workspace_id,
     require_auth_context_if_required,
     require_workspace_key_if_required,
 )
-from app.core.events import append_event, get_history
-from app.core.identity import get_metric
-from app.db.session import get_db
-from app.schemas.events import EventCreate, EventOut
+from app.core.events import append_event, append_events_bulk, get_history, iter_history
+from app.core.identity import existing_metric_ids, get_metric
+from app.core.snapshots import load_snapshots
+from app.db.models import SemanticEvent
+from app.db.session import engine as sync_engine
+from app.db.session import get_db, get_route_db, run_db
+from app.schemas.events import EventBulkRequest, EventBulkResponse, EventCreate, EventOut
 
 
 router = APIRouter(prefix="/metrics/{metric_id}", tags=["events"])
+bulk_router = APIRouter(tags=["events"])
+
+
+def _validate_snapshot(snap: dict) -> None:
+    # Enforce minimal snapshot shape: must include definition.logic object.
+    if "definition" not in snap or not isinstance(snap.get("definition"), dict):
+        raise HTTPException(status_code=400, detail="snapshot.definition required")
+    logic = snap["definition"].get("logic")
+    if not isinstance(logic, dict):
+        raise HTTPException(status_code=400, detail="snapshot.definition.logic required")
 
 
 @router.post("/events", response_model=EventOut)
 def post_event(
     metric_id: str,
     body: EventCreate,
+    skip_unchanged: bool = Query(default=False),
     workspace_id: str = Query(default="default"),
     db: Session = Depends(get_db),
     ctx: Optional[AuthContext] = Depends(require_workspace_key_if_required),
@@ -33,13 +50,8 @@ def post_event(
     if metric is None:
         raise HTTPException(status_code=404, detail="metric not found")
 
-    # Enforce minimal snapshot shape: must include definition.logic object.
     snap = body.snapshot or {}
-    if "definition" not in snap or not isinstance(snap.get("definition"), dict):
-        raise HTTPException(status_code=400, detail="snapshot.definition required")
-    logic = snap["definition"].get("logic")
-    if not isinstance(logic, dict):
-        raise HTTPException(status_code=400, detail="snapshot.definition.logic required")
+    _validate_snapshot(snap)
 
     event = append_event(
         db=db,
@@ -51,6 +63,7 @@ def post_event(
         reason=body.reason,
         actor=body.actor,
         snapshot=snap,
+        skip_unchanged=skip_unchanged,
     )
 
     return EventOut(
@@ -65,39 +78,126 @@ def post_event(
         reason=event.reason,
         actor=event.actor,
         semantic_patch=event.semantic_patch,
-        snapshot=event.snapshot,
+        snapshot=snap,
     )
 
 
+@bulk_router.post("/events:bulk", response_model=EventBulkResponse)
+def post_events_bulk(
+    body: EventBulkRequest,
+    skip_unchanged: bool = Query(default=False),
+    workspace_id: str = Query(default="default"),
+    db: Session = Depends(get_db),
+    ctx: Optional[AuthContext] = Depends(require_workspace_key_if_required),
+):
+    workspace_id = effective_workspace_id(workspace_id, ctx)
+    # All-or-nothing: validate every item before writing anything.
+    known = existing_metric_ids(db, workspace_id, sorted({e.metric_id for e in body.events}))
+    for e in body.events:
+        if e.metric_id not in known:
+            raise HTTPException(status_code=404, detail=f"metric not found: {e.metric_id}")
+        _validate_snapshot(e.snapshot or {})
+
+    rows = append_events_bulk(db, workspace_id, [e.model_dump() for e in body.events], skip_unchanged)
+    return EventBulkResponse(
+        events=[
+            EventOut(
+                workspace_id=r["workspace_id"],
+                event_id=str(r["event_id"]),
+                metric_id=r["metric_id"],
+                version_id=int(r["version_id"]),
+                event_type=r["event_type"],
+                timestamp=r["timestamp"].isoformat(),
+                source_system=r["source_system"],
+                source_ref=r["source_ref"],
+                reason=r["reason"],
+                actor=r["actor"],
+                semantic_patch=r["semantic_patch"],
+                snapshot=r["snapshot"],
+            )
+            for r in rows
+            if r is not None
+        ],
+        skipped=[i for i, r in enumerate(rows) if r is None],
+    )
+
+
+def _history_item(e: SemanticEvent, snapshot: Optional[dict], view: str) -> dict[str, Any]:
+    item: dict[str, Any] = {
+        "workspace_id": e.workspace_id,
+        "event_id": str(e.event_id),
+        "metric_id": e.metric_id,
+        "version_id": int(e.version_id),
+        "event_type": e.event_type,
+        "timestamp": e.timestamp.isoformat(),
+    }
+    if view != "patch":
+        item.update(
+            source_system=e.source_system,
+            source_ref=e.source_ref,
+            reason=e.reason,
+            actor=e.actor,
+        )
+    item["semantic_patch"] = e.semantic_patch
+    if view == "full":
+        item["snapshot"] = snapshot
+    return item
+
+
 @router.get("/history")
-def get_history_route(
+async def get_history_route(
     metric_id: str,
+    response: Response,
     limit: int = Query(default=50, ge=1, le=500),
+    before_version: Optional[int] = Query(default=None, ge=1),
+    view: str = Query(default="full", pattern="^(full|summary|patch)$"),
+    output: str = Query(default="json", alias="format", pattern="^(json|ndjson)$"),
     workspace_id: str = Query(default="default"),
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_route_db),
     ctx: Optional[AuthContext] = Depends(require_auth_context_if_required),
 ):
+    """
+    Newest first. Pages with before_version (the X-Next-Before-Version header of the previous
+    page). view=summary omits snapshot; view=patch returns identifiers plus semantic_patch.
+    format=ndjson streams every version older than before_version, one JSON object per line.
+    """
     workspace_id = effective_workspace_id(workspace_id, ctx)
-    metric = get_metric(db, workspace_id, metric_id)
-    if metric is None:
-        raise HTTPException(status_code=404, detail="metric not found")
+    with_snapshot = view == "full"
+    if output == "ndjson":
+        if await run_db(db, get_metric, workspace_id, metric_id) is None:
+            raise HTTPException(status_code=404, detail="metric not found")
+        # The stream is a sync iterator (Starlette runs it on the threadpool), so it always
+        # reads through a sync engine.
+        bind = db.get_bind() if isinstance(db, Session) else sync_engine
+
+        def lines() -> Iterator[bytes]:
+            # Own session: the stream outlives the request-scoped one.
+            with Session(bind=bind) as stream_db:
+                for e, snapshot in iter_history(stream_db, workspace_id, metric_id, before_version, with_snapshot):
+                    line = json.dumps(_history_item(e, snapshot, view), separators=(",", ":"))
+                    yield (line + "\n").encode("utf-8")
 
-    events = get_history(db, workspace_id, metric_id, limit=limit)
-    return [
-        {
-            "workspace_id": e.workspace_id,
-            "event_id": str(e.event_id),
-            "metric_id": e.metric_id,
-            "version_id": int(e.version_id),
-            "event_type": e.event_type,
-            "timestamp": e.timestamp.isoformat(),
-            "source_system": e.source_system,
-            "source_ref": e.source_ref,
-            "reason": e.reason,
-            "actor": e.actor,
-            "semantic_patch": e.semantic_patch,
-            "snapshot": e.snapshot,
-        }
-        for e in events
-    ]
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    events, snapshots = await run_db(
+        db, _history_page, workspace_id, metric_id, limit, before_version, with_snapshot
+    )
+    if len(events) == limit and int(events[-1].version_id) > 1:
+        response.headers["X-Next-Before-Version"] = str(int(events[-1].version_id))
+    return [_history_item(e, snapshots.get(e.event_id), view) for e in events]
 
+
+def _history_page(
+    db: Session,
+    workspace_id: str,
+    metric_id: str,
+    limit: int,
+    before_version: Optional[int],
+    with_snapshot: bool,
+) -> tuple[list[SemanticEvent], dict]:
+    if get_metric(db, workspace_id, metric_id) is None:
+        raise HTTPException(status_code=404, detail="metric not found")
+    events = get_history(
+        db, workspace_id, metric_id, limit=limit, before_version=before_version, with_snapshot=with_snapshot
+    )
+    return events, load_snapshots(db, events) if with_snapshot else {}
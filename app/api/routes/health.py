@@ -1,5 +1,10 @@
 from fastapi import APIRouter
 
+from app.core.key_usage import key_usage_stats
+from app.core.usage_writer import usage_writer_stats
+from app.db.session import db_pool_stats
+from app.utils.cache import cache_stats
+
 
 router = APIRouter()
 
@@ -8,3 +13,22 @@ router = APIRouter()
 def health():
     return {"status": "ok"}
 
+
+@router.get("/health/caches")
+def health_caches():
+    return {"caches": cache_stats()}
+
+
+@router.get("/health/usage_writer")
+def health_usage_writer():
+    return {"enabled": usage_writer_stats() is not None, "stats": usage_writer_stats()}
+
+
+@router.get("/health/key_usage")
+def health_key_usage():
+    return key_usage_stats()
+
+
+@router.get("/health/pool")
+def health_pool():
+    return db_pool_stats()
@@ -12,14 +12,12 @@ from app.core.auth import (
     require_auth_context_if_required,
     require_workspace_key_if_required,
 )
-from app.core.usage import log_usage
-from app.core.identity import create_metric, get_metric, upsert_alias
+from app.core.usage_writer import submit_usage
+from app.core.identity import create_metric, get_metric, learned_alias_metric_id, upsert_alias
+from app.core.search_index import get_search_index
 from app.db.models import MetricLatest
 from app.db.session import get_db
 from app.schemas.metric import AliasCreate, AliasOut, MetricCreate, MetricGetOut, MetricOut
-from sqlalchemy import select
-
-from app.db.models import Metric, MetricAlias
 from app.schemas.intent import IntentResolveRequest, IntentResolveResponse, IntentResolvedMetric
 from app.utils.hashing import sha256_hex
 
@@ -137,72 +135,61 @@ def resolve_intent(
     q_lower = query.lower()
     team = (body.context or {}).get("team")
 
-    # 1) Memory hit: exact alias match via source_locator user_learning::<term>:<team>
+    index = get_search_index(db, workspace_id)
+
+    # 1) Memory hit: exact alias match via source_locator user_learning::<term>:<team>,
+    # answered from the learned-alias cache and the search index once warm.
     if team:
         locator = f"{q_lower}:{team}"
-        alias = db.execute(
-            select(MetricAlias).where(
-                MetricAlias.workspace_id == workspace_id,
-                MetricAlias.source_system == "user_learning",
-                MetricAlias.source_locator == locator,
+        metric_id = learned_alias_metric_id(db, workspace_id, locator)
+        m = index.metric(metric_id) if metric_id is not None else None
+        if m is not None:
+            canonical_name, description = m
+            model, measure = _model_measure_from_metric_id(metric_id)
+            domain = _infer_domain(model)
+            return IntentResolveResponse(
+                status="resolved",
+                resolved_metric=IntentResolvedMetric(
+                    metric_id=metric_id,
+                    description=description or canonical_name,
+                    model=model,
+                    measure_name=measure,
+                    domain=domain,
+                ),
+                confidence=1.0,
+                reason=f"Meaning preserved: saved alias for '{q_lower}' in {team} context.",
             )
-        ).scalar_one_or_none()
-        if alias is not None:
-            m = db.get(Metric, {"workspace_id": workspace_id, "metric_id": alias.metric_id})
-            if m is not None:
-                model, measure = _model_measure_from_metric_id(m.metric_id)
-                domain = _infer_domain(model)
-                return IntentResolveResponse(
-                    status="resolved",
-                    resolved_metric=IntentResolvedMetric(
-                        metric_id=m.metric_id,
-                        description=m.description or m.canonical_name,
-                        model=model,
-                        measure_name=measure,
-                        domain=domain,
-                    ),
-                    confidence=1.0,
-                    reason=f"Meaning preserved: saved alias for '{q_lower}' in {team} context.",
-                )
-
-    # 2) Candidate collection: metrics + aliases match on substring
-    metrics = list(
-        db.execute(
-            select(Metric).where(Metric.workspace_id == workspace_id, Metric.status == "active")
-        ).scalars()
-    )
-    aliases = list(db.execute(select(MetricAlias).where(MetricAlias.workspace_id == workspace_id)).scalars())
 
-    alias_by_metric: dict[str, list[MetricAlias]] = {}
-    for a in aliases:
-        alias_by_metric.setdefault(a.metric_id, []).append(a)
-
-    def _matches_metric(m: Metric) -> bool:
-        hay = " ".join([(m.metric_id or ""), (m.canonical_name or ""), (m.description or "")]).lower()
-        if q_lower in hay:
-            return True
-        for a in alias_by_metric.get(m.metric_id, []):
-            if q_lower in (a.alias_name or "").lower():
-                return True
-        return False
-
-    matched_metrics = [m for m in metrics if _matches_metric(m)]
+    # 2) Candidate collection from the workspace's search index: active metrics whose
+    # "id name description" or an alias contains the query, in metric_id order.
+    matched_metrics = index.intent_candidates(q_lower)
+
+    # Nothing contains the query verbatim ("reveune", "net rev"): fall back to ranked,
+    # typo-tolerant retrieval over the same active metrics.
+    fuzzy = False
+    if not matched_metrics:
+        matched_metrics = [
+            (r["metric_id"], r["canonical_name"], r["description"])
+            for r in index.ranked_search(query, limit=50)
+            if index.is_active(r["metric_id"])
+        ]
+        fuzzy = bool(matched_metrics)
 
     # Revenue hook heuristic (demo-friendly, deterministic)
     if "revenue" in q_lower:
         rev = []
-        for m in matched_metrics:
-            if "revenue" in (m.metric_id or "").lower() or "revenue" in (m.canonical_name or "").lower() or "revenue" in (m.description or "").lower():
-                rev.append(m)
+        for metric_id, canonical_name, description in matched_metrics:
+            if "revenue" in " ".join([metric_id, canonical_name or "", description or ""]).lower():
+                rev.append((metric_id, canonical_name, description))
         matched_metrics = rev or matched_metrics
 
     candidates: list[IntentResolvedMetric] = []
-    for m in matched_metrics[:10]:
-        model, measure = _model_measure_from_metric_id(m.metric_id)
+    for metric_id, canonical_name, description in matched_metrics[:10]:
+        model, measure = _model_measure_from_metric_id(metric_id)
         candidates.append(
             IntentResolvedMetric(
-                metric_id=m.metric_id,
-                description=m.description or m.canonical_name,
+                metric_id=metric_id,
+                description=description or canonical_name,
                 model=model,
                 measure_name=measure,
                 domain=_infer_domain(model),
@@ -254,8 +241,8 @@ def resolve_intent(
     out = IntentResolveResponse(
         status="resolved",
         resolved_metric=candidates[0],
-        confidence=0.9,
-        reason="Single matching candidate.",
+        confidence=0.75 if fuzzy else 0.9,
+        reason="Single close match (typo-tolerant search)." if fuzzy else "Single matching candidate.",
     )
     _log_intent_usage(db, workspace_id, body, ctx, out, candidates=candidates)
     return out
@@ -303,8 +290,8 @@ def _log_intent_usage(
         user_id = ctx.user_id if ctx else None
         agent_id = ctx.agent_id if ctx else None
         auth_type = ctx.auth_type if ctx else None
-        log_usage(
-            db=db,
+        submit_usage(
+            db,
             workspace_id=workspace_id,
             query_text=body.query,
             context=body.context or {},
@@ -6,70 +6,147 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
+from app.core.aio import AnySession
 from app.core.auth import AuthContext, effective_workspace_id, require_auth_context_if_required
-from app.core.identity import get_metric
-from app.core.resolver import resolve_metric_state
-from app.core.usage import log_usage
-from app.db.session import get_db
-from app.schemas.resolve import ResolveRequest, ResolveResponse
+from app.core.identity import existing_metric_ids, get_metric
+from app.core.resolver import (
+    resolve_metric_state,
+    resolve_metric_state_as_of,
+    resolve_metric_states,
+    resolve_metric_states_as_of,
+)
+from app.core.usage_writer import submit_usage, submit_usage_many
+from app.db.session import get_route_db, run_db
+from app.schemas.resolve import (
+    ResolveBatchRequest,
+    ResolveBatchResponse,
+    ResolveBatchResult,
+    ResolveRequest,
+    ResolveResponse,
+)
 from app.utils.hashing import sha256_hex
 
 
 router = APIRouter(prefix="/metrics/{metric_id}", tags=["resolve"])
+batch_router = APIRouter(prefix="/metrics", tags=["resolve"])
+
+
+def _resolve_usage_record(
+    workspace_id: str,
+    metric_id: str,
+    context: dict,
+    ctx: Optional[AuthContext],
+    result: dict,
+) -> dict:
+    input_hash = sha256_hex(
+        json.dumps(
+            {"endpoint": "resolve_contract", "metric_id": metric_id, "context": context},
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+    )
+    surface = ctx.surface if ctx else None
+    return {
+        "workspace_id": workspace_id,
+        "query_text": f"resolve:{metric_id}",
+        "context": context,
+        "team": context.get("team"),
+        "interface": surface or "api",
+        "user_id": ctx.user_id if ctx else None,
+        "agent_id": ctx.agent_id if ctx else None,
+        "surface": surface,
+        "auth_type": ctx.auth_type if ctx else None,
+        "input_hash": input_hash,
+        "candidate_metrics": [],
+        "resolved_metric_id": metric_id,
+        "resolved_version_id": int(result.get("base_version_id") or 0) or None,
+        "confidence": None,
+        "clarifications_count": 0,
+        "feedback": None,
+    }
 
 
 @router.post("/resolve", response_model=ResolveResponse)
-def resolve(
+async def resolve(
     metric_id: str,
     body: ResolveRequest,
     workspace_id: str = Query(default="default"),
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_route_db),
     ctx: Optional[AuthContext] = Depends(require_auth_context_if_required),
 ):
     workspace_id = effective_workspace_id(workspace_id, ctx)
+    # All DB work in one run_db call: one threadpool hop (sync) or greenlet (async) per request.
+    return await run_db(db, _resolve, workspace_id, metric_id, body, ctx)
+
+
+def _resolve(
+    db: Session, workspace_id: str, metric_id: str, body: ResolveRequest, ctx: Optional[AuthContext]
+) -> ResolveResponse:
     metric = get_metric(db, workspace_id, metric_id)
     if metric is None:
         raise HTTPException(status_code=404, detail="metric not found")
 
+    if body.as_of is not None and body.as_of_version is not None:
+        raise HTTPException(status_code=400, detail="as_of and as_of_version are mutually exclusive")
     try:
-        result = resolve_metric_state(db, workspace_id, metric_id, body.context or {})
+        if body.as_of is not None or body.as_of_version is not None:
+            result = resolve_metric_state_as_of(
+                db, workspace_id, metric_id, body.context or {}, as_of=body.as_of, version_id=body.as_of_version
+            )
+        else:
+            result = resolve_metric_state(db, workspace_id, metric_id, body.context or {})
     except KeyError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
     # Best-effort audit logging.
     try:
-        input_hash = sha256_hex(
-            json.dumps(
-                {"endpoint": "resolve_contract", "metric_id": metric_id, "context": body.context or {}},
-                sort_keys=True,
-                separators=(",", ":"),
-            )
-        )
-        surface = ctx.surface if ctx else None
-        user_id = ctx.user_id if ctx else None
-        agent_id = ctx.agent_id if ctx else None
-        auth_type = ctx.auth_type if ctx else None
-        team = (body.context or {}).get("team")
-        log_usage(
-            db=db,
-            workspace_id=workspace_id,
-            query_text=f"resolve:{metric_id}",
-            context=body.context or {},
-            team=team,
-            interface=surface or "api",
-            user_id=user_id,
-            agent_id=agent_id,
-            surface=surface,
-            auth_type=auth_type,
-            input_hash=input_hash,
-            candidate_metrics=[],
-            resolved_metric_id=metric_id,
-            resolved_version_id=int(result.get("base_version_id") or 0) or None,
-            confidence=None,
-            clarifications_count=0,
-            feedback=None,
-        )
+        submit_usage(db, **_resolve_usage_record(workspace_id, metric_id, body.context or {}, ctx, result))
     except Exception:
         pass
 
     return ResolveResponse(**result)
+
+
+@batch_router.post("/resolve:batch", response_model=ResolveBatchResponse)
+async def resolve_batch(
+    body: ResolveBatchRequest,
+    workspace_id: str = Query(default="default"),
+    db: AnySession = Depends(get_route_db),
+    ctx: Optional[AuthContext] = Depends(require_auth_context_if_required),
+):
+    workspace_id = effective_workspace_id(workspace_id, ctx)
+    return await run_db(db, _resolve_batch, workspace_id, body, ctx)
+
+
+def _resolve_batch(
+    db: Session, workspace_id: str, body: ResolveBatchRequest, ctx: Optional[AuthContext]
+) -> ResolveBatchResponse:
+    known = existing_metric_ids(db, workspace_id, sorted({i.metric_id for i in body.items}))
+
+    # Resolve only items whose metric exists; unknown metrics become per-item errors.
+    to_resolve = [(i.metric_id, i.context or {}) for i in body.items if i.metric_id in known]
+    if body.as_of is not None:
+        resolved = iter(resolve_metric_states_as_of(db, workspace_id, to_resolve, body.as_of))
+    else:
+        resolved = iter(resolve_metric_states(db, workspace_id, to_resolve))
+
+    results: list[ResolveBatchResult] = []
+    usage_records: list[dict] = []
+    for item in body.items:
+        if item.metric_id not in known:
+            results.append(ResolveBatchResult(metric_id=item.metric_id, status="error", error="metric not found"))
+            continue
+        out = next(resolved)
+        if isinstance(out, KeyError):
+            results.append(ResolveBatchResult(metric_id=item.metric_id, status="error", error=str(out)))
+            continue
+        results.append(ResolveBatchResult(metric_id=item.metric_id, status="ok", result=ResolveResponse(**out)))
+        usage_records.append(_resolve_usage_record(workspace_id, item.metric_id, item.context or {}, ctx, out))
+
+    # Best-effort audit logging: one multi-row insert for the whole batch.
+    try:
+        submit_usage_many(db, usage_records)
+    except Exception:
+        db.rollback()
+
+    return ResolveBatchResponse(results=results)
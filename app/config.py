@@ -36,3 +36,26 @@ def get_database_url() -> str:
     # Cloud-first default: env-driven. Fallback to local SQLite for dev/tests.
     return "sqlite:///./local.db"
 
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    v = os.getenv(name, "").strip().lower()
+    if not v:
+        return default
+    return v in {"1", "true", "yes"}
+
+
+def env_int(name: str, default: int) -> int:
+    v = os.getenv(name, "").strip()
+    try:
+        return int(v) if v else default
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    v = os.getenv(name, "").strip()
+    try:
+        return float(v) if v else default
+    except ValueError:
+        return default
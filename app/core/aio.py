@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+from typing import Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+
+# Session type of the async routes: an AsyncSession (ENGRAM_ASYNC_DB=1) or a sync Session.
+# Routes pass it to app.db.session.run_db with the sync core function, so every query, cache
+# and invariant still has exactly one implementation.
+AnySession = Union[Session, AsyncSession]
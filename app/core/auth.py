@@ -7,17 +7,40 @@ import json
 import os
 import time
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
 from fastapi import Depends, HTTPException, Request
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from app.config import env_float, env_int
+from app.core.key_usage import tracker as key_usage
 from app.db.models import WorkspaceApiKey
 from app.db.session import get_db
+from app.utils.cache import LRUCache
 from app.utils.hashing import parse_workspace_key, workspace_key_hash
 
 
+# key_id -> (workspace_id, key_hash, status) as last read from workspace_api_keys. Revoking
+# through this process drops the entry (invalidate_workspace_key); the short TTL bounds how
+# long a key revoked elsewhere keeps working here. Unknown key_ids are not cached.
+_workspace_keys = LRUCache(
+    "workspace_keys",
+    maxsize=env_int("ENGRAM_AUTH_KEY_CACHE_SIZE", 1_000),
+    ttl_seconds=env_float("ENGRAM_AUTH_KEY_CACHE_TTL_SECONDS", 30.0),
+)
+
+# (jwt secret, token) -> AuthContext for verified user tokens. Each entry expires at the
+# token's exp; the cache-wide TTL only bounds tokens without one. Keyed by the secret too,
+# so rotating ENGRAM_JWT_SECRET stops accepting tokens signed with the old one.
+_verified_tokens = LRUCache(
+    "verified_tokens",
+    maxsize=env_int("ENGRAM_AUTH_TOKEN_CACHE_SIZE", 10_000),
+    ttl_seconds=env_float("ENGRAM_AUTH_TOKEN_CACHE_TTL_SECONDS", 300.0),
+)
+
+
 @dataclass(frozen=True)
 class AuthContext:
     workspace_id: str
@@ -53,9 +76,16 @@ def _b64url_decode(s: str) -> bytes:
     return base64.urlsafe_b64decode((s + pad).encode("utf-8"))
 
 
+@lru_cache(maxsize=4)
+def _jwt_hmac(secret: str) -> "hmac.HMAC":
+    # Keyed HMAC state (inner/outer pads already hashed); _jwt_sign copies it per token.
+    return hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+
 def _jwt_sign(unsigned: str, secret: str) -> str:
-    sig = hmac.new(secret.encode("utf-8"), unsigned.encode("utf-8"), hashlib.sha256).digest()
-    return _b64url_encode(sig)
+    mac = _jwt_hmac(secret).copy()
+    mac.update(unsigned.encode("utf-8"))
+    return _b64url_encode(mac.digest())
 
 
 def mint_user_jwt(
@@ -119,28 +149,55 @@ def _bearer_token(request: Request) -> Optional[str]:
     return h[7:].strip()
 
 
+def invalidate_workspace_key(key_id: str) -> None:
+    """
+    Call after changing a key's status or hash so this process stops trusting the cached row.
+    """
+    _workspace_keys.delete(key_id)
+
+
+def _workspace_key_record(db: Session, key_id: str) -> Optional[tuple[str, str, str]]:
+    record = _workspace_keys.get(key_id)
+    if record is None:
+        # Taken before the read, so a revoke that invalidates meanwhile keeps this row out.
+        generation = _workspace_keys.generation(key_id)
+        row = db.execute(select(WorkspaceApiKey).where(WorkspaceApiKey.key_id == key_id)).scalar_one_or_none()
+        if row is None:
+            return None
+        record = (row.workspace_id, row.key_hash, (row.status or "").lower())
+        _workspace_keys.set(key_id, record, generation=generation)
+    return record
+
+
 def _validate_workspace_key(db: Session, token: str) -> AuthContext:
     try:
         parts = parse_workspace_key(token)
     except Exception:
         raise HTTPException(status_code=401, detail="invalid workspace key")
-    row = db.execute(select(WorkspaceApiKey).where(WorkspaceApiKey.key_id == parts.key_id)).scalar_one_or_none()
-    if row is None:
+    record = _workspace_key_record(db, parts.key_id)
+    if record is None:
         raise HTTPException(status_code=401, detail="invalid workspace key")
-    if (row.status or "").lower() != "active":
+    workspace_id, key_hash, status = record
+    if status != "active":
         raise HTTPException(status_code=401, detail="workspace key revoked")
-    if not hmac.compare_digest(row.key_hash, workspace_key_hash(token)):
+    if not hmac.compare_digest(key_hash, workspace_key_hash(token)):
         raise HTTPException(status_code=401, detail="invalid workspace key")
-    return AuthContext(workspace_id=row.workspace_id, auth_type="workspace_key", key_id=row.key_id)
+    key_usage.touch(parts.key_id)  # written to last_used_at in bulk by the key usage flusher
+    return AuthContext(workspace_id=workspace_id, auth_type="workspace_key", key_id=parts.key_id)
 
 
 def _validate_user_token(token: str) -> AuthContext:
+    key = (_jwt_secret(), token)
+    ctx = _verified_tokens.get(key)
+    if ctx is not None:
+        return ctx
+
     payload = verify_user_jwt(token)
     ws = payload.get("workspace_id")
     sub = payload.get("sub")
     if not ws or not sub:
         raise HTTPException(status_code=401, detail="invalid token claims")
-    return AuthContext(
+    ctx = AuthContext(
         workspace_id=str(ws),
         auth_type="user_token",
         user_id=str(sub),
@@ -149,6 +206,9 @@ def _validate_user_token(token: str) -> AuthContext:
         agent_id=payload.get("agent_id"),
         surface=payload.get("surface"),
     )
+    exp = int(payload.get("exp") or 0)
+    _verified_tokens.set(key, ctx, ttl_seconds=exp - time.time() if exp else None)
+    return ctx
 
 
 def get_auth_context_optional(
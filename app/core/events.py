@@ -1,12 +1,28 @@
 from __future__ import annotations
 
+import random
+import time
 import uuid
-from typing import Optional
+from typing import Any, Callable, Iterator, Optional, TypeVar
 
-from sqlalchemy import desc, select
-from sqlalchemy.orm import Session
+from sqlalchemy import desc, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, defer
 
+from app.config import env_float, env_int
+from app.core.materialized import materialization_enabled
+from app.core.resolve_cache import invalidate_metric
+from app.core.resolver import refresh_resolved_states
+from app.core.snapshots import (
+    load_snapshots,
+    snapshot_delta_interval,
+    snapshot_hash,
+    store_snapshot_blobs,
+    stores_full_snapshot,
+)
 from app.db.models import MetricLatest, SemanticEvent
+from app.utils.json_patch import diff_snapshots, snapshot_filter_hashes
 
 
 def get_latest_version_id(db: Session, workspace_id: str, metric_id: str) -> int:
@@ -19,6 +35,102 @@ def get_latest_version_id(db: Session, workspace_id: str, metric_id: str) -> int
     return int(latest.latest_version_id) if latest else 0
 
 
+T = TypeVar("T")
+
+# Bounded optimistic retry for concurrent writers that allocated the same version.
+_APPEND_MAX_RETRIES = env_int("ENGRAM_APPEND_MAX_RETRIES", 8)
+_APPEND_BACKOFF_MS = env_float("ENGRAM_APPEND_BACKOFF_MS", 5.0)
+
+
+def _lock_latest_versions(db: Session, workspace_id: str, metric_ids: list[str]) -> dict[str, int]:
+    """
+    Reads metric_latest for metric_ids with FOR UPDATE (in metric_id order, so concurrent
+    bulk writers can't deadlock). Dialects without row locks (SQLite) ignore the clause;
+    there the unique constraint plus retry keeps allocation safe.
+    """
+    rows = db.execute(
+        select(MetricLatest.metric_id, MetricLatest.latest_version_id)
+        .where(MetricLatest.workspace_id == workspace_id, MetricLatest.metric_id.in_(metric_ids))
+        .order_by(MetricLatest.metric_id)
+        .with_for_update()
+    )
+    return {row.metric_id: int(row.latest_version_id) for row in rows}
+
+
+def _latest_events(
+    db: Session,
+    workspace_id: str,
+    metric_ids: list[str],
+) -> dict[str, tuple[SemanticEvent, dict[str, Any]]]:
+    """
+    Each metric's latest event with its full snapshot (the base its next diff is taken against).
+    """
+    events = list(
+        db.execute(
+            select(SemanticEvent)
+            .join(MetricLatest, MetricLatest.latest_event_id == SemanticEvent.event_id)
+            .where(MetricLatest.workspace_id == workspace_id, MetricLatest.metric_id.in_(metric_ids))
+        ).scalars()
+    )
+    snapshots = load_snapshots(db, events)
+    return {e.metric_id: (e, snapshots[e.event_id]) for e in events}
+
+
+def _stored_versions(
+    previous: Optional[dict[str, Any]],
+    snapshot: dict[str, Any],
+    version_id: int,
+    interval: int,
+) -> tuple[dict[str, Any], bool]:
+    """
+    (semantic_patch, keeps_full_snapshot) for a new version: the diff against the previous
+    snapshot, and whether the version references its snapshot blob or is a delta row.
+    """
+    if previous is None:
+        return {}, True
+    return diff_snapshots(previous, snapshot), stores_full_snapshot(version_id, interval)
+
+
+# Postgres names of semantic_events' (workspace_id, metric_id, version_id) unique constraint
+# and metric_latest's primary key, and the matching SQLite error messages.
+_VERSION_CONSTRAINTS = {"semantic_events_workspace_id_metric_id_version_id_key", "metric_latest_pkey"}
+_VERSION_CONFLICT_MESSAGES = (
+    "UNIQUE constraint failed: "
+    "semantic_events.workspace_id, semantic_events.metric_id, semantic_events.version_id",
+    "UNIQUE constraint failed: metric_latest.workspace_id, metric_latest.metric_id",
+)
+
+
+def _is_version_conflict(e: IntegrityError) -> bool:
+    orig = e.orig
+    # psycopg2 / psycopg report the constraint in diag, asyncpg on the error itself.
+    constraint = getattr(getattr(orig, "diag", None), "constraint_name", None) or getattr(
+        orig, "constraint_name", None
+    )
+    if constraint is not None:
+        return constraint in _VERSION_CONSTRAINTS
+    message = str(orig)
+    return any(m in message for m in _VERSION_CONFLICT_MESSAGES)
+
+
+def _retry_version_conflicts(db: Session, attempt: Callable[[], T]) -> T:
+    """
+    Runs attempt (which allocates versions and commits). A concurrent writer that got the
+    same version first surfaces as an IntegrityError on (workspace_id, metric_id, version_id)
+    or on metric_latest's primary key; roll back and retry with jittered exponential backoff.
+    Any other IntegrityError (unknown metric, missing column value) is raised at once.
+    """
+    for n in range(_APPEND_MAX_RETRIES + 1):
+        try:
+            return attempt()
+        except IntegrityError as e:
+            db.rollback()
+            if n == _APPEND_MAX_RETRIES or not _is_version_conflict(e):
+                raise
+            time.sleep(random.uniform(0, _APPEND_BACKOFF_MS * 2**n) / 1000.0)
+    raise AssertionError("unreachable")
+
+
 def append_event(
     db: Session,
     workspace_id: str,
@@ -29,58 +141,254 @@ def append_event(
     reason: Optional[str],
     actor: Optional[str],
     snapshot: dict,
+    skip_unchanged: bool = False,
 ) -> SemanticEvent:
-    # Append-only: compute next version id from MetricLatest.
-    latest_version = get_latest_version_id(db, workspace_id, metric_id)
-    next_version = latest_version + 1
-
-    event = SemanticEvent(
-        workspace_id=workspace_id,
-        metric_id=metric_id,
-        version_id=next_version,
-        event_type=event_type,
-        source_system=source_system,
-        source_ref=source_ref or {},
-        reason=reason,
-        actor=actor,
-        semantic_patch={},
-        snapshot=snapshot,
-    )
-    db.add(event)
-    db.flush()  # get event_id
+    """
+    skip_unchanged: if the snapshot equals the latest version's, write nothing and return
+    the latest event instead.
+    """
+    skipped = False
 
-    # Upsert metric_latest pointer.
-    latest = db.execute(
-        select(MetricLatest).where(
-            MetricLatest.workspace_id == workspace_id,
-            MetricLatest.metric_id == metric_id,
-        )
-    ).scalar_one_or_none()
-    if latest is None:
-        latest = MetricLatest(
+    def attempt() -> SemanticEvent:
+        nonlocal skipped
+        # Append-only: next version id from MetricLatest, row-locked where supported.
+        next_version = _lock_latest_versions(db, workspace_id, [metric_id]).get(metric_id, 0) + 1
+        previous_event, previous = _latest_events(db, workspace_id, [metric_id]).get(metric_id, (None, None))
+        semantic_patch, keep_full = _stored_versions(previous, snapshot, next_version, snapshot_delta_interval())
+        if skip_unchanged and previous_event is not None and not semantic_patch:
+            skipped = True
+            db.commit()  # release the row lock
+            return previous_event
+
+        digest = snapshot_hash(snapshot)
+        if keep_full:
+            store_snapshot_blobs(db, {digest: snapshot})
+
+        event = SemanticEvent(
             workspace_id=workspace_id,
             metric_id=metric_id,
-            latest_version_id=next_version,
-            latest_event_id=event.event_id,
+            version_id=next_version,
+            event_type=event_type,
+            source_system=source_system,
+            source_ref=source_ref or {},
+            reason=reason,
+            actor=actor,
+            semantic_patch=semantic_patch,
+            snapshot_hash=digest if keep_full else None,
+            filter_hashes=snapshot_filter_hashes(snapshot),
         )
-        db.add(latest)
-    else:
-        latest.latest_version_id = next_version
-        latest.latest_event_id = event.event_id
+        db.add(event)
+        db.flush()  # get event_id
 
-    db.commit()
+        # Upsert metric_latest pointer.
+        latest = db.execute(
+            select(MetricLatest).where(
+                MetricLatest.workspace_id == workspace_id,
+                MetricLatest.metric_id == metric_id,
+            )
+        ).scalar_one_or_none()
+        if latest is None:
+            latest = MetricLatest(
+                workspace_id=workspace_id,
+                metric_id=metric_id,
+                latest_version_id=next_version,
+                latest_event_id=event.event_id,
+            )
+            db.add(latest)
+        else:
+            latest.latest_version_id = next_version
+            latest.latest_event_id = event.event_id
+
+        if materialization_enabled():
+            refresh_resolved_states(db, workspace_id, metric_id)
+
+        db.commit()
+        return event
+
+    event = _retry_version_conflicts(db, attempt)
     db.refresh(event)
+    if not skipped:
+        invalidate_metric(workspace_id, metric_id)
     return event
 
 
-def get_history(db: Session, workspace_id: str, metric_id: str, limit: int = 50) -> list[SemanticEvent]:
-    rows = db.execute(
+def _upsert_latest(db: Session, rows: list[dict[str, Any]]) -> None:
+    """
+    Points metric_latest at the given versions with one INSERT ... ON CONFLICT DO UPDATE
+    (Postgres and SQLite); other dialects merge row by row.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = dialect_insert(MetricLatest).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MetricLatest.workspace_id, MetricLatest.metric_id],
+            set_={
+                "latest_version_id": stmt.excluded.latest_version_id,
+                "latest_event_id": stmt.excluded.latest_event_id,
+                "updated_at": func.now(),
+            },
+        )
+        db.execute(stmt)
+    else:
+        for row in rows:
+            db.merge(MetricLatest(**row))
+
+
+def append_events_bulk(
+    db: Session,
+    workspace_id: str,
+    events: list[dict[str, Any]],
+    skip_unchanged: bool = False,
+) -> list[Optional[dict[str, Any]]]:
+    """
+    Appends many events (possibly across metrics) in one transaction.
+
+    Each event takes append_event's keyword arguments (minus db/workspace_id). Versions are
+    allocated per metric in input order from one locked metric_latest read; events go in
+    with a multi-row INSERT and metric_latest with one upsert. Returns the inserted row per
+    event, in order (with full snapshots, whatever the storage mode); with skip_unchanged,
+    events whose snapshot equals the metric's previous one are not written and map to None.
+    """
+    if not events:
+        return []
+    metric_ids = sorted({e["metric_id"] for e in events})
+    rows = _retry_version_conflicts(
+        db, lambda: _append_events_bulk_once(db, workspace_id, metric_ids, events, skip_unchanged)
+    )
+    for metric_id in {r["metric_id"] for r in rows if r is not None}:
+        invalidate_metric(workspace_id, metric_id)
+    return rows
+
+
+def _append_events_bulk_once(
+    db: Session,
+    workspace_id: str,
+    metric_ids: list[str],
+    events: list[dict[str, Any]],
+    skip_unchanged: bool,
+) -> list[Optional[dict[str, Any]]]:
+    next_version = _lock_latest_versions(db, workspace_id, metric_ids)
+    previous = (
+        {m: snap for m, (_, snap) in _latest_events(db, workspace_id, list(next_version)).items()}
+        if next_version
+        else {}
+    )
+    interval = snapshot_delta_interval()
+    rows: list[Optional[dict[str, Any]]] = []
+    stored: list[dict[str, Any]] = []
+    blobs: dict[str, dict[str, Any]] = {}
+    latest: dict[str, dict[str, Any]] = {}
+    for e in events:
+        metric_id = e["metric_id"]
+        version_id = next_version.get(metric_id, 0) + 1
+        semantic_patch, keep_full = _stored_versions(previous.get(metric_id), e["snapshot"], version_id, interval)
+        if skip_unchanged and metric_id in previous and not semantic_patch:
+            rows.append(None)
+            continue
+        next_version[metric_id] = version_id
+        previous[metric_id] = e["snapshot"]
+        digest = snapshot_hash(e["snapshot"])
+        if keep_full:
+            blobs[digest] = e["snapshot"]
+        row = {
+            "workspace_id": workspace_id,
+            "event_id": uuid.uuid4(),
+            "metric_id": metric_id,
+            "version_id": version_id,
+            "event_type": e["event_type"],
+            "source_system": e["source_system"],
+            "source_ref": e.get("source_ref") or {},
+            "reason": e.get("reason"),
+            "actor": e.get("actor"),
+            "semantic_patch": semantic_patch,
+            "snapshot": e["snapshot"],
+            "filter_hashes": snapshot_filter_hashes(e["snapshot"]),
+        }
+        rows.append(row)
+        stored.append(
+            {k: v for k, v in row.items() if k != "snapshot"} | {"snapshot_hash": digest if keep_full else None}
+        )
+        latest[metric_id] = {
+            "workspace_id": workspace_id,
+            "metric_id": metric_id,
+            "latest_version_id": version_id,
+            "latest_event_id": row["event_id"],
+        }
+
+    if not stored:
+        db.commit()  # release the row locks
+        return rows
+    store_snapshot_blobs(db, blobs)
+    # Timestamps come from the server default (func.now()), as for append_event.
+    timestamps = db.execute(
+        insert(SemanticEvent).returning(SemanticEvent.timestamp, sort_by_parameter_order=True), stored
+    ).scalars()
+    for row, timestamp in zip((r for r in rows if r is not None), timestamps):
+        row["timestamp"] = timestamp
+    _upsert_latest(db, list(latest.values()))
+
+    if materialization_enabled():
+        for metric_id in latest:
+            refresh_resolved_states(db, workspace_id, metric_id)
+
+    db.commit()
+    return rows
+
+
+def _history_query(
+    workspace_id: str,
+    metric_id: str,
+    before_version: Optional[int],
+    with_snapshot: bool,
+):
+    # Keyset pagination: newest first, strictly older than the cursor version.
+    stmt = (
         select(SemanticEvent)
         .where(SemanticEvent.workspace_id == workspace_id, SemanticEvent.metric_id == metric_id)
         .order_by(desc(SemanticEvent.version_id))
-        .limit(limit)
-    ).scalars()
-    return list(rows)
+    )
+    if before_version is not None:
+        stmt = stmt.where(SemanticEvent.version_id < before_version)
+    if not with_snapshot:
+        stmt = stmt.options(defer(SemanticEvent.inline_snapshot))
+    return stmt
+
+
+def get_history(
+    db: Session,
+    workspace_id: str,
+    metric_id: str,
+    limit: int = 50,
+    before_version: Optional[int] = None,
+    with_snapshot: bool = True,
+) -> list[SemanticEvent]:
+    """
+    with_snapshot=False skips loading inline snapshots; don't read .snapshot on the result.
+    """
+    stmt = _history_query(workspace_id, metric_id, before_version, with_snapshot).limit(limit)
+    return list(db.execute(stmt).scalars())
+
+
+def iter_history(
+    db: Session,
+    workspace_id: str,
+    metric_id: str,
+    before_version: Optional[int] = None,
+    with_snapshot: bool = True,
+    batch_size: int = 500,
+) -> Iterator[tuple[SemanticEvent, Optional[dict[str, Any]]]]:
+    """
+    Streams (event, full snapshot or None) newest first, batch_size rows at a time through a
+    server-side cursor (yield_per), so memory stays flat however long the history is.
+    """
+    stmt = _history_query(workspace_id, metric_id, before_version, with_snapshot).execution_options(
+        yield_per=batch_size
+    )
+    for chunk in db.execute(stmt).scalars().partitions():
+        snapshots = load_snapshots(db, chunk) if with_snapshot else {}
+        for e in chunk:
+            yield e, snapshots.get(e.event_id)
 
 
 def get_event_by_id(db: Session, workspace_id: str, event_id: uuid.UUID) -> Optional[SemanticEvent]:
@@ -5,7 +5,21 @@ from typing import Optional
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from app.config import env_float, env_int
+from app.core.search_index import index_alias, index_metric
 from app.db.models import Metric, MetricAlias
+from app.utils.cache import LRUCache
+
+
+# (workspace_id, source_locator) -> metric_id of the user_learning alias, or None when there
+# is none (misses are cached too). upsert_alias drops the entry; the TTL bounds staleness
+# for writes made by other processes.
+_learned_aliases = LRUCache(
+    "learned_aliases",
+    maxsize=env_int("ENGRAM_LEARNED_ALIAS_CACHE_SIZE", 50_000),
+    ttl_seconds=env_float("ENGRAM_LEARNED_ALIAS_CACHE_TTL_SECONDS", 60.0),
+)
+_NOT_CACHED = object()
 
 
 def create_metric(
@@ -24,6 +38,7 @@ def create_metric(
     db.add(metric)
     db.commit()
     db.refresh(metric)
+    index_metric(workspace_id, metric)
     return metric
 
 
@@ -33,6 +48,40 @@ def get_metric(db: Session, workspace_id: str, metric_id: str) -> Optional[Metri
     ).scalar_one_or_none()
 
 
+def existing_metric_ids(db: Session, workspace_id: str, metric_ids: list[str]) -> set[str]:
+    if not metric_ids:
+        return set()
+    return set(
+        db.execute(
+            select(Metric.metric_id).where(
+                Metric.workspace_id == workspace_id,
+                Metric.metric_id.in_(metric_ids),
+            )
+        ).scalars()
+    )
+
+
+def learned_alias_metric_id(db: Session, workspace_id: str, source_locator: str) -> Optional[str]:
+    """
+    metric_id of the user_learning alias at source_locator ("<term>:<team>"), if any.
+    """
+    key = (workspace_id, source_locator)
+    cached = _learned_aliases.get(key, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        return cached
+    # Taken before the read: an upsert_alias committed meanwhile keeps our result out.
+    generation = _learned_aliases.generation(key)
+    metric_id = db.execute(
+        select(MetricAlias.metric_id).where(
+            MetricAlias.workspace_id == workspace_id,
+            MetricAlias.source_system == "user_learning",
+            MetricAlias.source_locator == source_locator,
+        )
+    ).scalar_one_or_none()
+    _learned_aliases.set(key, metric_id, generation=generation)
+    return metric_id
+
+
 def upsert_alias(
     db: Session,
     workspace_id: str,
@@ -57,6 +106,8 @@ def upsert_alias(
         # last_seen_at is not being auto-updated; keeping MVP minimal.
         db.commit()
         db.refresh(existing)
+        index_alias(workspace_id, existing)
+        _learned_aliases.delete((workspace_id, source_locator))
         return existing
 
     alias = MetricAlias(
@@ -70,5 +121,7 @@ def upsert_alias(
     db.add(alias)
     db.commit()
     db.refresh(alias)
+    index_alias(workspace_id, alias)
+    _learned_aliases.delete((workspace_id, source_locator))
     return alias
 
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import bindparam, or_, update
+from sqlalchemy.orm import Session
+
+from app.config import env_float
+from app.db.models import WorkspaceApiKey
+from app.utils.time import now_utc
+
+
+logger = logging.getLogger(__name__)
+
+
+class KeyUsageTracker:
+    """
+    Last-seen time per workspace key_id. touch() is a dict assignment under a lock (the auth
+    hot path never writes to the DB); flush() writes everything pending with one executemany
+    UPDATE of workspace_api_keys.last_used_at, which only ever moves the column forward.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: dict[str, datetime] = {}
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+
+    def touch(self, key_id: str, at: Optional[datetime] = None) -> None:
+        at = at or now_utc()
+        with self._lock:
+            self._pending[key_id] = at
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, db: Session) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        table = WorkspaceApiKey.__table__
+        stmt = (
+            update(table)
+            .where(
+                table.c.key_id == bindparam("b_key_id"),
+                or_(table.c.last_used_at.is_(None), table.c.last_used_at < bindparam("b_at")),
+            )
+            .values(last_used_at=bindparam("b_at"))
+        )
+        try:
+            db.execute(stmt, [{"b_key_id": k, "b_at": at} for k, at in sorted(batch.items())])
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the timestamps back unless a newer touch arrived meanwhile.
+            with self._lock:
+                for k, at in batch.items():
+                    if k not in self._pending or self._pending[k] < at:
+                        self._pending[k] = at
+                self.failed += 1
+            raise
+        with self._lock:
+            self.flushes += 1
+            self.written += len(batch)
+        return len(batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "flushes": self.flushes,
+                "written": self.written,
+                "failed": self.failed,
+            }
+
+
+class _Flusher:
+    def __init__(self, tracker: KeyUsageTracker, session_factory: Callable[[], Session], interval: float) -> None:
+        self._tracker = tracker
+        self._session_factory = session_factory
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="key-usage-flusher", daemon=True)
+
+    def _flush(self) -> None:
+        if not self._tracker.pending():
+            return
+        db = self._session_factory()
+        try:
+            self._tracker.flush(db)
+        except Exception:
+            logger.exception("key usage: failed to write last_used_at")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            self._flush()
+        self._flush()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping.set()
+        self._thread.join(timeout)
+
+
+tracker = KeyUsageTracker()
+_flusher: Optional[_Flusher] = None
+
+
+def key_usage_flush_seconds() -> float:
+    """
+    How often pending last_used_at values are written; 0 disables the background flusher.
+    """
+    return env_float("ENGRAM_KEY_USAGE_FLUSH_SECONDS", 30.0)
+
+
+def start_key_usage_flusher(session_factory: Callable[[], Session]) -> None:
+    global _flusher
+    interval = key_usage_flush_seconds()
+    if _flusher is None and interval > 0:
+        _flusher = _Flusher(tracker, session_factory, interval)
+        _flusher.start()
+
+
+def stop_key_usage_flusher() -> None:
+    """
+    Stops the flusher after a final flush, so shutdown does not lose the last interval.
+    """
+    global _flusher
+    if _flusher is not None:
+        _flusher.stop()
+        _flusher = None
+
+
+def key_usage_stats() -> dict:
+    return {"running": _flusher is not None, **tracker.stats()}
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.config import env_bool, env_float, env_int
+from app.db.models import Overlay, ResolvedState
+from app.utils.cache import LRUCache
+from app.utils.hashing import canonical_json, canonical_json_hash, is_hashable
+from app.utils.time import as_utc
+
+
+# (workspace_id, metric_id) -> (vocabulary, vocabulary_hash)
+_vocabularies = LRUCache(
+    "selector_vocabulary",
+    maxsize=env_int("ENGRAM_RESOLVE_CACHE_SIZE", 10_000),
+    ttl_seconds=env_float("ENGRAM_RESOLVE_CACHE_TTL_SECONDS", 30.0),
+)
+
+
+def materialization_enabled() -> bool:
+    return env_bool("ENGRAM_MATERIALIZED_RESOLVE")
+
+
+def selector_vocabulary(selectors: Iterable[Optional[dict]]) -> tuple[frozenset, str]:
+    """
+    The (key, value) pairs a metric's overlay selectors test, plus a stable hash of them.
+    Pairs with list/object values are left out; contexts carrying such values resolve live.
+    """
+    pairs = frozenset((k, v) for sel in selectors for k, v in (sel or {}).items() if is_hashable(v))
+    # Sorted by canonical text: values of one key may mix types ("gold", 1, None).
+    return pairs, canonical_json_hash(sorted(canonical_json([k, v]) for k, v in pairs))
+
+
+def selector_combination(context: Optional[dict], vocabulary: frozenset) -> Optional[str]:
+    """
+    Projects context onto the vocabulary. Resolution only depends on these pairs, so the
+    projection is the materialization key. None if the context can't be projected.
+    """
+    projected = {}
+    for k, v in (context or {}).items():
+        if not is_hashable(v):
+            return None
+        if (k, v) in vocabulary:
+            projected[k] = v
+    return canonical_json(projected)
+
+
+def _load_vocabulary(db: Session, workspace_id: str, metric_id: str) -> tuple[frozenset, str]:
+    cached = _vocabularies.get((workspace_id, metric_id))
+    if cached is None:
+        selectors = db.execute(
+            select(Overlay.selector).where(Overlay.workspace_id == workspace_id, Overlay.metric_id == metric_id)
+        ).scalars()
+        cached = selector_vocabulary(selectors)
+        _vocabularies.set((workspace_id, metric_id), cached)
+    return cached
+
+
+def get_materialized_state(
+    db: Session,
+    workspace_id: str,
+    metric_id: str,
+    context: Optional[dict],
+    now: datetime,
+) -> Optional[dict]:
+    vocabulary, vocabulary_hash = _load_vocabulary(db, workspace_id, metric_id)
+    combination = selector_combination(context, vocabulary)
+    if combination is None:
+        return None
+    row = db.get(
+        ResolvedState,
+        {"workspace_id": workspace_id, "metric_id": metric_id, "selector_combination": combination},
+    )
+    if row is None:
+        return None
+    if row.vocabulary_hash != vocabulary_hash:
+        # Overlays changed since our vocabulary was loaded (possibly in another process).
+        _vocabularies.delete((workspace_id, metric_id))
+        return None
+    if row.valid_until is not None and now >= as_utc(row.valid_until):
+        return None
+    return {
+        "metric_id": metric_id,
+        "base_version_id": int(row.base_version_id),
+        "applied_overlays": list(row.applied_overlays),
+        "resolved_snapshot": row.resolved_snapshot,
+        "provenance": row.provenance,
+    }
+
+
+def _row(
+    workspace_id: str,
+    metric_id: str,
+    combination: str,
+    vocabulary_hash: str,
+    result: dict,
+    valid_until: Optional[datetime],
+) -> ResolvedState:
+    return ResolvedState(
+        workspace_id=workspace_id,
+        metric_id=metric_id,
+        selector_combination=combination,
+        vocabulary_hash=vocabulary_hash,
+        base_version_id=int(result["base_version_id"]),
+        applied_overlays=list(result["applied_overlays"]),
+        resolved_snapshot=result["resolved_snapshot"],
+        provenance=result["provenance"],
+        valid_until=valid_until,
+    )
+
+
+def replace_materialized_states(
+    db: Session,
+    workspace_id: str,
+    metric_id: str,
+    overlays: list[Overlay],
+    results: list[tuple[dict, dict]],
+    valid_until: Optional[datetime],
+) -> None:
+    """
+    Replaces every materialized row of the metric with (context, result) pairs.
+    Does not commit: callers run this inside the write transaction.
+    """
+    vocabulary, vocabulary_hash = selector_vocabulary(o.selector for o in overlays)
+    db.execute(
+        delete(ResolvedState).where(
+            ResolvedState.workspace_id == workspace_id,
+            ResolvedState.metric_id == metric_id,
+        )
+    )
+    rows: dict[str, ResolvedState] = {}
+    for context, result in results:
+        combination = selector_combination(context, vocabulary)
+        if combination is not None:
+            rows[combination] = _row(workspace_id, metric_id, combination, vocabulary_hash, result, valid_until)
+    db.add_all(rows.values())
+    _vocabularies.set((workspace_id, metric_id), (vocabulary, vocabulary_hash))
@@ -1,14 +1,26 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import copy
+from bisect import bisect_left, bisect_right
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 
-from sqlalchemy import desc, select
+from sqlalchemy import delete, desc, select
 from sqlalchemy.orm import Session
 
-from app.db.models import Overlay
-from app.utils.time import now_utc
+from app.config import env_int
+from app.core.materialized import materialization_enabled
+from app.core.resolve_cache import invalidate_metric
+from app.db.models import Overlay, OverlayArchive
+from app.utils.cache import LRUCache
+from app.utils.hashing import is_hashable, sha256_hex
+from app.utils.json_patch import (
+    FilterKeys,
+    compose_overlay_patches,
+    overlay_filter_hashes,
+    overlay_filter_keys,
+)
+from app.utils.time import as_utc, now_utc
 
 
 def selector_matches(selector: dict, context: dict) -> bool:
@@ -51,14 +63,21 @@ def create_overlay(
         selector=selector,
         priority=priority,
         overlay_patch=overlay_patch,
+        filter_hashes=overlay_filter_hashes(overlay_patch),
         valid_from=valid_from,
         valid_to=valid_to,
         author=author,
         reason=reason,
     )
     db.add(overlay)
+    if materialization_enabled():
+        # Local import: the resolver depends on this module.
+        from app.core.resolver import refresh_resolved_states
+
+        refresh_resolved_states(db, workspace_id, metric_id)
     db.commit()
     db.refresh(overlay)
+    invalidate_metric(workspace_id, metric_id)
     return overlay
 
 
@@ -71,30 +90,209 @@ def list_overlays(db: Session, workspace_id: str, metric_id: str) -> list[Overla
     return list(rows)
 
 
+def archive_expired_overlays(
+    db: Session,
+    now: Optional[datetime] = None,
+    batch_size: int = 500,
+) -> int:
+    """
+    Moves overlays whose valid_to has passed into overlays_archive. Returns the number moved.
+    Expired overlays never match again, so resolved states are unchanged by archiving.
+    """
+    now = now or now_utc()
+    moved = 0
+    while True:
+        expired = list(
+            db.execute(
+                select(Overlay).where(Overlay.valid_to.is_not(None), Overlay.valid_to < now).limit(batch_size)
+            ).scalars()
+        )
+        if not expired:
+            return moved
+        db.add_all(
+            OverlayArchive(
+                workspace_id=o.workspace_id,
+                overlay_id=o.overlay_id,
+                metric_id=o.metric_id,
+                selector=o.selector,
+                priority=o.priority,
+                overlay_patch=o.overlay_patch,
+                filter_hashes=o.filter_hashes,
+                valid_from=o.valid_from,
+                valid_to=o.valid_to,
+                author=o.author,
+                reason=o.reason,
+                created_at=o.created_at,
+                archived_at=now,
+            )
+            for o in expired
+        )
+        db.execute(delete(Overlay).where(Overlay.overlay_id.in_([o.overlay_id for o in expired])))
+        affected = {(o.workspace_id, o.metric_id) for o in expired}
+        if materialization_enabled():
+            from app.core.resolver import refresh_resolved_states
+
+            for workspace_id, metric_id in affected:
+                refresh_resolved_states(db, workspace_id, metric_id)
+        db.commit()
+        for workspace_id, metric_id in affected:
+            invalidate_metric(workspace_id, metric_id)
+        moved += len(expired)
+
+
+def _overlay_order_key(o: Overlay) -> tuple:
+    return (int(o.priority), selector_specificity(o.selector or {}), o.created_at)
+
+
+class CompiledOverlays:
+    """
+    Precompiled overlay set for one metric.
+
+    Overlays are ranked once by the deterministic resolve order, and selectors are indexed as
+    (key, value) -> ranks, so matching a context is a lookup per context key instead of a scan.
+    Selectors with unhashable values (lists/objects) fall back to selector_matches.
+
+    Validity windows are bucketed on a sorted boundary list: between two consecutive
+    valid_from/valid_to instants the active overlay set is constant, so it is computed once
+    per segment and reused until now crosses the next boundary.
+
+    Only plain data is kept (no ORM objects, which expire once their session commits or
+    closes): select() maps ranks back onto the caller's overlay list, which must be in the
+    same order as the list compiled.
+    """
+
+    def __init__(self, overlays: list[Overlay]) -> None:
+        # Deterministic ordering (stable, so filtering later keeps the same relative order):
+        # 1) priority DESC
+        # 2) specificity DESC
+        # 3) created_at DESC
+        order = sorted(range(len(overlays)), key=lambda i: _overlay_order_key(overlays[i]), reverse=True)
+        # rank -> position in the compiled list
+        self._positions: list[int] = order
+        self._specificity: list[int] = []
+        self._postings: dict[tuple[str, Any], list[int]] = {}
+        self._unconditional: list[int] = []
+        self._residual: list[tuple[int, dict]] = []
+        for rank, i in enumerate(order):
+            selector = overlays[i].selector or {}
+            self._specificity.append(selector_specificity(selector))
+            if not selector:
+                self._unconditional.append(rank)
+            elif all(is_hashable(v) for v in selector.values()):
+                for item in selector.items():
+                    self._postings.setdefault(item, []).append(rank)
+            else:
+                self._residual.append((rank, copy.deepcopy(selector)))
+
+        # Normalized to aware UTC (SQLite hands back naive datetimes).
+        self._windows: list[tuple[Optional[datetime], Optional[datetime]]] = [
+            tuple(as_utc(b) if b is not None else None for b in (o.valid_from, o.valid_to))  # type: ignore[misc]
+            for o in (overlays[i] for i in order)
+        ]
+        self._boundaries: list[datetime] = sorted({b for w in self._windows for b in w if b is not None})
+        self._active_by_segment: dict[int, frozenset[int]] = {}
+
+    def match(self, context: dict) -> list[int]:
+        """
+        Ranks of overlays whose selector matches context, in resolve order.
+        """
+        hits: dict[int, int] = {}
+        for item in (context or {}).items():
+            if not is_hashable(item[1]):
+                continue
+            for rank in self._postings.get(item, ()):
+                hits[rank] = hits.get(rank, 0) + 1
+        matched = [rank for rank, n in hits.items() if n == self._specificity[rank]]
+        matched.extend(self._unconditional)
+        matched.extend(rank for rank, selector in self._residual if selector_matches(selector, context or {}))
+        matched.sort()
+        return matched
+
+    def active_ranks(self, now: datetime) -> Optional[frozenset[int]]:
+        """
+        Ranks of overlays valid at now, or None when no overlay has a validity window.
+        """
+        if not self._boundaries:
+            return None
+        i = bisect_left(self._boundaries, now)
+        if i < len(self._boundaries) and self._boundaries[i] == now:
+            # Windows are inclusive at both ends; evaluate boundary instants directly.
+            return frozenset(rank for rank, w in enumerate(self._windows) if _within_window(now, *w))
+        active = self._active_by_segment.get(i)
+        if active is None:
+            active = frozenset(rank for rank, w in enumerate(self._windows) if _within_window(now, *w))
+            self._active_by_segment[i] = active
+        return active
+
+    def next_boundary(self, now: datetime) -> Optional[datetime]:
+        """
+        Earliest valid_from/valid_to strictly after now, i.e. when the active set may change.
+        """
+        i = bisect_right(self._boundaries, now)
+        return self._boundaries[i] if i < len(self._boundaries) else None
+
+    def select(self, overlays: list[Overlay], context: dict, now: Optional[datetime] = None) -> list[Overlay]:
+        """
+        The matching overlays, taken from overlays (the list this was compiled from, as loaded
+        by the current session), in resolve order.
+        """
+        now = now or now_utc()
+        active = self.active_ranks(now)
+        return [
+            overlays[self._positions[rank]]
+            for rank in self.match(context)
+            if active is None or rank in active
+        ]
+
+
+_compiled = LRUCache("compiled_overlays", maxsize=env_int("ENGRAM_COMPILED_OVERLAYS_CACHE_SIZE", 2_000))
+
+
+def get_compiled_overlays(workspace_id: str, metric_id: str, overlays: list[Overlay]) -> CompiledOverlays:
+    """
+    Compiled overlays are memoized per ordered overlay ids, so a new overlay simply misses
+    and ranks always map back onto a list in the same order.
+    """
+    key = (workspace_id, metric_id, sha256_hex(",".join(str(o.overlay_id) for o in overlays)))
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = CompiledOverlays(overlays)
+        _compiled.set(key, compiled)
+    return compiled
+
+
+_composed = LRUCache("composed_overlay_patches", maxsize=env_int("ENGRAM_COMPOSED_PATCH_CACHE_SIZE", 10_000))
+
+
+def overlays_filter_keys(overlays: list[Overlay]) -> FilterKeys:
+    known: FilterKeys = {}
+    for o in overlays:
+        known.update(overlay_filter_keys(o.overlay_patch or {}, o.filter_hashes))
+    return known
+
+
+def get_composed_patch(
+    workspace_id: str,
+    metric_id: str,
+    overlays: list[Overlay],
+) -> tuple[Optional[dict], FilterKeys]:
+    """
+    One patch equivalent to applying overlays in order, memoized per ordered overlay ids
+    (overlays are immutable), with the stored hashes of the filters it carries.
+    The patch is None when the stack has to be applied overlay by overlay.
+    """
+    key = (workspace_id, metric_id, tuple(str(o.overlay_id) for o in overlays))
+    cached = _composed.get(key)
+    if cached is None:
+        known = overlays_filter_keys(overlays)
+        cached = (compose_overlay_patches([o.overlay_patch or {} for o in overlays], known), known)
+        _composed.set(key, cached)
+    return cached
+
+
 def select_overlays_for_context(
     overlays: list[Overlay],
     context: dict,
     now: Optional[datetime] = None,
 ) -> list[Overlay]:
-    now = now or now_utc()
-    matching: list[Overlay] = []
-    for o in overlays:
-        if not _within_window(now, o.valid_from, o.valid_to):
-            continue
-        if selector_matches(o.selector or {}, context or {}):
-            matching.append(o)
-
-    # Deterministic ordering:
-    # 1) priority DESC
-    # 2) specificity DESC
-    # 3) created_at DESC
-    matching.sort(
-        key=lambda o: (
-            int(o.priority),
-            selector_specificity(o.selector or {}),
-            o.created_at,
-        ),
-        reverse=True,
-    )
-    return matching
-
+    return CompiledOverlays(overlays).select(overlays, context, now=now)
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Iterable, Optional
+
+from app.config import env_int
+
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# BM25 parameters (the usual defaults).
+_K1 = 1.2
+_B = 0.75
+
+# Symmetric-delete index: deletes are generated from the first _PREFIX characters only
+# (the SymSpell prefix trick), which bounds the index to a few dozen keys per term.
+_PREFIX = 7
+_MAX_PREFIX_EXPANSIONS = 64
+
+# Expansion weights: an exact term counts fully, a completion of a partial last word or a
+# typo counts less, so exact matches always rank first.
+_PREFIX_WEIGHT = 0.8
+_TYPO_WEIGHT = {1: 0.6, 2: 0.4}
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    """
+    Lowercased alphanumeric runs: "finance.net_revenue" -> ["finance", "net", "revenue"].
+    """
+    return _TOKEN.findall((text or "").lower())
+
+
+def max_edit_distance() -> int:
+    return max(0, min(2, env_int("ENGRAM_SEARCH_MAX_EDIT_DISTANCE", 2)))
+
+
+def _allowed_distance(token: str, limit: int) -> int:
+    # Short tokens are too ambiguous to correct: "arr" is one edit away from "mrr".
+    if len(token) < 4:
+        return 0
+    return min(limit, 1 if len(token) < 8 else 2)
+
+
+def _deletes(word: str, distance: int) -> set[str]:
+    out = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1 :] for w in frontier for i in range(len(w))} - out
+        out |= frontier
+    return out
+
+
+def osa_distance(a: str, b: str, max_distance: int) -> Optional[int]:
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions), or None
+    when it exceeds max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    prev2: list[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_distance:
+            return None
+        prev2, prev = prev, cur
+    return prev[-1] if prev[-1] <= max_distance else None
+
+
+class RankedIndex:
+    """
+    Tokenized BM25 over metric_id, canonical_name, description and alias names (one bag of
+    terms per metric), with typo tolerance from a symmetric-delete index over the vocabulary
+    and completion of partial words from the sorted vocabulary.
+
+    Each query token expands to the vocabulary terms it matches (itself, completions, terms
+    within its edit-distance budget); a metric scores the best weighted BM25 per query token,
+    summed. Ties break on metric_id, so results are deterministic. Not thread-safe on its own;
+    SearchIndex serializes access.
+    """
+
+    def __init__(self) -> None:
+        self._postings: dict[str, dict[str, int]] = {}
+        self._doc_len: dict[str, int] = {}
+        self._total_len = 0
+        self._vocab: list[str] = []
+        self._deletes: dict[str, set[str]] = {}
+        self._alias_tokens: dict[tuple[str, str], tuple[str, list[str]]] = {}
+        self._max_distance = max_edit_distance()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def _add_term(self, term: str) -> None:
+        self._postings[term] = {}
+        insort(self._vocab, term)
+        for d in _deletes(term[:_PREFIX], self._max_distance):
+            self._deletes.setdefault(d, set()).add(term)
+
+    def _add_tokens(self, metric_id: str, tokens: Iterable[str], sign: int = 1) -> None:
+        for term, tf in Counter(tokens).items():
+            if term not in self._postings:
+                self._add_term(term)
+            postings = self._postings[term]
+            count = postings.get(metric_id, 0) + sign * tf
+            if count > 0:
+                postings[metric_id] = count
+            else:
+                postings.pop(metric_id, None)
+            self._doc_len[metric_id] = self._doc_len.get(metric_id, 0) + sign * tf
+            self._total_len += sign * tf
+
+    def add_metric(self, metric_id: str, canonical_name: Optional[str], description: Optional[str]) -> None:
+        self._doc_len.setdefault(metric_id, 0)
+        self._add_tokens(metric_id, tokenize(metric_id) + tokenize(canonical_name) + tokenize(description))
+
+    def upsert_alias(self, key: tuple[str, str], metric_id: str, alias_name: Optional[str]) -> None:
+        previous = self._alias_tokens.get(key)
+        if previous is not None:
+            self._add_tokens(previous[0], previous[1], sign=-1)
+        tokens = tokenize(alias_name)
+        self._alias_tokens[key] = (metric_id, tokens)
+        self._doc_len.setdefault(metric_id, 0)
+        self._add_tokens(metric_id, tokens)
+
+    def _expand(self, token: str, partial: bool) -> dict[str, float]:
+        """
+        Vocabulary term -> weight for one query token.
+        """
+        out: dict[str, float] = {}
+        if self._postings.get(token):
+            out[token] = 1.0
+
+        if partial and len(token) >= 3:
+            i = bisect_left(self._vocab, token)
+            for term in self._vocab[i : i + _MAX_PREFIX_EXPANSIONS]:
+                if not term.startswith(token):
+                    break
+                if term != token:
+                    out[term] = _PREFIX_WEIGHT
+
+        distance = _allowed_distance(token, self._max_distance)
+        if distance:
+            seen: set[str] = set()
+            for d in _deletes(token[:_PREFIX], distance):
+                seen |= self._deletes.get(d, set())
+            for term in seen - out.keys():
+                found = osa_distance(token, term, distance)
+                if found:
+                    out[term] = _TYPO_WEIGHT[found]
+        return out
+
+    def search(self, query: str, limit: int = 20) -> list[tuple[str, float, list[str]]]:
+        """
+        (metric_id, score, matched vocabulary terms), best first.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        n = len(self._doc_len)
+        if not tokens or not n:
+            return []
+        avg_len = max(self._total_len / n, 1.0)
+
+        scores: dict[str, float] = {}
+        matched: dict[str, set[str]] = {}
+        for pos, token in enumerate(tokens):
+            # Only the last word may be unfinished ("net rev").
+            expansions = self._expand(token, partial=pos == len(tokens) - 1)
+            best: dict[str, tuple[float, str]] = {}
+            for term, weight in expansions.items():
+                postings = self._postings[term]
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                for metric_id, tf in postings.items():
+                    norm = _K1 * (1.0 - _B + _B * self._doc_len[metric_id] / avg_len)
+                    s = weight * idf * tf * (_K1 + 1.0) / (tf + norm)
+                    if metric_id not in best or s > best[metric_id][0]:
+                        best[metric_id] = (s, term)
+            for metric_id, (s, term) in best.items():
+                scores[metric_id] = scores.get(metric_id, 0.0) + s
+                matched.setdefault(metric_id, set()).add(term)
+
+        top = heapq.nsmallest(limit, scores.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [(metric_id, score, sorted(matched[metric_id])) for metric_id, score in top]
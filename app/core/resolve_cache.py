@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import itertools
+import threading
+from typing import Any, Iterable, Optional
+
+from app.config import env_float, env_int
+from app.utils.cache import LRUCache
+from app.utils.hashing import canonical_json, sha256_hex
+
+
+# Resolved states keyed by (workspace_id, metric_id, latest_version_id, overlay_fingerprint, context).
+_resolved = LRUCache(
+    "resolve",
+    maxsize=env_int("ENGRAM_RESOLVE_CACHE_SIZE", 10_000),
+    ttl_seconds=env_float("ENGRAM_RESOLVE_CACHE_TTL_SECONDS", 30.0),
+)
+
+# Last observed (latest_version_id, overlay_fingerprint) per (workspace_id, metric_id).
+# Lets a repeat resolve build the full cache key without touching the DB.
+_metric_state = LRUCache(
+    "resolve_metric_state",
+    maxsize=env_int("ENGRAM_RESOLVE_CACHE_SIZE", 10_000),
+    ttl_seconds=env_float("ENGRAM_RESOLVE_CACHE_TTL_SECONDS", 30.0),
+)
+
+
+# Bumped by invalidate_metric. A resolve captures it before its DB reads and only stores its
+# result if no write was invalidated meanwhile (otherwise it may have read the old state).
+_generation_lock = threading.Lock()
+_generation_counter = itertools.count(1)
+_generations: dict[tuple[str, str], int] = {}
+
+
+def metric_generation(workspace_id: str, metric_id: str) -> int:
+    return _generations.get((workspace_id, metric_id), 0)
+
+
+def canonical_context(context: Optional[dict]) -> str:
+    return canonical_json(context or {})
+
+
+def overlay_fingerprint(overlay_ids: Iterable[Any]) -> str:
+    """
+    Overlays are immutable once written, so the set of ids identifies the overlay state.
+    """
+    joined = ",".join(sorted(str(i) for i in overlay_ids))
+    return sha256_hex(joined)
+
+
+def get_cached_resolution(workspace_id: str, metric_id: str, context: Optional[dict]) -> Optional[dict]:
+    state = _metric_state.get((workspace_id, metric_id))
+    if state is None:
+        return None
+    version_id, fingerprint = state
+    return _resolved.get((workspace_id, metric_id, version_id, fingerprint, canonical_context(context)))
+
+
+def store_resolution(
+    workspace_id: str,
+    metric_id: str,
+    version_id: int,
+    fingerprint: str,
+    context: Optional[dict],
+    result: dict,
+    generation: int,
+    ttl_seconds: Optional[float] = None,
+) -> None:
+    """
+    generation is metric_generation() from before the result's DB reads; the result is
+    dropped if the metric was invalidated since. ttl_seconds lets the caller stop the entry
+    at the next overlay validity boundary.
+    """
+    with _generation_lock:
+        if metric_generation(workspace_id, metric_id) != generation:
+            return
+        _metric_state.set((workspace_id, metric_id), (int(version_id), fingerprint))
+        _resolved.set(
+            (workspace_id, metric_id, int(version_id), fingerprint, canonical_context(context)),
+            result,
+            ttl_seconds=ttl_seconds,
+        )
+
+
+def invalidate_metric(workspace_id: str, metric_id: str) -> None:
+    """
+    Called after a new event or overlay is committed for the metric. Only this process
+    is invalidated; other workers serve their cached state until it expires.
+    """
+    with _generation_lock:
+        _generations[(workspace_id, metric_id)] = next(_generation_counter)
+    _metric_state.delete((workspace_id, metric_id))
+    _resolved.invalidate(lambda k: k[0] == workspace_id and k[1] == metric_id)
@@ -1,14 +1,52 @@
 from __future__ import annotations
 
-from sqlalchemy import select
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+from sqlalchemy import desc, func, select, tuple_
 from sqlalchemy.orm import Session
 
-from app.core.overlays import list_overlays, select_overlays_for_context
-from app.db.models import MetricLatest, SemanticEvent
-from app.utils.json_patch import apply_overlay_patch
+from app.config import env_float, env_int
+from app.core.materialized import (
+    get_materialized_state,
+    materialization_enabled,
+    replace_materialized_states,
+)
+from app.core.overlays import (
+    get_compiled_overlays,
+    get_composed_patch,
+    list_overlays,
+    overlays_filter_keys,
+)
+from app.core.resolve_cache import (
+    canonical_context,
+    get_cached_resolution,
+    metric_generation,
+    overlay_fingerprint,
+    store_resolution,
+)
+from app.core.snapshots import event_snapshot, load_snapshots
+from app.db.models import MetricLatest, Overlay, OverlayArchive, SemanticEvent
+from app.utils.cache import LRUCache
+from app.utils.json_patch import apply_overlay_patch, ops_create_keys, snapshot_filter_keys
+from app.utils.time import as_utc, now_utc
 
 
 def resolve_metric_state(db: Session, workspace_id: str, metric_id: str, context: dict) -> dict:
+    # Cached results are shared between callers; treat the returned dict as read-only.
+    cached = get_cached_resolution(workspace_id, metric_id, context)
+    if cached is not None:
+        return cached
+
+    generation = metric_generation(workspace_id, metric_id)
+    now = now_utc()
+    if materialization_enabled():
+        # Rows are only written by the write path (refresh_resolved_states), inside the
+        # transaction that changes the metric; other selector combinations resolve live.
+        materialized = get_materialized_state(db, workspace_id, metric_id, context, now)
+        if materialized is not None:
+            return materialized
+
     latest = db.execute(
         select(MetricLatest).where(
             MetricLatest.workspace_id == workspace_id,
@@ -25,18 +63,333 @@ def resolve_metric_state(db: Session, workspace_id: str, metric_id: str, context
         )
     ).scalar_one()
 
-    base_snapshot = event.snapshot
+    overlays = list_overlays(db, workspace_id, metric_id)
+    snapshot = event_snapshot(db, event)
+    return _resolve_loaded(
+        workspace_id, metric_id, event, snapshot, overlays, context, now=now, generation=generation
+    )
 
+
+def refresh_resolved_states(db: Session, workspace_id: str, metric_id: str) -> None:
+    """
+    Recomputes the metric's resolved_states rows for the empty context and every overlay
+    selector. Runs inside the caller's write transaction: flushes, never commits.
+    """
+    db.flush()
+    latest = db.execute(
+        select(MetricLatest).where(
+            MetricLatest.workspace_id == workspace_id,
+            MetricLatest.metric_id == metric_id,
+        )
+    ).scalar_one_or_none()
+    if latest is None:
+        return
+    event = db.execute(
+        select(SemanticEvent).where(
+            SemanticEvent.workspace_id == workspace_id,
+            SemanticEvent.event_id == latest.latest_event_id,
+        )
+    ).scalar_one()
     overlays = list_overlays(db, workspace_id, metric_id)
-    matching = select_overlays_for_context(overlays, context or {})
+    snapshot = event_snapshot(db, event)
+
+    now = now_utc()
+    contexts = [{}] + [o.selector or {} for o in overlays]
+    results = [
+        (c, _resolve_loaded(workspace_id, metric_id, event, snapshot, overlays, c, now=now))
+        for c in contexts
+    ]
+    valid_until = get_compiled_overlays(workspace_id, metric_id, overlays).next_boundary(now)
+    replace_materialized_states(db, workspace_id, metric_id, overlays, results, valid_until)
+
+
+def resolve_metric_states(
+    db: Session,
+    workspace_id: str,
+    items: list[tuple[str, dict]],
+) -> list[Union[dict, KeyError]]:
+    """
+    Resolves many (metric_id, context) pairs with a fixed number of set-based queries.
+
+    Returns one entry per item, in order: the resolved state, or a KeyError for metrics
+    without events (callers report these per item instead of failing the batch).
+    """
+    results: list[Union[dict, KeyError, None]] = [None] * len(items)
+    pending: list[int] = []
+    for i, (metric_id, context) in enumerate(items):
+        cached = get_cached_resolution(workspace_id, metric_id, context)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+    if not pending:
+        return results  # type: ignore[return-value]
+
+    metric_ids = sorted({items[i][0] for i in pending})
+    generations = {m: metric_generation(workspace_id, m) for m in metric_ids}
+    latest_by_metric = {
+        row.metric_id: row
+        for row in db.execute(
+            select(MetricLatest).where(
+                MetricLatest.workspace_id == workspace_id,
+                MetricLatest.metric_id.in_(metric_ids),
+            )
+        ).scalars()
+    }
+    event_ids = [row.latest_event_id for row in latest_by_metric.values()]
+    events_by_id = (
+        {
+            e.event_id: e
+            for e in db.execute(
+                select(SemanticEvent).where(
+                    SemanticEvent.workspace_id == workspace_id,
+                    SemanticEvent.event_id.in_(event_ids),
+                )
+            ).scalars()
+        }
+        if event_ids
+        else {}
+    )
+    snapshots = load_snapshots(db, list(events_by_id.values()))
+    overlays_by_metric: dict[str, list[Overlay]] = {}
+    if latest_by_metric:
+        for o in db.execute(
+            select(Overlay)
+            .where(
+                Overlay.workspace_id == workspace_id,
+                Overlay.metric_id.in_(list(latest_by_metric)),
+            )
+            .order_by(desc(Overlay.priority), desc(Overlay.created_at))
+        ).scalars():
+            overlays_by_metric.setdefault(o.metric_id, []).append(o)
+
+    now = now_utc()
+    for i in pending:
+        metric_id, context = items[i]
+        latest = latest_by_metric.get(metric_id)
+        if latest is None:
+            results[i] = KeyError(f"metric_id {metric_id} has no events")
+            continue
+        results[i] = _resolve_loaded(
+            workspace_id,
+            metric_id,
+            events_by_id[latest.latest_event_id],
+            snapshots[latest.latest_event_id],
+            overlays_by_metric.get(metric_id, []),
+            context,
+            now=now,
+            generation=generations[metric_id],
+        )
+    return results  # type: ignore[return-value]
+
+
+# Resolutions of past instants never change (events are append-only, overlays immutable
+# and filtered by created_at), so they are cached without a TTL. Keyed by the resolved
+# version too: events written in one transaction (or one SQLite second) share a timestamp.
+_as_of_results = LRUCache("resolve_as_of", maxsize=env_int("ENGRAM_RESOLVE_AS_OF_CACHE_SIZE", 10_000))
+
+
+def as_of_cache_margin_seconds() -> float:
+    """
+    Only instants at least this old are cached: a write's timestamp is taken when its
+    transaction starts (now() on Postgres), so it can commit after a read of a later instant.
+    """
+    return env_float("ENGRAM_RESOLVE_AS_OF_CACHE_MARGIN_SECONDS", 300.0)
+
+
+def _overlays_as_of(
+    db: Session,
+    workspace_id: str,
+    metric_ids: list[str],
+    as_of: datetime,
+) -> dict[str, list[Union[Overlay, OverlayArchive]]]:
+    """
+    Overlays that existed at as_of, live or archived since (windows are checked later).
+    """
+    out: dict[str, list[Union[Overlay, OverlayArchive]]] = {}
+    for model in (Overlay, OverlayArchive):
+        for o in db.execute(
+            select(model)
+            .where(
+                model.workspace_id == workspace_id,
+                model.metric_id.in_(metric_ids),
+                model.created_at <= as_of,
+            )
+            .order_by(desc(model.priority), desc(model.created_at))
+        ).scalars():
+            out.setdefault(o.metric_id, []).append(o)
+    # Same order as list_overlays across live and archived rows (stable, so ties keep DB order).
+    for overlays in out.values():
+        overlays.sort(key=lambda o: (o.priority, o.created_at), reverse=True)
+    return out
+
+
+def _events_as_of(
+    db: Session,
+    workspace_id: str,
+    metric_ids: list[str],
+    as_of: datetime,
+) -> dict[str, SemanticEvent]:
+    """
+    Each metric's latest event at as_of: the newest version written at or before it.
+    """
+    newest = (
+        select(SemanticEvent.metric_id, func.max(SemanticEvent.version_id))
+        .where(
+            SemanticEvent.workspace_id == workspace_id,
+            SemanticEvent.metric_id.in_(metric_ids),
+            SemanticEvent.timestamp <= as_of,
+        )
+        .group_by(SemanticEvent.metric_id)
+    )
+    pairs = [tuple(row) for row in db.execute(newest)]
+    if not pairs:
+        return {}
+    events = db.execute(
+        select(SemanticEvent).where(
+            SemanticEvent.workspace_id == workspace_id,
+            tuple_(SemanticEvent.metric_id, SemanticEvent.version_id).in_(pairs),
+        )
+    ).scalars()
+    return {e.metric_id: e for e in events}
+
+
+def _resolve_as_of_loaded(
+    db: Session,
+    workspace_id: str,
+    items: list[tuple[str, dict]],
+    events: dict[str, SemanticEvent],
+    instant_of: dict[str, datetime],
+) -> list[Union[dict, KeyError]]:
+    results: list[Union[dict, KeyError, None]] = [None] * len(items)
+    pending: list[int] = []
+    for i, (metric_id, context) in enumerate(items):
+        event = events.get(metric_id)
+        if event is None:
+            results[i] = KeyError(f"metric_id {metric_id} has no events at that point")
+            continue
+        key = (workspace_id, metric_id, int(event.version_id), instant_of[metric_id], canonical_context(context))
+        cached = _as_of_results.get(key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+    if not pending:
+        return results  # type: ignore[return-value]
+
+    snapshots = load_snapshots(db, [events[items[i][0]] for i in pending])
+    overlays: dict[str, list] = {}
+    by_instant: dict[datetime, list[str]] = {}
+    for metric_id in {items[i][0] for i in pending}:
+        by_instant.setdefault(instant_of[metric_id], []).append(metric_id)
+    for instant, metric_ids in by_instant.items():
+        overlays.update(_overlays_as_of(db, workspace_id, metric_ids, instant))
+
+    settled = now_utc() - timedelta(seconds=as_of_cache_margin_seconds())
+    for i in pending:
+        metric_id, context = items[i]
+        event, instant = events[metric_id], instant_of[metric_id]
+        result = _resolve_loaded(
+            workspace_id,
+            metric_id,
+            event,
+            snapshots[event.event_id],
+            overlays.get(metric_id, []),
+            context,
+            now=instant,
+        )
+        result["provenance"] = {**result["provenance"], "as_of": instant.isoformat()}
+        if instant < settled:
+            key = (workspace_id, metric_id, int(event.version_id), instant, canonical_context(context))
+            _as_of_results.set(key, result)
+        results[i] = result
+    return results  # type: ignore[return-value]
+
+
+def resolve_metric_state_as_of(
+    db: Session,
+    workspace_id: str,
+    metric_id: str,
+    context: dict,
+    as_of: Optional[datetime] = None,
+    version_id: Optional[int] = None,
+) -> dict:
+    """
+    Point-in-time resolution: the version current at as_of (or version_id, resolved at the
+    instant it was written) with the overlays that existed and were valid at that instant.
+    """
+    if version_id is not None:
+        event = db.execute(
+            select(SemanticEvent).where(
+                SemanticEvent.workspace_id == workspace_id,
+                SemanticEvent.metric_id == metric_id,
+                SemanticEvent.version_id == version_id,
+            )
+        ).scalar_one_or_none()
+        if event is None:
+            raise KeyError(f"metric_id {metric_id} has no version {version_id}")
+        events, instant = {metric_id: event}, as_utc(event.timestamp)
+    else:
+        instant = as_utc(as_of or now_utc())
+        events = _events_as_of(db, workspace_id, [metric_id], instant)
+    out = _resolve_as_of_loaded(db, workspace_id, [(metric_id, context)], events, {metric_id: instant})[0]
+    if isinstance(out, KeyError):
+        raise out
+    return out
+
+
+def resolve_metric_states_as_of(
+    db: Session,
+    workspace_id: str,
+    items: list[tuple[str, dict]],
+    as_of: datetime,
+) -> list[Union[dict, KeyError]]:
+    """
+    Batch form of resolve_metric_state_as_of for many (metric_id, context) pairs at one
+    instant, with a fixed number of set-based queries. Same per-item contract as
+    resolve_metric_states.
+    """
+    instant = as_utc(as_of)
+    metric_ids = sorted({metric_id for metric_id, _ in items})
+    events = _events_as_of(db, workspace_id, metric_ids, instant)
+    return _resolve_as_of_loaded(db, workspace_id, items, events, {m: instant for m in metric_ids})
+
+
+def _resolve_loaded(
+    workspace_id: str,
+    metric_id: str,
+    event: SemanticEvent,
+    base_snapshot: dict,
+    overlays: list[Overlay],
+    context: dict,
+    now: Optional[datetime] = None,
+    generation: Optional[int] = None,
+) -> dict:
+    """
+    base_snapshot is the event's full snapshot (see app.core.snapshots).
+    The result goes to the in-process cache only with the metric_generation() captured before
+    the inputs were read (not for as_of or before the write transaction commits).
+    """
+
+    now = now or now_utc()
+    compiled = get_compiled_overlays(workspace_id, metric_id, overlays)
+    matching = compiled.select(overlays, context or {}, now=now)
 
     resolved = base_snapshot
-    applied_overlay_ids: list[str] = []
-    for o in matching:
-        resolved = apply_overlay_patch(resolved, o.overlay_patch)
-        applied_overlay_ids.append(str(o.overlay_id))
+    applied_overlay_ids = [str(o.overlay_id) for o in matching]
+    if matching:
+        # Filter identities come from hashes stored when the event/overlays were written.
+        known = snapshot_filter_keys(base_snapshot, event.filter_hashes)
+        composed, composed_known = get_composed_patch(workspace_id, metric_id, matching)
+        if composed is not None and not ops_create_keys(base_snapshot, composed):
+            known.update(composed_known)
+            resolved = apply_overlay_patch(resolved, composed, known)
+        else:
+            known.update(overlays_filter_keys(matching))
+            for o in matching:
+                resolved = apply_overlay_patch(resolved, o.overlay_patch, known)
 
-    return {
+    result = {
         "metric_id": metric_id,
         "base_version_id": int(event.version_id),
         "applied_overlays": applied_overlay_ids,
@@ -48,3 +401,19 @@ def resolve_metric_state(db: Session, workspace_id: str, metric_id: str, context
         },
     }
 
+    if generation is None:
+        return result
+
+    # The matching overlay set can change when any validity window opens or closes.
+    boundary = compiled.next_boundary(now)
+    store_resolution(
+        workspace_id,
+        metric_id,
+        int(event.version_id),
+        overlay_fingerprint(o.overlay_id for o in overlays),
+        context,
+        result,
+        generation,
+        ttl_seconds=(boundary - now).total_seconds() if boundary is not None else None,
+    )
+    return result
@@ -1,93 +1,79 @@
 from __future__ import annotations
 
-from typing import Optional
+import os
 
-from sqlalchemy import select
+from sqlalchemy import case, func, select, union_all
 from sqlalchemy.orm import Session
 
+from app.core.search_index import MATCH_FIELDS, get_search_index
 from app.db.models import Metric, MetricAlias
 
 
-def _rank_match(query: str, candidate: str) -> Optional[int]:
+def search_backend() -> str:
     """
-    Lower is better.
-    exact (0) > prefix (1) > substring (2) > no match (None)
+    "memory" (default): per-workspace in-memory index. "postgres": ranking pushed down to
+    Postgres (pg_trgm GIN indexes from migration 0009); other dialects keep the in-memory path.
     """
-    q = (query or "").lower()
-    c = (candidate or "").lower()
-    if not q:
-        return None
-    if q == c:
-        return 0
-    if c.startswith(q):
-        return 1
-    if q in c:
-        return 2
-    return None
-
-
-def search_metrics(db: Session, workspace_id: str, query: str, limit: int = 20) -> list[dict]:
-    # MVP: no vectors. rank metric_id, canonical_name, alias_name.
-    q = (query or "").strip()
-    if not q:
-        return []
-
-    metrics = list(
-        db.execute(select(Metric).where(Metric.workspace_id == workspace_id)).scalars()
-    )
-    aliases = list(
-        db.execute(select(MetricAlias).where(MetricAlias.workspace_id == workspace_id)).scalars()
-    )
-
-    alias_by_metric: dict[str, list[MetricAlias]] = {}
-    for a in aliases:
-        alias_by_metric.setdefault(a.metric_id, []).append(a)
+    return os.getenv("ENGRAM_SEARCH_BACKEND", "memory").strip().lower() or "memory"
 
-    scored: list[tuple[tuple[int, int, str], dict]] = []
-    for m in metrics:
-        ranks: list[tuple[int, str]] = []
-        r_id = _rank_match(q, m.metric_id)
-        if r_id is not None:
-            ranks.append((r_id, "metric_id"))
-        r_name = _rank_match(q, m.canonical_name)
-        if r_name is not None:
-            ranks.append((r_name, "canonical_name"))
 
-        best_alias_rank = None
-        best_alias = None
-        for a in alias_by_metric.get(m.metric_id, []):
-            r = _rank_match(q, a.alias_name)
-            if r is None:
-                continue
-            if best_alias_rank is None or r < best_alias_rank:
-                best_alias_rank = r
-                best_alias = a
-        if best_alias_rank is not None:
-            ranks.append((best_alias_rank, "alias_name"))
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
-        if not ranks:
-            continue
 
-        best_rank, best_field = sorted(ranks, key=lambda x: x[0])[0]
-
-        # exact id should beat exact alias/canonical; use a secondary weight:
-        field_weight = 0 if best_field == "metric_id" else 1
-        sort_key = (best_rank, field_weight, m.metric_id)
-
-        scored.append(
-            (
-                sort_key,
-                {
-                    "metric_id": m.metric_id,
-                    "canonical_name": m.canonical_name,
-                    "description": m.description,
-                    "match": {
-                        "field": best_field,
-                        "rank": best_rank,
-                    },
-                },
-            )
+def _search_sql(db: Session, workspace_id: str, query: str, limit: int) -> list[dict]:
+    """
+    Same ranking as the in-memory index, computed in SQL: each matching string scores
+    rank * 3 + field (field: 0 metric_id, 1 canonical_name, 2 alias_name), each metric keeps
+    its lowest score, and ordering/LIMIT happen in the database. The substring LIKE on
+    lower(column) is what the trigram indexes serve.
+    """
+    q = query.lower()
+    contains = f"%{_like_escape(q)}%"
+    prefix = f"{_like_escape(q)}%"
+
+    def scored(column, metric_column, field: int, model):
+        lowered = func.lower(column)
+        rank = case((lowered == q, 0), (lowered.like(prefix, escape="\\"), 1), else_=2)
+        return select(metric_column.label("metric_id"), (rank * 3 + field).label("score")).where(
+            model.workspace_id == workspace_id, lowered.like(contains, escape="\\")
         )
 
-    scored.sort(key=lambda x: x[0])
-    return [row for _, row in scored[:limit]]
+    hits = union_all(
+        scored(Metric.metric_id, Metric.metric_id, 0, Metric),
+        scored(Metric.canonical_name, Metric.metric_id, 1, Metric),
+        scored(MetricAlias.alias_name, MetricAlias.metric_id, 2, MetricAlias),
+    ).subquery()
+    best = select(hits.c.metric_id, func.min(hits.c.score).label("score")).group_by(hits.c.metric_id).subquery()
+    rows = db.execute(
+        select(Metric.metric_id, Metric.canonical_name, Metric.description, best.c.score)
+        .join(best, best.c.metric_id == Metric.metric_id)
+        .where(Metric.workspace_id == workspace_id)
+        # exact id should beat exact alias/canonical; use a secondary weight:
+        .order_by(best.c.score // 3, case((best.c.score % 3 == 0, 0), else_=1), Metric.metric_id)
+        .limit(limit)
+    )
+    return [
+        {
+            "metric_id": metric_id,
+            "canonical_name": canonical_name,
+            "description": description,
+            "match": {"field": MATCH_FIELDS[score % 3], "rank": score // 3},
+        }
+        for metric_id, canonical_name, description, score in rows
+    ]
+
+
+def search_metrics(db: Session, workspace_id: str, query: str, limit: int = 20, mode: str = "exact") -> list[dict]:
+    # MVP: no vectors. "exact": rank metric_id, canonical_name, alias_name as exact > prefix >
+    # substring, served from the workspace's in-memory index or pushed down to Postgres.
+    # "ranked": BM25 over tokens of id, name, description and aliases, tolerant of typos and
+    # unfinished last words (always in-memory).
+    q = (query or "").strip()
+    if not q:
+        return []
+    if mode == "ranked":
+        return get_search_index(db, workspace_id).ranked_search(q, limit=limit)
+    if search_backend() == "postgres" and db.get_bind().dialect.name == "postgresql":
+        return _search_sql(db, workspace_id, q, limit)
+    return get_search_index(db, workspace_id).search(q, limit=limit)
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import env_float, env_int
+from app.core.ranked_index import RankedIndex
+from app.db.models import Metric, MetricAlias
+from app.utils.cache import LRUCache
+
+
+MATCH_FIELDS = ("metric_id", "canonical_name", "alias_name")
+_GRAM = 3
+
+
+def _grams(s: str) -> set[str]:
+    return {s[i : i + _GRAM] for i in range(len(s) - _GRAM + 1)}
+
+
+@dataclass
+class _Entry:
+    text: str  # pre-lowercased
+    field: int  # index into MATCH_FIELDS
+    metric_id: str
+
+
+class SearchIndex:
+    """
+    In-memory search index for one workspace, equivalent to ranking every metric_id,
+    canonical_name and alias_name (case-insensitive) as exact (0) > prefix (1) > substring (2).
+
+    Strings are lowercased once. Exact and prefix matches come from a sorted array (bisect),
+    substring matches from a trigram index verified with `in`. Queries shorter than a
+    trigram scan the pre-lowercased strings. Updated in place by create_metric/upsert_alias.
+
+    Also maintains a RankedIndex (BM25 + typo tolerance) for ranked_search, and a trigram
+    index over each metric's "id name description" haystack for intent_candidates.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._entries: list[Optional[_Entry]] = []
+        self._sorted: list[tuple[str, int]] = []
+        self._postings: dict[str, set[int]] = {}
+        self._metrics: dict[str, tuple[str, Optional[str], str]] = {}
+        self._haystacks: dict[str, str] = {}
+        self._haystack_postings: dict[str, set[str]] = {}
+        self._alias_entries: dict[tuple[str, str], int] = {}
+        self._ranked = RankedIndex()
+
+    def _add(self, text: str, field: int, metric_id: str) -> int:
+        entry_id = len(self._entries)
+        lowered = text.lower()
+        self._entries.append(_Entry(lowered, field, metric_id))
+        insort(self._sorted, (lowered, entry_id))
+        for g in _grams(lowered):
+            self._postings.setdefault(g, set()).add(entry_id)
+        return entry_id
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries[entry_id]
+        if entry is None:
+            return
+        i = bisect_left(self._sorted, (entry.text, entry_id))
+        del self._sorted[i]
+        for g in _grams(entry.text):
+            self._postings[g].discard(entry_id)
+        self._entries[entry_id] = None
+
+    def add_metric(
+        self, metric_id: str, canonical_name: str, description: Optional[str], status: str = "active"
+    ) -> None:
+        with self._lock:
+            if metric_id in self._metrics:
+                return
+            self._metrics[metric_id] = (canonical_name, description, status)
+            haystack = " ".join([metric_id or "", canonical_name or "", description or ""]).lower()
+            self._haystacks[metric_id] = haystack
+            for g in _grams(haystack):
+                self._haystack_postings.setdefault(g, set()).add(metric_id)
+            self._add(metric_id, 0, metric_id)
+            self._add(canonical_name or "", 1, metric_id)
+            self._ranked.add_metric(metric_id, canonical_name, description)
+
+    def upsert_alias(self, source_system: str, source_locator: str, metric_id: str, alias_name: str) -> None:
+        with self._lock:
+            key = (source_system, source_locator)
+            if key in self._alias_entries:
+                self._remove(self._alias_entries[key])
+            self._alias_entries[key] = self._add(alias_name or "", 2, metric_id)
+            self._ranked.upsert_alias(key, metric_id, alias_name)
+
+    def _candidate_entries(self, q: str) -> set[int]:
+        if len(q) < _GRAM:
+            return {entry_id for _, entry_id in self._sorted}
+        postings = sorted((self._postings.get(g, set()) for g in _grams(q)), key=len)
+        return set(postings[0]).intersection(*postings[1:]) if postings else set()
+
+    def _matches(self, q: str) -> dict[int, int]:
+        """
+        entry_id -> rank (0 exact, 1 prefix, 2 substring) for every matching string.
+        """
+        hits: dict[int, int] = {}
+        i = bisect_left(self._sorted, (q,))
+        while i < len(self._sorted) and self._sorted[i][0].startswith(q):
+            text, entry_id = self._sorted[i]
+            hits[entry_id] = 0 if text == q else 1
+            i += 1
+
+        for entry_id in self._candidate_entries(q):
+            entry = self._entries[entry_id]
+            if entry_id not in hits and entry is not None and q in entry.text:
+                hits[entry_id] = 2
+        return hits
+
+    def search(self, query: str, limit: int = 20) -> list[dict]:
+        q = (query or "").lower()
+        if not q:
+            return []
+        with self._lock:
+            # Per metric, the best (rank, field); ties prefer metric_id, then canonical_name.
+            best: dict[str, tuple[int, int]] = {}
+            for entry_id, rank in self._matches(q).items():
+                entry = self._entries[entry_id]
+                assert entry is not None
+                candidate = (rank, entry.field)
+                if entry.metric_id not in best or candidate < best[entry.metric_id]:
+                    best[entry.metric_id] = candidate
+
+            # exact id should beat exact alias/canonical; use a secondary weight:
+            ordered = sorted(best.items(), key=lambda kv: (kv[1][0], 0 if kv[1][1] == 0 else 1, kv[0]))
+            out = []
+            for metric_id, (rank, field) in ordered[:limit]:
+                canonical_name, description, _ = self._metrics.get(metric_id, (None, None, None))
+                out.append(
+                    {
+                        "metric_id": metric_id,
+                        "canonical_name": canonical_name,
+                        "description": description,
+                        "match": {"field": MATCH_FIELDS[field], "rank": rank},
+                    }
+                )
+            return out
+
+    def ranked_search(self, query: str, limit: int = 20) -> list[dict]:
+        with self._lock:
+            out = []
+            for metric_id, score, terms in self._ranked.search(query, limit=limit):
+                canonical_name, description, _ = self._metrics.get(metric_id, (None, None, None))
+                out.append(
+                    {
+                        "metric_id": metric_id,
+                        "canonical_name": canonical_name,
+                        "description": description,
+                        "match": {"score": round(score, 4), "terms": terms},
+                    }
+                )
+            return out
+
+    def intent_candidates(self, query: str) -> list[tuple[str, str, Optional[str]]]:
+        """
+        (metric_id, canonical_name, description) of every active metric whose
+        "metric_id canonical_name description" or one of whose alias names contains the query
+        (case-insensitive), in metric_id order. Only trigram candidates are verified.
+        """
+        q = (query or "").lower()
+        if not q:
+            return []
+        with self._lock:
+            if len(q) >= _GRAM:
+                postings = sorted((self._haystack_postings.get(g, set()) for g in _grams(q)), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                candidates = set(self._haystacks)
+            found = {m for m in candidates if q in self._haystacks[m]}
+            for entry_id in self._candidate_entries(q):
+                entry = self._entries[entry_id]
+                if entry is not None and entry.field == 2 and q in entry.text:
+                    found.add(entry.metric_id)
+            return [
+                (metric_id, self._metrics[metric_id][0], self._metrics[metric_id][1])
+                for metric_id in sorted(found)
+                if self.is_active(metric_id)
+            ]
+
+    def metric(self, metric_id: str) -> Optional[tuple[str, Optional[str]]]:
+        """
+        (canonical_name, description), or None for an unknown metric.
+        """
+        metric = self._metrics.get(metric_id)
+        return None if metric is None else (metric[0], metric[1])
+
+    def is_active(self, metric_id: str) -> bool:
+        metric = self._metrics.get(metric_id)
+        return metric is not None and metric[2] == "active"
+
+
+_indexes = LRUCache(
+    "search_index",
+    maxsize=env_int("ENGRAM_SEARCH_INDEX_WORKSPACES", 1_000),
+    # Writes from other processes (other API workers, scripts) show up after the TTL.
+    ttl_seconds=env_float("ENGRAM_SEARCH_INDEX_TTL_SECONDS", 60.0),
+)
+
+
+def get_search_index(db: Session, workspace_id: str) -> SearchIndex:
+    index = _indexes.get(workspace_id)
+    if index is None:
+        # Writes committed during the build bump the generation; that index is then not
+        # cached, since index_metric / index_alias had nothing to update yet.
+        generation = _indexes.generation(workspace_id)
+        index = SearchIndex()
+        for m in db.execute(select(Metric).where(Metric.workspace_id == workspace_id)).scalars():
+            index.add_metric(m.metric_id, m.canonical_name, m.description, m.status or "active")
+        for a in db.execute(select(MetricAlias).where(MetricAlias.workspace_id == workspace_id)).scalars():
+            index.upsert_alias(a.source_system, a.source_locator, a.metric_id, a.alias_name)
+        _indexes.set(workspace_id, index, generation=generation)
+    return index
+
+
+def index_metric(workspace_id: str, metric: Metric) -> None:
+    _indexes.bump(workspace_id)
+    index = _indexes.get(workspace_id)
+    if index is not None:
+        index.add_metric(metric.metric_id, metric.canonical_name, metric.description, metric.status or "active")
+
+
+def index_alias(workspace_id: str, alias: MetricAlias) -> None:
+    _indexes.bump(workspace_id)
+    index = _indexes.get(workspace_id)
+    if index is not None:
+        index.upsert_alias(alias.source_system, alias.source_locator, alias.metric_id, alias.alias_name)
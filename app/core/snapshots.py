@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import uuid
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.config import env_int
+from app.db.models import SemanticEvent, SnapshotBlob
+from app.utils.cache import LRUCache
+from app.utils.hashing import canonical_json_hash
+from app.utils.json_patch import apply_snapshot_diff
+
+
+# snapshot_hash -> snapshot. Blobs are immutable, so entries never go stale.
+_blobs = LRUCache("snapshot_blobs", maxsize=env_int("ENGRAM_SNAPSHOT_BLOB_CACHE_SIZE", 10_000))
+
+
+def snapshot_delta_interval() -> int:
+    """
+    K for delta storage: every K-th version keeps a full snapshot, the ones in between only
+    their semantic_patch. 0 or 1 stores every snapshot in full (the default).
+    """
+    return env_int("ENGRAM_SNAPSHOT_DELTA_INTERVAL", 0)
+
+
+def stores_full_snapshot(version_id: int, interval: Optional[int] = None) -> bool:
+    interval = snapshot_delta_interval() if interval is None else interval
+    return interval <= 1 or (version_id - 1) % interval == 0
+
+
+def snapshot_hash(snapshot: dict[str, Any]) -> str:
+    """
+    Content address of a snapshot: sha256 of its canonical JSON (sorted keys, no whitespace).
+    """
+    return canonical_json_hash(snapshot)
+
+
+def store_snapshot_blobs(db: Session, snapshots: dict[str, dict[str, Any]]) -> None:
+    """
+    Inserts blobs that don't exist yet (INSERT ... ON CONFLICT DO NOTHING on Postgres and
+    SQLite). Does not commit.
+    """
+    if not snapshots:
+        return
+    rows = [{"snapshot_hash": h, "snapshot": s} for h, s in snapshots.items()]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        db.execute(dialect_insert(SnapshotBlob).values(rows).on_conflict_do_nothing())
+    else:
+        existing = set(
+            db.execute(select(SnapshotBlob.snapshot_hash).where(SnapshotBlob.snapshot_hash.in_(list(snapshots))))
+            .scalars()
+        )
+        db.add_all(SnapshotBlob(**r) for r in rows if r["snapshot_hash"] not in existing)
+        db.flush()
+    for h, s in snapshots.items():
+        _blobs.set(h, s)
+
+
+def fetch_snapshot_blobs(db: Session, hashes: Iterable[str]) -> dict[str, dict[str, Any]]:
+    """
+    Blobs by hash: each distinct hash is read once (one IN query for all cache misses).
+    """
+    out: dict[str, dict[str, Any]] = {}
+    missing: list[str] = []
+    for h in set(hashes):
+        cached = _blobs.get(h)
+        if cached is None:
+            missing.append(h)
+        else:
+            out[h] = cached
+    if missing:
+        for h, s in db.execute(
+            select(SnapshotBlob.snapshot_hash, SnapshotBlob.snapshot).where(SnapshotBlob.snapshot_hash.in_(missing))
+        ):
+            out[h] = s
+            _blobs.set(h, s)
+    return out
+
+
+def load_snapshots(db: Session, events: list[SemanticEvent]) -> dict[uuid.UUID, dict[str, Any]]:
+    """
+    Full snapshot per event_id. Delta rows are rebuilt by applying semantic_patch forward
+    from the nearest earlier full snapshot: at most K-1 patches, one range query per metric.
+    """
+    out: dict[uuid.UUID, dict[str, Any]] = {}
+    blobs = fetch_snapshot_blobs(db, (e.snapshot_hash for e in events if e.snapshot_hash is not None))
+    wanted: dict[tuple[str, str], dict[int, uuid.UUID]] = {}
+    for e in events:
+        if e.snapshot_hash is not None:
+            out[e.event_id] = blobs[e.snapshot_hash]
+        elif e.inline_snapshot is not None:
+            out[e.event_id] = e.inline_snapshot
+        else:
+            wanted.setdefault((e.workspace_id, e.metric_id), {})[int(e.version_id)] = e.event_id
+
+    for (workspace_id, metric_id), versions in wanted.items():
+        same_metric = (SemanticEvent.workspace_id == workspace_id, SemanticEvent.metric_id == metric_id)
+        checkpoint = db.execute(
+            select(func.max(SemanticEvent.version_id)).where(
+                *same_metric,
+                SemanticEvent.version_id <= min(versions),
+                or_(SemanticEvent.snapshot_hash.is_not(None), SemanticEvent.inline_snapshot.is_not(None)),
+            )
+        ).scalar_one_or_none()
+        if checkpoint is None:
+            raise LookupError(f"no full snapshot before version {min(versions)} of {metric_id}")
+        rows = list(
+            db.execute(
+                select(
+                    SemanticEvent.version_id,
+                    SemanticEvent.snapshot_hash,
+                    SemanticEvent.inline_snapshot,
+                    SemanticEvent.semantic_patch,
+                )
+                .where(*same_metric, SemanticEvent.version_id.between(checkpoint, max(versions)))
+                .order_by(SemanticEvent.version_id)
+            )
+        )
+        blobs = fetch_snapshot_blobs(db, (r.snapshot_hash for r in rows if r.snapshot_hash is not None))
+        current: dict[str, Any] = {}
+        for version_id, digest, snapshot, patch in rows:
+            if digest is not None:
+                current = blobs[digest]
+            elif snapshot is not None:
+                current = snapshot
+            else:
+                current = apply_snapshot_diff(current, patch or {})
+            if int(version_id) in versions:
+                out[versions[int(version_id)]] = current
+    return out
+
+
+def event_snapshot(db: Session, event: SemanticEvent) -> dict[str, Any]:
+    return load_snapshots(db, [event])[event.event_id]
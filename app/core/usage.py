@@ -3,9 +3,11 @@ from __future__ import annotations
 import uuid
 from typing import Optional
 
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from app.db.models import Correction, UsageEvent
+from app.utils.time import now_utc
 
 
 def log_usage(
@@ -51,6 +53,41 @@ def log_usage(
     return usage
 
 
+def log_usage_bulk(db: Session, records: list[dict]) -> int:
+    """
+    Writes many usage rows with one multi-row INSERT and a single commit.
+    Each record takes the same keyword arguments as log_usage (minus db).
+    """
+    if not records:
+        return 0
+    rows = [
+        {
+            "usage_id": uuid.uuid4(),
+            "timestamp": r.get("timestamp") or now_utc(),
+            "workspace_id": r["workspace_id"],
+            "query_text": r["query_text"],
+            "context": r.get("context") or {},
+            "team": r.get("team"),
+            "interface": r.get("interface"),
+            "user_id": r.get("user_id"),
+            "agent_id": r.get("agent_id"),
+            "surface": r.get("surface"),
+            "auth_type": r.get("auth_type"),
+            "input_hash": r.get("input_hash"),
+            "candidate_metrics": r.get("candidate_metrics") or [],
+            "resolved_metric_id": r.get("resolved_metric_id"),
+            "resolved_version_id": r.get("resolved_version_id"),
+            "confidence": r.get("confidence"),
+            "clarifications_count": r.get("clarifications_count") or 0,
+            "feedback": r.get("feedback"),
+        }
+        for r in records
+    ]
+    db.execute(insert(UsageEvent), rows)
+    db.commit()
+    return len(rows)
+
+
 def log_correction(
     db: Session,
     workspace_id: str,
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import env_bool, env_int
+from app.core.usage import log_usage, log_usage_bulk
+from app.utils.time import now_utc
+
+
+logger = logging.getLogger(__name__)
+
+
+class UsageWriter:
+    """
+    Background usage logger: a bounded in-process queue drained by one thread that writes
+    UsageEvent rows with multi-row INSERTs every flush_interval_ms or batch_size rows.
+
+    submit() never touches the DB. When the queue is full it waits up to enqueue_timeout_ms
+    (backpressure) and then drops the record, counting it. stop() drains what is queued.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_queue: int = 10_000,
+        batch_size: int = 500,
+        flush_interval_ms: int = 200,
+        enqueue_timeout_ms: int = 5,
+    ) -> None:
+        self._session_factory = session_factory
+        self._queue: queue.Queue[dict] = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.enqueue_timeout = enqueue_timeout_ms / 1000.0
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="usage-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Flushes everything still queued, then joins the writer thread. If the thread is still
+        writing after timeout it is kept (still running, and start() does not add a second one).
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(
+                "usage writer: shutdown timed out after %.1fs with %d rows queued", timeout, self._queue.qsize()
+            )
+            return
+        self._thread = None
+
+    def submit(self, record: dict) -> bool:
+        record.setdefault("timestamp", now_utc())
+        try:
+            if self.enqueue_timeout > 0 and not self._stopping.is_set():
+                self._queue.put(record, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "written": self.written,
+                "failed": self.failed,
+                "flushes": self.flushes,
+            }
+
+    def _collect(self) -> list[dict]:
+        batch: list[dict] = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                if self._stopping.is_set():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list[dict]) -> None:
+        db = self._session_factory()
+        try:
+            log_usage_bulk(db, batch)
+            with self._lock:
+                self.written += len(batch)
+                self.flushes += 1
+        except Exception:
+            logger.exception("usage writer: failed to write %d usage rows", len(batch))
+            db.rollback()
+            with self._lock:
+                self.failed += len(batch)
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            elif self._stopping.is_set():
+                return
+
+
+_writer: Optional[UsageWriter] = None
+
+
+def usage_writer_enabled() -> bool:
+    return env_bool("ENGRAM_USAGE_ASYNC")
+
+
+def start_usage_writer(session_factory: Callable[[], Session]) -> UsageWriter:
+    global _writer
+    if _writer is None:
+        _writer = UsageWriter(
+            session_factory,
+            max_queue=env_int("ENGRAM_USAGE_QUEUE_SIZE", 10_000),
+            batch_size=env_int("ENGRAM_USAGE_BATCH_SIZE", 500),
+            flush_interval_ms=env_int("ENGRAM_USAGE_FLUSH_MS", 200),
+            enqueue_timeout_ms=env_int("ENGRAM_USAGE_ENQUEUE_TIMEOUT_MS", 5),
+        )
+        _writer.start()
+    return _writer
+
+
+def stop_usage_writer() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+def usage_writer_stats() -> Optional[dict]:
+    return _writer.stats() if _writer is not None else None
+
+
+def submit_usage(db: Session, **record) -> None:
+    """
+    Audit logging for read paths: queued for the background writer when it is running,
+    otherwise written inline on the request's session (the previous behavior).
+    """
+    if _writer is not None:
+        _writer.submit(record)
+    else:
+        log_usage(db=db, **record)
+
+
+def submit_usage_many(db: Session, records: list[dict]) -> None:
+    if _writer is not None:
+        for r in records:
+            _writer.submit(r)
+    else:
+        log_usage_bulk(db, records)
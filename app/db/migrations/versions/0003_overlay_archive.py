@@ -0,0 +1,69 @@
+"""overlay archive
+
+Revision ID: 0003_overlay_archive
+Revises: 0002_auth_tenancy
+Create Date: 2026-10-17
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0003_overlay_archive"
+down_revision = "0002_auth_tenancy"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "overlays_archive",
+        sa.Column("workspace_id", sa.Text(), nullable=False),
+        sa.Column("overlay_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("metric_id", sa.Text(), nullable=False),
+        sa.Column(
+            "selector",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=False,
+        ),
+        sa.Column("priority", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "overlay_patch",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=False,
+        ),
+        sa.Column("valid_from", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("valid_to", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("author", sa.Text(), nullable=True),
+        sa.Column("reason", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column(
+            "archived_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("overlay_id"),
+    )
+    op.create_index(
+        "ix_overlays_archive_workspace_metric",
+        "overlays_archive",
+        ["workspace_id", "metric_id"],
+    )
+    # Lets the archive job find expired overlays without scanning the hot table.
+    op.create_index(
+        "ix_overlays_valid_to",
+        "overlays",
+        ["valid_to"],
+        postgresql_where=sa.text("valid_to IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_overlays_valid_to", table_name="overlays")
+    op.drop_index("ix_overlays_archive_workspace_metric", table_name="overlays_archive")
+    op.drop_table("overlays_archive")
@@ -0,0 +1,41 @@
+"""filter hashes
+
+Revision ID: 0004_filter_hashes
+Revises: 0003_overlay_archive
+Create Date: 2026-10-17
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0004_filter_hashes"
+down_revision = "0003_overlay_archive"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Nullable: rows written before this migration get their hashes computed at resolve time.
+    op.add_column(
+        "semantic_events",
+        sa.Column("filter_hashes", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+    op.add_column(
+        "overlays",
+        sa.Column("filter_hashes", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+    op.add_column(
+        "overlays_archive",
+        sa.Column("filter_hashes", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("overlays_archive", "filter_hashes")
+    op.drop_column("overlays", "filter_hashes")
+    op.drop_column("semantic_events", "filter_hashes")
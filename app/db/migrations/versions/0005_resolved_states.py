@@ -0,0 +1,49 @@
+"""resolved states
+
+Revision ID: 0005_resolved_states
+Revises: 0004_filter_hashes
+Create Date: 2026-10-17
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0005_resolved_states"
+down_revision = "0004_filter_hashes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "resolved_states",
+        sa.Column("workspace_id", sa.Text(), nullable=False),
+        sa.Column("metric_id", sa.Text(), nullable=False),
+        sa.Column("selector_combination", sa.Text(), nullable=False),
+        sa.Column("vocabulary_hash", sa.Text(), nullable=False),
+        sa.Column("base_version_id", sa.BigInteger(), nullable=False),
+        sa.Column("applied_overlays", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("resolved_snapshot", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("provenance", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("valid_until", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("workspace_id", "metric_id", "selector_combination"),
+        sa.ForeignKeyConstraint(
+            ["workspace_id", "metric_id"],
+            ["metrics.workspace_id", "metrics.metric_id"],
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("resolved_states")
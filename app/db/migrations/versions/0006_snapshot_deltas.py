@@ -0,0 +1,39 @@
+"""snapshot deltas
+
+Revision ID: 0006_snapshot_deltas
+Revises: 0005_resolved_states
+Create Date: 2026-10-17
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0006_snapshot_deltas"
+down_revision = "0005_resolved_states"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Delta rows store only semantic_patch.
+    op.alter_column(
+        "semantic_events",
+        "snapshot",
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        nullable=True,
+    )
+
+
+def downgrade() -> None:
+    # Only valid once every delta row has been rewritten with its full snapshot.
+    op.alter_column(
+        "semantic_events",
+        "snapshot",
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        nullable=False,
+    )
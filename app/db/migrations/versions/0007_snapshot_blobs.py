@@ -0,0 +1,50 @@
+"""snapshot blobs
+
+Revision ID: 0007_snapshot_blobs
+Revises: 0006_snapshot_deltas
+Create Date: 2026-10-17
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0007_snapshot_blobs"
+down_revision = "0006_snapshot_deltas"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "snapshot_blobs",
+        sa.Column("snapshot_hash", sa.Text(), nullable=False),
+        sa.Column("snapshot", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("snapshot_hash"),
+    )
+    # Existing rows keep their inline snapshot; new rows reference a blob.
+    op.add_column("semantic_events", sa.Column("snapshot_hash", sa.Text(), nullable=True))
+    op.create_foreign_key(
+        "fk_semantic_events_snapshot_hash",
+        "semantic_events",
+        "snapshot_blobs",
+        ["snapshot_hash"],
+        ["snapshot_hash"],
+    )
+
+
+def downgrade() -> None:
+    # Loses the snapshots of events written since the upgrade; inline them first.
+    op.drop_constraint("fk_semantic_events_snapshot_hash", "semantic_events", type_="foreignkey")
+    op.drop_column("semantic_events", "snapshot_hash")
+    op.drop_table("snapshot_blobs")
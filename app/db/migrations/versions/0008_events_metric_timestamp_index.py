@@ -0,0 +1,33 @@
+"""semantic events metric/timestamp index
+
+Revision ID: 0008_events_metric_timestamp
+Revises: 0007_snapshot_blobs
+Create Date: 2026-10-17
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "0008_events_metric_timestamp"
+down_revision = "0007_snapshot_blobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # as_of resolution seeks the newest version at or before an instant per metric;
+    # ix_semantic_events_workspace_timestamp_desc has no metric_id column.
+    op.create_index(
+        "ix_semantic_events_workspace_metric_timestamp",
+        "semantic_events",
+        ["workspace_id", "metric_id", "timestamp"],
+        unique=False,
+        postgresql_using="btree",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_semantic_events_workspace_metric_timestamp", table_name="semantic_events")
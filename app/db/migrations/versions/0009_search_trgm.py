@@ -0,0 +1,36 @@
+"""search trigram indexes
+
+Revision ID: 0009_search_trgm
+Revises: 0008_events_metric_timestamp
+Create Date: 2026-10-17
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "0009_search_trgm"
+down_revision = "0008_events_metric_timestamp"
+branch_labels = None
+depends_on = None
+
+
+_INDEXES = (
+    ("ix_metrics_metric_id_trgm", "metrics", "metric_id"),
+    ("ix_metrics_canonical_name_trgm", "metrics", "canonical_name"),
+    ("ix_metric_aliases_alias_name_trgm", "metric_aliases", "alias_name"),
+)
+
+
+def upgrade() -> None:
+    # Serves lower(column) LIKE '%q%' for ENGRAM_SEARCH_BACKEND=postgres.
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in _INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (lower({column}) gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    for name, _, _ in _INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -19,13 +19,13 @@ from sqlalchemy import (
     text,
 )
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.types import JSON
 
 
-def json_column():
+def json_column(none_as_null: bool = False):
     # Portable JSON type (JSONB on Postgres).
-    return JSON().with_variant(JSONB, "postgresql")
+    return JSON(none_as_null=none_as_null).with_variant(JSONB(none_as_null=none_as_null), "postgresql")
 
 
 class Base(DeclarativeBase):
@@ -128,13 +128,23 @@ class SemanticEvent(Base):
     semantic_patch: Mapped[dict] = mapped_column(
         json_column(), nullable=False, server_default=text("'{}'")
     )
-    snapshot: Mapped[dict] = mapped_column(json_column(), nullable=False)
+    # Inline snapshot; only rows written before snapshot_blobs existed carry one.
+    inline_snapshot: Mapped[Optional[dict]] = mapped_column(
+        "snapshot", json_column(none_as_null=True), nullable=True
+    )
+    # Reference into snapshot_blobs. Rows with neither are delta rows (see app.core.snapshots):
+    # rebuilt from the last full snapshot by applying semantic_patch forward.
+    snapshot_hash: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    blob: Mapped[Optional["SnapshotBlob"]] = relationship(viewonly=True)
+    # filter_hash of each snapshot.definition.logic.filters entry, computed on write.
+    filter_hashes: Mapped[Optional[list]] = mapped_column(json_column(), nullable=True)
 
     __table_args__ = (
         ForeignKeyConstraint(
             ["workspace_id", "metric_id"],
             ["metrics.workspace_id", "metrics.metric_id"],
         ),
+        ForeignKeyConstraint(["snapshot_hash"], ["snapshot_blobs.snapshot_hash"]),
         UniqueConstraint("workspace_id", "metric_id", "version_id"),
         Index(
             "ix_semantic_events_workspace_metric_version_desc",
@@ -149,6 +159,39 @@ class SemanticEvent(Base):
             "timestamp",
             postgresql_using="btree",
         ),
+        # Point-in-time (as_of) seeks within one metric.
+        Index(
+            "ix_semantic_events_workspace_metric_timestamp",
+            "workspace_id",
+            "metric_id",
+            "timestamp",
+            postgresql_using="btree",
+        ),
+    )
+
+    @property
+    def snapshot(self) -> Optional[dict]:
+        """
+        The stored full snapshot (lazy-loads the blob). None for delta rows; use
+        app.core.snapshots.load_snapshots to rebuild those and to load many events at once.
+        """
+        if self.snapshot_hash is not None:
+            return self.blob.snapshot if self.blob is not None else None
+        return self.inline_snapshot
+
+
+class SnapshotBlob(Base):
+    """
+    Content-addressed snapshot storage, shared by every event (in any workspace) whose
+    snapshot has the same canonical JSON.
+    """
+
+    __tablename__ = "snapshot_blobs"
+
+    snapshot_hash: Mapped[str] = mapped_column(Text, primary_key=True)
+    snapshot: Mapped[dict] = mapped_column(json_column(), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
     )
 
 
@@ -183,6 +226,8 @@ class Overlay(Base):
     selector: Mapped[dict] = mapped_column(json_column(), nullable=False)
     priority: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
     overlay_patch: Mapped[dict] = mapped_column(json_column(), nullable=False)
+    # filter_hash of each filter in overlay_patch, keyed by op, computed on write.
+    filter_hashes: Mapped[Optional[dict]] = mapped_column(json_column(), nullable=True)
     valid_from: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
     valid_to: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
     author: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
@@ -204,6 +249,72 @@ class Overlay(Base):
             "priority",
             "created_at",
         ),
+        Index(
+            "ix_overlays_valid_to",
+            "valid_to",
+            postgresql_where=text("valid_to IS NOT NULL"),
+        ),
+    )
+
+
+class OverlayArchive(Base):
+    """
+    Overlays whose validity window has closed, moved out of the hot `overlays` table.
+    """
+
+    __tablename__ = "overlays_archive"
+
+    workspace_id: Mapped[str] = mapped_column(Text, nullable=False)
+    overlay_id: Mapped[uuid.UUID] = mapped_column(Uuid(as_uuid=True), primary_key=True)
+    metric_id: Mapped[str] = mapped_column(Text, nullable=False)
+    selector: Mapped[dict] = mapped_column(json_column(), nullable=False)
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    overlay_patch: Mapped[dict] = mapped_column(json_column(), nullable=False)
+    filter_hashes: Mapped[Optional[dict]] = mapped_column(json_column(), nullable=True)
+    valid_from: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    valid_to: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    author: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    reason: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    __table_args__ = (
+        Index("ix_overlays_archive_workspace_metric", "workspace_id", "metric_id"),
+    )
+
+
+class ResolvedState(Base):
+    """
+    Optional materialized resolve results, refreshed when events/overlays are written.
+
+    selector_combination is the context projected onto the (key, value) pairs the metric's
+    overlay selectors test, so every context with the same projection shares one row.
+    """
+
+    __tablename__ = "resolved_states"
+
+    workspace_id: Mapped[str] = mapped_column(Text, nullable=False)
+    metric_id: Mapped[str] = mapped_column(Text, nullable=False)
+    selector_combination: Mapped[str] = mapped_column(Text, nullable=False)
+    vocabulary_hash: Mapped[str] = mapped_column(Text, nullable=False)
+    base_version_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    applied_overlays: Mapped[list] = mapped_column(json_column(), nullable=False)
+    resolved_snapshot: Mapped[dict] = mapped_column(json_column(), nullable=False)
+    provenance: Mapped[dict] = mapped_column(json_column(), nullable=False)
+    # Next overlay validity boundary; the row must not be served after it.
+    valid_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    __table_args__ = (
+        PrimaryKeyConstraint("workspace_id", "metric_id", "selector_combination"),
+        ForeignKeyConstraint(
+            ["workspace_id", "metric_id"],
+            ["metrics.workspace_id", "metrics.metric_id"],
+        ),
     )
 
 
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from app.config import env_bool, env_float, env_int
+
+
+# Upper bounds (ms) of the checkout wait histogram; the last bucket is open-ended.
+_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """
+    Time spent in Pool.connect(): waiting for a free connection, plus opening a new one or
+    pre-pinging a pooled one. Also counts checkouts that hit pool_timeout.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.buckets = [0] * (len(_BUCKETS_MS) + 1)
+
+    def observe(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.buckets[bisect_left(_BUCKETS_MS, seconds * 1000.0)] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            labels = [f"<={b}ms" for b in _BUCKETS_MS] + [f">{_BUCKETS_MS[-1]}ms"]
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000.0, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000.0, 3),
+                "wait_histogram": dict(zip(labels, self.buckets)),
+            }
+
+
+# One instance for the process: checkouts from the sync and the async engine are counted together.
+metrics = PoolMetrics()
+
+
+class _TimedConnect:
+    def connect(self):  # type: ignore[override]
+        t0 = time.perf_counter()
+        try:
+            conn = super().connect()  # type: ignore[misc]
+        except exc.TimeoutError:
+            metrics.observe(time.perf_counter() - t0, timed_out=True)
+            raise
+        metrics.observe(time.perf_counter() - t0)
+        return conn
+
+
+class TimedQueuePool(_TimedConnect, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedConnect, AsyncAdaptedQueuePool):
+    pass
+
+
+class TimedNullPool(_TimedConnect, NullPool):
+    pass
+
+
+def _in_memory_sqlite(url: str) -> bool:
+    u = make_url(url)
+    return u.get_backend_name() == "sqlite" and u.database in (None, "", ":memory:")
+
+
+def engine_options(url: str, *, is_async: bool = False) -> dict[str, Any]:
+    """
+    create_engine / create_async_engine keyword arguments from the DB_POOL_* settings.
+
+    DB_DISABLE_SQLALCHEMY_POOL=1 keeps no client-side pool (each checkout opens a
+    connection; for session-mode poolers). Server-side prepared statements are off unless
+    DB_STATEMENT_CACHE=1, since PgBouncer in transaction mode cannot route them.
+    """
+    options: dict[str, Any] = {"pool_pre_ping": env_bool("DB_POOL_PRE_PING", True)}
+    if env_bool("DB_DISABLE_SQLALCHEMY_POOL"):
+        options["poolclass"] = TimedNullPool
+    elif not _in_memory_sqlite(url):
+        options.update(
+            poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+            pool_size=env_int("DB_POOL_SIZE", 5),
+            max_overflow=env_int("DB_MAX_OVERFLOW", 10),
+            pool_timeout=env_float("DB_POOL_TIMEOUT", 30.0),
+            # Below common server/pooler idle timeouts, so stale connections are replaced.
+            pool_recycle=env_int("DB_POOL_RECYCLE", 1800),
+            # LIFO reuses the most recent connections and lets surplus ones idle out.
+            pool_use_lifo=env_bool("DB_POOL_USE_LIFO", True),
+        )
+
+    if not env_bool("DB_STATEMENT_CACHE"):
+        driver = make_url(url).get_driver_name()
+        if driver == "asyncpg":
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+        elif driver == "psycopg":
+            options["connect_args"] = {"prepare_threshold": None}
+    return options
+
+
+def pool_status(engine: Engine) -> dict:
+    pool = engine.pool
+    out: dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        out.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            idle=pool.checkedin(),
+            timeout_seconds=pool.timeout(),
+        )
+    return out
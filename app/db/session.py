@@ -1,22 +1,26 @@
 from __future__ import annotations
 
 import os
-from typing import Generator
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Generator, Optional, TypeVar, Union
 
+from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy.pool import NullPool
+from starlette.concurrency import run_in_threadpool
 
-from app.config import get_database_url
+from app.config import env_bool, get_database_url
+from app.db.pool import engine_options, metrics as pool_metrics, pool_status
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
 DATABASE_URL = get_database_url()
 
-_disable_pool = os.getenv("DB_DISABLE_SQLALCHEMY_POOL", "").strip().lower() in {"1", "true", "yes"}
-# Supabase Poolers (PgBouncer) often work best with client-side pooling disabled.
-if _disable_pool:
-    engine = create_engine(DATABASE_URL, future=True, poolclass=NullPool)
-else:
-    engine = create_engine(DATABASE_URL, future=True)
+# Pool size, overflow, timeout, recycle, pre-ping and LIFO come from DB_POOL_* (see app.db.pool).
+# Supabase Poolers (PgBouncer) often work best with client-side pooling disabled:
+# DB_DISABLE_SQLALCHEMY_POOL=1.
+engine = create_engine(DATABASE_URL, future=True, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
 
 
@@ -27,3 +31,84 @@ def get_db() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+
+# Optional async path (ENGRAM_ASYNC_DB=1): an AsyncEngine on asyncpg / aiosqlite, created on
+# first use so the sync-only deployment needs neither driver nor greenlet.
+T = TypeVar("T")
+_async_engine: Optional["AsyncEngine"] = None
+_async_sessionmaker: Optional[Callable[[], "AsyncSession"]] = None
+
+
+def async_db_enabled() -> bool:
+    return env_bool("ENGRAM_ASYNC_DB")
+
+
+def async_database_url(url: str) -> str:
+    """
+    The async driver URL for DATABASE_URL (ASYNC_DATABASE_URL overrides): psycopg2 ->
+    asyncpg (sslmode becomes asyncpg's ssl), pysqlite -> aiosqlite.
+    """
+    override = os.getenv("ASYNC_DATABASE_URL", "").strip()
+    if override:
+        return override
+    u = make_url(url)
+    if u.get_backend_name() == "postgresql":
+        query = dict(u.query)
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        u = u.set(drivername="postgresql+asyncpg", query=query)
+    elif u.get_backend_name() == "sqlite":
+        u = u.set(drivername="sqlite+aiosqlite")
+    return u.render_as_string(hide_password=False)
+
+
+def get_async_sessionmaker() -> Callable[[], "AsyncSession"]:
+    global _async_engine, _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        url = async_database_url(DATABASE_URL)
+        _async_engine = create_async_engine(url, **engine_options(url, is_async=True))
+        _async_sessionmaker = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+
+def db_pool_stats() -> dict:
+    """
+    Checkout wait metrics plus the current state of each engine's pool.
+    """
+    out = {"checkout": pool_metrics.stats(), "sync": pool_status(engine)}
+    if _async_engine is not None:
+        out["async"] = pool_status(_async_engine.sync_engine)
+    return out
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_sessionmaker = None
+
+
+async def get_route_db(db: Session = Depends(get_db)) -> AsyncIterator[Union[Session, "AsyncSession"]]:
+    """
+    Session for async def routes: an AsyncSession when ENGRAM_ASYNC_DB=1, otherwise the
+    regular sync session (pair with run_db, which moves sync work off the event loop).
+    """
+    if not async_db_enabled():
+        yield db
+        return
+    async with get_async_sessionmaker()() as adb:
+        yield adb
+
+
+async def run_db(db: Union[Session, "AsyncSession"], fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs a sync core function fn(session, *args, **kwargs) without blocking the event loop:
+    through AsyncSession.run_sync (non-blocking driver IO) or, for a sync Session, on the
+    threadpool like a sync def route.
+    """
+    if isinstance(db, Session):
+        return await run_in_threadpool(fn, db, *args, **kwargs)
+    return await db.run_sync(fn, *args, **kwargs)
@@ -1,23 +1,45 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from app.api.routes.auth import router as auth_router
+from app.api.routes.events import bulk_router as events_bulk_router
 from app.api.routes.events import router as events_router
 from app.api.routes.health import router as health_router
 from app.api.routes.metrics import router as metrics_router
 from app.api.routes.overlays import router as overlays_router
+from app.api.routes.resolve import batch_router as resolve_batch_router
 from app.api.routes.resolve import router as resolve_router
 from app.api.routes.search import router as search_router
 from app.api.routes.usage import router as usage_router
+from app.core.key_usage import start_key_usage_flusher, stop_key_usage_flusher
+from app.core.usage_writer import start_usage_writer, stop_usage_writer, usage_writer_enabled
+from app.db.session import SessionLocal, dispose_async_engine
+
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    if usage_writer_enabled():
+        start_usage_writer(SessionLocal)
+    start_key_usage_flusher(SessionLocal)
+    try:
+        yield
+    finally:
+        # Drain queued usage rows and pending key last_used_at values before the process exits.
+        stop_usage_writer()
+        stop_key_usage_flusher()
+        await dispose_async_engine()
 
-app = FastAPI(title="Engram Semantic Memory Core", version="0.1.0")
+
+app = FastAPI(title="Engram Semantic Memory Core", version="0.1.0", lifespan=lifespan)
 
 app.include_router(health_router)
 app.include_router(auth_router)
 app.include_router(metrics_router)
 app.include_router(events_router)
+app.include_router(events_bulk_router)
 app.include_router(overlays_router)
 app.include_router(resolve_router)
+app.include_router(resolve_batch_router)
 app.include_router(search_router)
 app.include_router(usage_router)
-
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class EventCreate(BaseModel):
@@ -28,3 +28,15 @@ class EventOut(BaseModel):
     semantic_patch: dict
     snapshot: dict
 
+
+class EventBulkItem(EventCreate):
+    metric_id: str
+
+
+class EventBulkRequest(BaseModel):
+    events: list[EventBulkItem] = Field(min_length=1, max_length=5000)
+
+
+class EventBulkResponse(BaseModel):
+    events: list[EventOut]
+    skipped: list[int] = Field(default_factory=list)  # request indices of unchanged snapshots
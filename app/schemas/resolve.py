@@ -1,10 +1,16 @@
 from __future__ import annotations
 
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 
 class ResolveRequest(BaseModel):
     context: dict
+    # Point-in-time resolution; at most one of the two.
+    as_of: Optional[datetime] = None
+    as_of_version: Optional[int] = Field(default=None, ge=1)
 
 
 class ResolveResponse(BaseModel):
@@ -14,3 +20,23 @@ class ResolveResponse(BaseModel):
     resolved_snapshot: dict
     provenance: dict
 
+
+class ResolveBatchItem(BaseModel):
+    metric_id: str
+    context: dict = Field(default_factory=dict)
+
+
+class ResolveBatchRequest(BaseModel):
+    items: list[ResolveBatchItem] = Field(min_length=1, max_length=1000)
+    as_of: Optional[datetime] = None
+
+
+class ResolveBatchResult(BaseModel):
+    metric_id: str
+    status: str  # ok|error
+    result: Optional[ResolveResponse] = None
+    error: Optional[str] = None
+
+
+class ResolveBatchResponse(BaseModel):
+    results: list[ResolveBatchResult]
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+_MISSING = object()
+
+_REGISTRY: dict[str, "LRUCache"] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+# Shared by every cache so a generation value is never reused.
+_generation_counter = itertools.count(1)
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU cache with per-entry TTL and hit/miss/eviction counters.
+
+    Values are returned as stored (no copy), so callers must treat them as read-only.
+    A cache with maxsize <= 0 is disabled: every lookup is a miss and nothing is stored.
+
+    Read-then-fill callers take generation(key) before reading the source and pass it to
+    set(); delete(), bump() and invalidate() change it, so a value read before a write is
+    not stored after that write's invalidation.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.maxsize = int(maxsize)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._data: OrderedDict[Hashable, tuple[Any, Optional[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Generations of recently bumped keys; older ones are pruned into _generation_floor,
+        # which every other key reports, so a pruned key never goes back to a captured value.
+        self._generations: OrderedDict[Hashable, int] = OrderedDict()
+        self._generation_floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_skips = 0
+        with _REGISTRY_LOCK:
+            _REGISTRY[name] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = item  # type: ignore[misc]
+            if expires_at is not None and self._clock() >= expires_at:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, key: Hashable) -> int:
+        with self._lock:
+            return self._generations.get(key, self._generation_floor)
+
+    def _bump_locked(self, key: Hashable) -> None:
+        self._generations[key] = next(_generation_counter)
+        self._generations.move_to_end(key)
+        while len(self._generations) > max(self.maxsize, 1024):
+            _, g = self._generations.popitem(last=False)
+            self._generation_floor = max(self._generation_floor, g)
+
+    def bump(self, key: Hashable) -> None:
+        """
+        Marks key as changed at the source, for entries that are updated in place.
+        """
+        with self._lock:
+            self._bump_locked(key)
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl_seconds: Optional[float] = None,
+        generation: Optional[int] = None,
+    ) -> None:
+        """
+        Stores value. ttl_seconds may only shorten the cache-wide TTL (e.g. to stop at a
+        validity boundary); a non-positive ttl means the value is already stale and is skipped.
+        With generation (from generation(key) before the source was read), the value is
+        skipped if key was invalidated since.
+        """
+        if not self.enabled:
+            return
+        ttl = self.ttl_seconds
+        if ttl_seconds is not None:
+            ttl = ttl_seconds if ttl is None else min(ttl, ttl_seconds)
+        if ttl is not None and ttl <= 0:
+            return
+        expires_at = self._clock() + ttl if ttl is not None else None
+        with self._lock:
+            if generation is not None and self._generations.get(key, self._generation_floor) != generation:
+                self.stale_skips += 1
+                return
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        with self._lock:
+            self._bump_locked(key)
+            if self._data.pop(key, _MISSING) is _MISSING:
+                return False
+            self.invalidations += 1
+            return True
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Drops every entry whose key satisfies predicate. O(len(cache)); meant for the write path.
+        Every read in flight is treated as stale (its key may not be cached yet).
+        """
+        with self._lock:
+            self._generations.clear()
+            self._generation_floor = next(_generation_counter)
+            doomed = [k for k in self._data if predicate(k)]
+            for k in doomed:
+                del self._data[k]
+            self.invalidations += len(doomed)
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_skips": self.stale_skips,
+            }
+
+
+def cache_stats() -> dict[str, dict]:
+    with _REGISTRY_LOCK:
+        caches = list(_REGISTRY.values())
+    return {c.name: c.stats() for c in caches}
+
+
+def clear_caches() -> None:
+    with _REGISTRY_LOCK:
+        caches = list(_REGISTRY.values())
+    for c in caches:
+        c.clear()
@@ -3,9 +3,11 @@ from __future__ import annotations
 import base64
 import hashlib
 import hmac
+import json
 import os
 import secrets
 from dataclasses import dataclass
+from typing import Any
 
 
 def _hash_secret() -> bytes:
@@ -27,6 +29,28 @@ def sha256_hex(value: str) -> str:
     return hashlib.sha256((value or "").encode("utf-8")).hexdigest()
 
 
+def canonical_json(value: Any) -> str:
+    """
+    Stable JSON text of value: sorted keys, no whitespace, non-JSON types via str().
+    """
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def canonical_json_hash(value: Any) -> str:
+    """
+    Structural identity of a JSON value: equal values hash equally regardless of key order.
+    """
+    return sha256_hex(canonical_json(value))
+
+
+def is_hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
 def random_b64url(nbytes: int = 32) -> str:
     return base64.urlsafe_b64encode(secrets.token_bytes(nbytes)).decode("utf-8").rstrip("=")
 
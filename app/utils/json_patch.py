@@ -1,79 +1,357 @@
 from __future__ import annotations
 
-import copy
-from typing import Any
+from typing import Any, Callable, Hashable, Optional
 
+from app.utils.hashing import canonical_json_hash
 
-def _deep_merge(dst: dict[str, Any], src: dict[str, Any]) -> dict[str, Any]:
+
+_OP_KEYS = frozenset({"dimensions_add", "dimensions_remove", "filters_add", "filters_remove"})
+
+# id(filter) -> (filter, filter_hash). Holding the filter keeps the id from being reused.
+FilterKeys = dict[int, tuple[Any, str]]
+
+
+def _owned_child(parent: dict[str, Any], key: str, owned: set[int]) -> Any:
+    """
+    Returns parent[key] as a dict that is safe to mutate, shallow-copying it on first write.
+    `owned` holds ids of containers created during this application.
+    """
+    child = parent.setdefault(key, {})
+    if isinstance(child, dict) and id(child) not in owned:
+        child = dict(child)
+        parent[key] = child
+        owned.add(id(child))
+    return child
+
+
+def _deep_merge(dst: dict[str, Any], src: dict[str, Any], owned: set[int]) -> dict[str, Any]:
     """
     Deep-merge objects. Arrays are replaced (not merged).
     Scalars are replaced.
+
+    dst must be owned; nested objects are copied only along the paths src touches.
     """
     for k, v in src.items():
         if isinstance(v, dict) and isinstance(dst.get(k), dict):
-            dst[k] = _deep_merge(dst[k], v)  # type: ignore[arg-type]
-        elif isinstance(v, list):
-            dst[k] = copy.deepcopy(v)
+            _deep_merge(_owned_child(dst, k, owned), v, owned)
         else:
-            dst[k] = copy.deepcopy(v)
+            dst[k] = v
     return dst
 
 
-def apply_overlay_patch(snapshot: dict[str, Any], overlay_patch: dict[str, Any]) -> dict[str, Any]:
+def filter_hash(f: Any) -> str:
+    """
+    Structural identity of a filter object: equal filters hash equally regardless of key order.
+    """
+    return canonical_json_hash(f)
+
+
+def filter_keys(filters: Optional[list], hashes: Optional[list] = None) -> FilterKeys:
+    """
+    Maps filter objects to their stored hashes (computed at write time); hashes that are
+    missing or don't line up with filters are recomputed.
+    """
+    filters = list(filters or [])
+    if hashes is None or len(hashes) != len(filters):
+        hashes = [filter_hash(f) for f in filters]
+    return {id(f): (f, h) for f, h in zip(filters, hashes)}
+
+
+def _logic_filters(doc: dict[str, Any]) -> Optional[list]:
+    definition = doc.get("definition")
+    logic = definition.get("logic") if isinstance(definition, dict) else None
+    filters = logic.get("filters") if isinstance(logic, dict) else None
+    return filters if isinstance(filters, list) else None
+
+
+def snapshot_filter_hashes(snapshot: dict[str, Any]) -> list[str]:
+    """
+    Hashes of definition.logic.filters, stored alongside the event when it is written.
+    """
+    return [filter_hash(f) for f in _logic_filters(snapshot) or []]
+
+
+def overlay_filter_hashes(overlay_patch: dict[str, Any]) -> dict[str, list[str]]:
+    """
+    Hashes of every filter list an overlay patch carries, stored alongside the overlay.
+    """
+    out = {
+        op: [filter_hash(f) for f in overlay_patch.get(op) or []]
+        for op in ("filters_add", "filters_remove")
+        if overlay_patch.get(op) is not None
+    }
+    replaced = _logic_filters(overlay_patch)
+    if replaced is not None:
+        out["filters"] = [filter_hash(f) for f in replaced]
+    return out
+
+
+def snapshot_filter_keys(snapshot: dict[str, Any], stored: Optional[list]) -> FilterKeys:
+    return filter_keys(_logic_filters(snapshot), stored)
+
+
+def overlay_filter_keys(overlay_patch: dict[str, Any], stored: Optional[dict]) -> FilterKeys:
+    stored = stored or {}
+    known: FilterKeys = {}
+    for op in ("filters_add", "filters_remove"):
+        known.update(filter_keys(overlay_patch.get(op), stored.get(op)))
+    known.update(filter_keys(_logic_filters(overlay_patch), stored.get("filters")))
+    return known
+
+
+def _filter_key(f: Any, known: Optional[FilterKeys] = None) -> str:
+    entry = known.get(id(f)) if known else None
+    if entry is not None and entry[0] is f:
+        return entry[1]
+    return filter_hash(f)
+
+
+def _apply_dims_ops(dims_value: Any, dims_add: Optional[list], dims_remove: Optional[list]) -> list:
+    dims = list(dims_value or [])
+    if dims_remove:
+        dims = [d for d in dims if d not in set(dims_remove)]
+    if dims_add:
+        for d in dims_add:
+            if d not in dims:
+                dims.append(d)
+    return dims
+
+
+def _apply_filter_ops(
+    filters_value: Any,
+    filters_add: Optional[list],
+    filters_remove: Optional[list],
+    known: Optional[FilterKeys] = None,
+) -> list:
+    filters = list(filters_value or [])
+    if filters_remove:
+        remove_set = {_filter_key(f, known) for f in filters_remove}
+        filters = [f for f in filters if _filter_key(f, known) not in remove_set]
+    if filters_add:
+        existing = {_filter_key(f, known) for f in filters}
+        for f in filters_add:
+            k = _filter_key(f, known)
+            if k not in existing:
+                filters.append(f)
+                existing.add(k)
+    return filters
+
+
+def apply_overlay_patch(
+    snapshot: dict[str, Any],
+    overlay_patch: dict[str, Any],
+    known_filter_keys: Optional[FilterKeys] = None,
+) -> dict[str, Any]:
     """
     MVP semantics:
     - deep merge for objects
     - arrays replaced fully
     - optional op keys:
       - dimensions_add / dimensions_remove
-      - filters_add / filters_remove (applies to definition.logic.filters)
+      - filters_add / filters_remove (applies to definition.logic.filters); filters are
+        compared by filter_hash, using known_filter_keys for hashes stored at write time
+
+    Copy-on-write: only containers on the paths the patch touches are copied. Untouched
+    subtrees (and values taken from the patch) are shared with the inputs, so the result
+    must be treated as read-only. Inputs are never mutated.
     """
-    base = copy.deepcopy(snapshot)
+    base = dict(snapshot)
+    owned = {id(base)}
 
     # Ops first (so explicit replacements in overlay_patch can still override later).
     dims_add = overlay_patch.get("dimensions_add")
     dims_remove = overlay_patch.get("dimensions_remove")
     if dims_add is not None or dims_remove is not None:
-        dims = list(base.get("dimensions") or [])
-        if dims_remove:
-            dims = [d for d in dims if d not in set(dims_remove)]
-        if dims_add:
-            for d in dims_add:
-                if d not in dims:
-                    dims.append(d)
-        base["dimensions"] = dims
+        base["dimensions"] = _apply_dims_ops(base.get("dimensions"), dims_add, dims_remove)
 
     filters_add = overlay_patch.get("filters_add")
     filters_remove = overlay_patch.get("filters_remove")
     if filters_add is not None or filters_remove is not None:
-        definition = base.setdefault("definition", {})
-        logic = definition.setdefault("logic", {})
-        filters = list(logic.get("filters") or [])
-        if filters_remove:
-            remove_set = {repr(f) for f in filters_remove}
-            filters = [f for f in filters if repr(f) not in remove_set]
-        if filters_add:
-            existing = {repr(f) for f in filters}
-            for f in filters_add:
-                if repr(f) not in existing:
-                    filters.append(f)
-                    existing.add(repr(f))
-        logic["filters"] = filters
+        definition = _owned_child(base, "definition", owned)
+        logic = _owned_child(definition, "logic", owned)
+        logic["filters"] = _apply_filter_ops(logic.get("filters"), filters_add, filters_remove, known_filter_keys)
 
     # Standard deep merge for the rest (excluding op keys).
-    patch_no_ops = {
-        k: v
-        for k, v in overlay_patch.items()
-        if k
-        not in {
-            "dimensions_add",
-            "dimensions_remove",
-            "filters_add",
-            "filters_remove",
-        }
-    }
+    patch_no_ops = {k: v for k, v in overlay_patch.items() if k not in _OP_KEYS}
     if patch_no_ops:
-        _deep_merge(base, patch_no_ops)
+        _deep_merge(base, patch_no_ops, owned)
 
     return base
 
+
+def _compose_ops(
+    prev: Optional[tuple[list, list]],
+    add: Optional[list],
+    remove: Optional[list],
+    key: Callable[[Any], Hashable],
+) -> tuple[list, list]:
+    """
+    Folds (remove, add) into an earlier (remove, add) pair.
+
+    Applying the result once equals applying both in order: removals accumulate, earlier
+    additions that are removed again are dropped, and new additions append after the old ones.
+    """
+    removed, added = prev if prev is not None else ([], [])
+    removed_keys = {key(x) for x in removed}
+    removed = list(removed)
+    for x in remove or []:
+        if key(x) not in removed_keys:
+            removed.append(x)
+            removed_keys.add(key(x))
+    remove_now = {key(x) for x in remove or []}
+    added = [x for x in added if key(x) not in remove_now]
+    added_keys = {key(x) for x in added}
+    for x in add or []:
+        if key(x) not in added_keys:
+            added.append(x)
+            added_keys.add(key(x))
+    return removed, added
+
+
+def _compose_merge(dst: dict[str, Any], src: dict[str, Any]) -> bool:
+    """
+    Folds merge patch src into merge patch dst (dst is owned; nested dicts are copied before
+    writing). Returns False when the pair can't be expressed as one merge: an object merged
+    over a key an earlier patch set to a non-object must replace it, but a single patch would
+    merge it into the snapshot's value instead.
+    """
+    for k, v in src.items():
+        if isinstance(v, dict) and k in dst:
+            if not isinstance(dst[k], dict):
+                return False
+            dst[k] = dict(dst[k])
+            if not _compose_merge(dst[k], v):
+                return False
+        else:
+            dst[k] = v
+    return True
+
+
+def compose_overlay_patches(
+    patches: list[dict[str, Any]],
+    known_filter_keys: Optional[FilterKeys] = None,
+) -> Optional[dict[str, Any]]:
+    """
+    Folds an ordered list of overlay patches into one patch with the same effect:
+    apply_overlay_patch(s, compose_overlay_patches(ps)) equals applying ps one by one.
+
+    Assumes snapshots carry definition.logic as an object (enforced when events are written).
+    On snapshots where ops_create_keys() is true the result differs in key order only.
+    Returns None when the stack can't be expressed as a single patch; callers then apply
+    the patches sequentially.
+    """
+    merge: dict[str, Any] = {}
+    dims: Optional[tuple[list, list]] = None
+    filters: Optional[tuple[list, list]] = None
+    try:
+        for patch in patches:
+            dims_add = patch.get("dimensions_add")
+            dims_remove = patch.get("dimensions_remove")
+            if dims_add is not None or dims_remove is not None:
+                if "dimensions" in merge:
+                    # Set outright by an earlier patch: fold the ops into that value.
+                    if isinstance(merge["dimensions"], dict):
+                        return None
+                    merge["dimensions"] = _apply_dims_ops(merge["dimensions"], dims_add, dims_remove)
+                else:
+                    dims = _compose_ops(dims, dims_add, dims_remove, key=lambda d: d)
+
+            filters_add = patch.get("filters_add")
+            filters_remove = patch.get("filters_remove")
+            if filters_add is not None or filters_remove is not None:
+                definition = merge.get("definition", {})
+                logic = definition.get("logic", {}) if isinstance(definition, dict) else None
+                if not isinstance(logic, dict) or isinstance(logic.get("filters"), dict):
+                    return None
+                if "filters" in logic:
+                    logic = dict(logic)
+                    logic["filters"] = _apply_filter_ops(
+                        logic["filters"], filters_add, filters_remove, known_filter_keys
+                    )
+                    merge["definition"] = {**definition, "logic": logic}
+                else:
+                    filters = _compose_ops(
+                        filters, filters_add, filters_remove, key=lambda f: _filter_key(f, known_filter_keys)
+                    )
+
+            if not _compose_merge(merge, {k: v for k, v in patch.items() if k not in _OP_KEYS}):
+                return None
+    except TypeError:
+        # Unhashable dimension values; only sequential application defines their behavior.
+        return None
+
+    out: dict[str, Any] = {}
+    if dims is not None:
+        out["dimensions_remove"], out["dimensions_add"] = dims
+    if filters is not None:
+        out["filters_remove"], out["filters_add"] = filters
+    out.update(merge)
+    return out
+
+
+def ops_create_keys(snapshot: dict[str, Any], patch: dict[str, Any]) -> bool:
+    """
+    Whether patch's ops would create dimensions or definition.logic.filters on snapshot.
+    A composed patch creates them before its merge keys while sequential application may
+    create them after, so such stacks are applied patch by patch to keep the key order.
+    """
+    if (patch.get("dimensions_add") is not None or patch.get("dimensions_remove") is not None) and (
+        "dimensions" not in snapshot
+    ):
+        return True
+    if patch.get("filters_add") is not None or patch.get("filters_remove") is not None:
+        definition = snapshot.get("definition")
+        logic = definition.get("logic") if isinstance(definition, dict) else None
+        return not isinstance(logic, dict) or "filters" not in logic
+    return False
+
+
+def _pointer(path: list[str]) -> str:
+    return "".join("/" + p.replace("~", "~0").replace("/", "~1") for p in path)
+
+
+def _pointer_tokens(pointer: str) -> list[str]:
+    return [t.replace("~1", "/").replace("~0", "~") for t in pointer.split("/")[1:]]
+
+
+def _diff_into(old: dict[str, Any], new: dict[str, Any], path: list[str], ops: list[dict[str, Any]]) -> None:
+    for k in old:
+        if k not in new:
+            ops.append({"op": "remove", "path": _pointer(path + [k])})
+    for k, v in new.items():
+        if k not in old:
+            ops.append({"op": "add", "path": _pointer(path + [k]), "value": v})
+        elif isinstance(v, dict) and isinstance(old[k], dict):
+            _diff_into(old[k], v, path + [k], ops)
+        elif old[k] != v or type(old[k]) is not type(v):
+            ops.append({"op": "replace", "path": _pointer(path + [k]), "value": v})
+
+
+def diff_snapshots(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
+    """
+    Structural diff from old to new as {"ops": [...]}: RFC 6902 add/remove/replace ops on
+    JSON Pointer paths. Objects are diffed key by key; arrays and scalars are replaced whole.
+    Returns {} when the documents are equal.
+    """
+    ops: list[dict[str, Any]] = []
+    _diff_into(old, new, [], ops)
+    return {"ops": ops} if ops else {}
+
+
+def apply_snapshot_diff(snapshot: dict[str, Any], diff: dict[str, Any]) -> dict[str, Any]:
+    """
+    Applies a diff_snapshots result. Copy-on-write like apply_overlay_patch: only containers
+    on the changed paths are copied, so the result must be treated as read-only.
+    """
+    base = dict(snapshot)
+    owned = {id(base)}
+    for op in diff.get("ops") or []:
+        *parents, leaf = _pointer_tokens(op["path"])
+        node = base
+        for token in parents:
+            node = _owned_child(node, token, owned)
+        if op["op"] == "remove":
+            node.pop(leaf, None)
+        else:
+            node[leaf] = op["value"]
+    return base
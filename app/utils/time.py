@@ -6,3 +6,8 @@ from datetime import datetime, timezone
 def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
+
+
+def as_utc(dt: datetime) -> datetime:
+    # SQLite hands back naive datetimes for timezone-aware columns; they are stored as UTC.
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
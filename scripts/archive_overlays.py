@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add parent dir to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core.overlays import archive_expired_overlays  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+
+
+def run_once() -> int:
+    db = SessionLocal()
+    try:
+        return archive_expired_overlays(db)
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move expired overlays into overlays_archive.")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.0,
+        help="Repeat every N seconds (default: run once and exit).",
+    )
+    args = parser.parse_args()
+
+    while True:
+        moved = run_once()
+        print(f"archived {moved} expired overlay(s)")
+        if args.interval <= 0:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Per-request auth overhead: the previous uncached verification against the current cached
+path, for a user JWT and for a workspace key (in-memory SQLite standing in for Postgres,
+so the key numbers understate the saved network round trip).
+
+    python scripts/bench_auth.py --repeat 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+# Add parent dir to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core import auth  # noqa: E402
+from app.db.models import Base, Workspace, WorkspaceApiKey  # noqa: E402
+from app.utils.hashing import new_workspace_key, parse_workspace_key, workspace_key_hash  # noqa: E402
+
+
+def _uncached_user_token(token: str) -> auth.AuthContext:
+    # Previous path: HMAC keyed from the secret string, base64 + json.loads on every call.
+    h, p, s = token.split(".", 2)
+    sig = hmac.new(auth._jwt_secret().encode("utf-8"), f"{h}.{p}".encode("utf-8"), hashlib.sha256).digest()
+    if not hmac.compare_digest(auth._b64url_encode(sig), s):
+        raise ValueError("bad signature")
+    payload = json.loads(auth._b64url_decode(p))
+    if int(payload.get("exp") or 0) and int(time.time()) > int(payload["exp"]):
+        raise ValueError("expired")
+    return auth.AuthContext(
+        workspace_id=str(payload["workspace_id"]),
+        auth_type="user_token",
+        user_id=str(payload["sub"]),
+        roles=list(payload.get("roles") or []),
+        scopes=list(payload.get("scopes") or []),
+        agent_id=payload.get("agent_id"),
+        surface=payload.get("surface"),
+    )
+
+
+def _uncached_workspace_key(db: Session, token: str) -> auth.AuthContext:
+    # Previous path: SELECT on workspace_api_keys plus HMAC on every call.
+    parts = parse_workspace_key(token)
+    row = db.execute(select(WorkspaceApiKey).where(WorkspaceApiKey.key_id == parts.key_id)).scalar_one()
+    if row.status != "active" or not hmac.compare_digest(row.key_hash, workspace_key_hash(token)):
+        raise ValueError("invalid key")
+    return auth.AuthContext(workspace_id=row.workspace_id, auth_type="workspace_key", key_id=row.key_id)
+
+
+def _per_call_us(fn: Callable[[], object], repeat: int) -> float:
+    fn()  # warm caches
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20_000)
+    args = parser.parse_args()
+
+    token = auth.mint_user_jwt(workspace_id="bench", user_id="u1", roles=["analyst"], scopes=["resolve"])
+
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    db = Session(bind=engine)
+    key, parts = new_workspace_key()
+    db.add(Workspace(workspace_id="bench", name="bench"))
+    db.flush()
+    db.add(
+        WorkspaceApiKey(
+            key_id=parts.key_id, workspace_id="bench", env=parts.env, key_hash=workspace_key_hash(key), prefix="wk"
+        )
+    )
+    db.commit()
+
+    rows = [
+        ("user jwt", lambda: _uncached_user_token(token), lambda: auth._validate_user_token(token)),
+        ("workspace key", lambda: _uncached_workspace_key(db, key), lambda: auth._validate_workspace_key(db, key)),
+    ]
+    print(f"repeat={args.repeat}")
+    for name, before, after in rows:
+        old_us = _per_call_us(before, args.repeat)
+        new_us = _per_call_us(after, args.repeat)
+        print(f"{name:14} uncached={old_us:8.2f} us  cached={new_us:8.2f} us  speedup={old_us / new_us:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
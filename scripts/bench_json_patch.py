@@ -0,0 +1,120 @@
+"""
+Compares the copy-on-write overlay patch engine against the previous deepcopy-per-overlay
+implementation on a large snapshot: allocated bytes (tracemalloc) and wall time.
+
+    python scripts/bench_json_patch.py --columns 5000 --overlays 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+# Add parent dir to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.utils.json_patch import apply_overlay_patch  # noqa: E402
+
+
+def _deepcopy_apply(snapshot: dict[str, Any], overlay_patch: dict[str, Any]) -> dict[str, Any]:
+    # Previous engine: full deepcopy of the snapshot plus deepcopy of every merged leaf.
+    def merge(dst: dict[str, Any], src: dict[str, Any]) -> None:
+        for k, v in src.items():
+            if isinstance(v, dict) and isinstance(dst.get(k), dict):
+                merge(dst[k], v)
+            else:
+                dst[k] = copy.deepcopy(v)
+
+    base = copy.deepcopy(snapshot)
+    ops = {"dimensions_add", "dimensions_remove", "filters_add", "filters_remove"}
+    if "dimensions_add" in overlay_patch or "dimensions_remove" in overlay_patch:
+        dims = [d for d in (base.get("dimensions") or []) if d not in set(overlay_patch.get("dimensions_remove") or [])]
+        for d in overlay_patch.get("dimensions_add") or []:
+            if d not in dims:
+                dims.append(d)
+        base["dimensions"] = dims
+    if "filters_add" in overlay_patch or "filters_remove" in overlay_patch:
+        logic = base.setdefault("definition", {}).setdefault("logic", {})
+        remove = {repr(f) for f in overlay_patch.get("filters_remove") or []}
+        filters = [f for f in (logic.get("filters") or []) if repr(f) not in remove]
+        existing = {repr(f) for f in filters}
+        for f in overlay_patch.get("filters_add") or []:
+            if repr(f) not in existing:
+                filters.append(f)
+                existing.add(repr(f))
+        logic["filters"] = filters
+    merge(base, {k: v for k, v in overlay_patch.items() if k not in ops})
+    return base
+
+
+def _large_snapshot(columns: int) -> dict[str, Any]:
+    return {
+        "metric_id": "revenue",
+        "definition": {
+            "display": "Revenue",
+            "logic": {"type": "sum", "field": "amount", "filters": [{"field": "status", "op": "=", "value": "paid"}]},
+        },
+        "grain": "day",
+        "dimensions": ["country", "channel"],
+        "units": "usd",
+        "meta": {"columns": {f"col_{i}": {"type": "text", "description": f"column {i}"} for i in range(columns)}},
+    }
+
+
+def _overlays(n: int) -> list[dict[str, Any]]:
+    out = []
+    for i in range(n):
+        out.append(
+            {
+                "definition": {"display": f"Revenue ({i})"},
+                "dimensions_add": [f"dim_{i}"],
+                "filters_add": [{"field": "team", "op": "=", "value": f"t{i}"}],
+            }
+        )
+    return out
+
+
+def _measure(fn: Callable[[dict, dict], dict], snapshot: dict, overlays: list[dict], repeat: int) -> tuple[int, float, str]:
+    tracemalloc.start()
+    resolved = snapshot
+    for o in overlays:
+        resolved = fn(resolved, o)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        resolved = snapshot
+        for o in overlays:
+            resolved = fn(resolved, o)
+    elapsed = (time.perf_counter() - t0) / repeat
+    return peak, elapsed, json.dumps(resolved)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--columns", type=int, default=5000)
+    parser.add_argument("--overlays", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    snapshot = _large_snapshot(args.columns)
+    overlays = _overlays(args.overlays)
+
+    old_peak, old_t, old_json = _measure(_deepcopy_apply, snapshot, overlays, args.repeat)
+    new_peak, new_t, new_json = _measure(apply_overlay_patch, snapshot, overlays, args.repeat)
+
+    print(f"snapshot columns={args.columns} overlays={args.overlays}")
+    print(f"deepcopy       peak_alloc={old_peak / 1024:10.1f} KiB  time={old_t * 1000:8.3f} ms")
+    print(f"copy-on-write  peak_alloc={new_peak / 1024:10.1f} KiB  time={new_t * 1000:8.3f} ms")
+    print(f"identical JSON: {old_json == new_json}")
+
+
+if __name__ == "__main__":
+    main()
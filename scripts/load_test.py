@@ -0,0 +1,112 @@
+"""
+Closed-loop load test for the resolve, search and history routes: N concurrent clients,
+each sending its next request as soon as the previous one returns. Prints throughput and
+latency percentiles per endpoint.
+
+Compare the sync and async DB paths by running the same load against each server:
+
+    ENGRAM_ASYNC_DB=0 uvicorn app.main:app --port 8000 --workers 1
+    python scripts/load_test.py --base-url http://127.0.0.1:8000 --seed --concurrency 500
+
+    ENGRAM_ASYNC_DB=1 uvicorn app.main:app --port 8000 --workers 1
+    python scripts/load_test.py --base-url http://127.0.0.1:8000 --concurrency 500
+
+(ENGRAM_ASYNC_DB=1 needs `pip install -r requirements-async.txt`.)
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+
+
+def _requests(metric_id: str) -> dict[str, tuple[str, str, dict]]:
+    return {
+        "resolve": ("POST", f"/metrics/{metric_id}/resolve", {"json": {"context": {"team": "finance"}}}),
+        "search": ("GET", "/search", {"params": {"q": metric_id[:3]}}),
+        "history": ("GET", f"/metrics/{metric_id}/history", {"params": {"limit": 20, "view": "summary"}}),
+    }
+
+
+def _seed(base_url: str, metric_id: str) -> None:
+    with httpx.Client(base_url=base_url) as client:
+        client.post("/metrics", json={"metric_id": metric_id, "canonical_name": metric_id.title()})
+        for i in range(20):
+            snapshot = {"definition": {"logic": {"type": "sum", "field": f"amount_{i}"}}, "grain": "day"}
+            event = {"event_type": "snapshot", "source_system": "load_test", "source_ref": {"i": i}}
+            r = client.post(f"/metrics/{metric_id}/events", json={**event, "snapshot": snapshot})
+            r.raise_for_status()
+
+
+async def _client(client: httpx.AsyncClient, plan: list, deadline: float, latencies: dict, errors: dict) -> None:
+    i = 0
+    while time.perf_counter() < deadline:
+        name, (method, path, kwargs) = plan[i % len(plan)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            r = await client.request(method, path, **kwargs)
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencies[name].append(time.perf_counter() - t0)
+        else:
+            errors[name] += 1
+
+
+async def _run(args: argparse.Namespace) -> None:
+    requests = _requests(args.metric_id)
+    plan = [(name, requests[name]) for name in args.endpoints]
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        deadline = time.perf_counter() + args.duration
+        # Stagger start positions so every endpoint sees load from the first second.
+        await asyncio.gather(
+            *(
+                _client(client, plan[i % len(plan) :] + plan[: i % len(plan)], deadline, latencies, errors)
+                for i in range(args.concurrency)
+            )
+        )
+
+    print(f"concurrency={args.concurrency} duration={args.duration}s base_url={args.base_url}")
+    total = 0
+    for name in args.endpoints:
+        lat = sorted(latencies[name])
+        total += len(lat)
+        if not lat:
+            print(f"{name:8} no successful requests, errors={errors[name]}")
+            continue
+        q = statistics.quantiles(lat, n=100) if len(lat) > 1 else [lat[0]] * 99
+        print(
+            f"{name:8} {len(lat) / args.duration:9.1f} req/s  p50={q[49] * 1000:8.1f} ms  "
+            f"p95={q[94] * 1000:8.1f} ms  p99={q[98] * 1000:8.1f} ms  errors={errors[name]}"
+        )
+    print(f"total    {total / args.duration:9.1f} req/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--metric-id", default="revenue")
+    endpoints = ["resolve", "search", "history"]
+    parser.add_argument("--endpoints", nargs="+", choices=endpoints, default=endpoints)
+    parser.add_argument("--seed", action="store_true", help="create the metric and 20 versions first")
+    args = parser.parse_args()
+    if args.seed:
+        _seed(args.base_url, args.metric_id)
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
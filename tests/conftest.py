@@ -11,10 +11,21 @@ from sqlalchemy.pool import StaticPool
 
 # Ensure `import app.*` works under pytest
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# No background last_used_at flusher against the default DB; tests flush explicitly.
+os.environ.setdefault("ENGRAM_KEY_USAGE_FLUSH_SECONDS", "0")
 
 from app.db.models import Base  # noqa: E402
 from app.db.session import get_db  # noqa: E402
 from app.main import app  # noqa: E402
+from app.utils.cache import clear_caches  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _reset_caches():
+    # In-process caches are module-level; keep tests isolated from each other.
+    clear_caches()
+    yield
+    clear_caches()
 
 
 @pytest.fixture()
@@ -52,3 +63,24 @@ def client(db: Session):
         yield c
     app.dependency_overrides.clear()
 
+
+
+@pytest.fixture()
+def session_client(tmp_path):
+    """
+    Like client, but with a new session per request (as in production), so ORM objects
+    expire and detach between requests.
+    """
+    eng = create_engine(f"sqlite+pysqlite:///{tmp_path / 'requests.db'}", future=True)
+    Base.metadata.create_all(eng)
+    SessionPerRequest = sessionmaker(bind=eng, autocommit=False, autoflush=False, future=True)
+
+    def _get_db_override():
+        with SessionPerRequest() as s:
+            yield s
+
+    app.dependency_overrides[get_db] = _get_db_override
+    with TestClient(app) as c:
+        yield c
+    app.dependency_overrides.clear()
+    eng.dispose()
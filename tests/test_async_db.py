@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.identity import create_metric, existing_metric_ids, get_metric
+from app.core.search import search_metrics
+from app.db import session as db_session
+from app.db.models import Base
+from app.db.session import async_database_url, get_db, run_db
+from app.main import app
+
+
+pytest.importorskip("greenlet")
+pytest.importorskip("aiosqlite")
+
+
+def test_async_database_url():
+    url = "postgresql+psycopg2://u:p%40ss@h:6543/postgres?sslmode=require"
+    assert async_database_url(url) == "postgresql+asyncpg://u:p%40ss@h:6543/postgres?ssl=require"
+    assert async_database_url("sqlite:///./local.db") == "sqlite+aiosqlite:///./local.db"
+
+
+def test_routes_on_the_async_engine(tmp_path, monkeypatch):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    path = tmp_path / "async.db"
+    sync_engine = create_engine(f"sqlite:///{path}", future=True)
+    Base.metadata.create_all(sync_engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    monkeypatch.setenv("ENGRAM_ASYNC_DB", "1")
+    monkeypatch.setattr(db_session, "_async_engine", async_engine)
+    monkeypatch.setattr(db_session, "_async_sessionmaker", async_sessionmaker(async_engine, expire_on_commit=False))
+    monkeypatch.setattr("app.api.routes.events.sync_engine", sync_engine)
+
+    SyncSession = sessionmaker(bind=sync_engine, future=True)
+
+    def _sync_db():
+        with SyncSession() as s:
+            yield s
+
+    app.dependency_overrides[get_db] = _sync_db
+    try:
+        with TestClient(app) as client:
+            client.post("/metrics", json={"metric_id": "revenue", "canonical_name": "Revenue"})
+            snapshot = {"definition": {"logic": {"type": "sum", "field": "amount"}}, "grain": "day"}
+            for field in ("amount", "net_amount"):
+                snapshot["definition"]["logic"]["field"] = field
+                event = {"event_type": "snapshot", "source_system": "dbt", "source_ref": {}, "snapshot": snapshot}
+                assert client.post("/metrics/revenue/events", json=event).status_code == 200
+
+            # Served through AsyncSession.run_sync on aiosqlite.
+            resolved = client.post("/metrics/revenue/resolve", json={"context": {}}).json()
+            assert resolved["resolved_snapshot"]["definition"]["logic"]["field"] == "net_amount"
+            batch = client.post("/metrics/resolve:batch", json={"items": [{"metric_id": "revenue"}]}).json()
+            assert batch["results"][0]["status"] == "ok"
+            assert client.get("/search", params={"q": "rev"}).json()["results"][0]["metric_id"] == "revenue"
+
+            history = client.get("/metrics/revenue/history", params={"limit": 1}).json()
+            assert [h["version_id"] for h in history] == [2]
+            assert history[0]["snapshot"]["definition"]["logic"]["field"] == "net_amount"
+            lines = client.get("/metrics/revenue/history", params={"format": "ndjson"}).text.splitlines()
+            assert len(lines) == 2
+            assert client.post("/metrics/missing/resolve", json={"context": {}}).status_code == 404
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_run_db_on_an_async_session(tmp_path):
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    path = tmp_path / "core.db"
+    sync_engine = create_engine(f"sqlite:///{path}", future=True)
+    Base.metadata.create_all(sync_engine)
+    with sessionmaker(bind=sync_engine, future=True)() as s:
+        create_metric(s, "default", "revenue", "Revenue", None)
+
+    async def run() -> tuple:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with AsyncSession(engine) as adb:
+                found = await run_db(adb, search_metrics, "default", "rev")
+                known = await run_db(adb, existing_metric_ids, "default", ["revenue", "orders"])
+                metric = await run_db(adb, get_metric, "default", "revenue")
+                return [r["metric_id"] for r in found], known, metric.canonical_name
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(run()) == (["revenue"], {"revenue"}, "Revenue")
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.core import auth
+from app.core.auth import _validate_user_token, mint_user_jwt
+from app.core.key_usage import tracker as key_usage
+from app.db.models import WorkspaceApiKey
+
+
+def _workspace_key(client) -> tuple[str, str, str]:
+    workspace_id = client.post("/auth/workspaces", json={"name": "acme"}).json()["workspace_id"]
+    key = client.post(f"/auth/workspaces/{workspace_id}/keys", json={"env": "live"}).json()
+    return workspace_id, key["key_id"], key["token"]
+
+
+def test_workspace_key_cache_and_revocation(client, engine):
+    workspace_id, key_id, token = _workspace_key(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    for _ in range(3):
+        r = client.get("/auth/whoami", headers=headers)
+        assert r.status_code == 200
+        assert r.json()["workspace_id"] == workspace_id
+    assert len([s for s in statements if "workspace_api_keys" in s]) == 1
+
+    # A cached key_id still checks the presented secret.
+    bad = {"Authorization": f"Bearer {token[:-2]}xx"}
+    assert client.get("/auth/whoami", headers=bad).status_code == 401
+
+    r = client.post(f"/auth/workspaces/{workspace_id}/keys/{key_id}/revoke")
+    assert r.json()["status"] == "revoked"
+    r = client.get("/auth/whoami", headers=headers)
+    assert r.status_code == 401
+    assert r.json()["detail"] == "workspace key revoked"
+
+
+def test_revoke_during_a_key_lookup_is_not_undone_by_the_cache(client, db, engine, monkeypatch):
+    workspace_id, key_id, token = _workspace_key(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    read = db.execute
+
+    def read_then_concurrent_revoke(*args, **kwargs):
+        frozen = read(*args, **kwargs).freeze()
+        # The lookup has read the "active" row; another request revokes the key now.
+        with sessionmaker(bind=engine, future=True)() as other:
+            other.get(WorkspaceApiKey, key_id).status = "revoked"
+            other.commit()
+        auth.invalidate_workspace_key(key_id)
+        return frozen()
+
+    monkeypatch.setattr(db, "execute", read_then_concurrent_revoke)
+    assert auth._workspace_key_record(db, key_id)[2] == "active"
+    monkeypatch.setattr(db, "execute", read)
+    db.expire_all()
+    r = client.get("/auth/whoami", headers=headers)
+    assert r.status_code == 401
+    assert r.json()["detail"] == "workspace key revoked"
+
+
+def test_verified_token_cache_expires_with_the_token(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth._verified_tokens, "_clock", lambda: now[0])
+    monkeypatch.setenv("ENGRAM_JWT_SECRET", "s1")
+    token = mint_user_jwt(workspace_id="w1", user_id="u1", roles=["analyst"], ttl_seconds=60)
+    first = _validate_user_token(token)
+    assert _validate_user_token(token) is first
+
+    # A rotated secret does not accept cached tokens signed with the old one.
+    monkeypatch.setenv("ENGRAM_JWT_SECRET", "s2")
+    with pytest.raises(HTTPException):
+        _validate_user_token(token)
+
+    # The entry lives until the token's exp (not the cache-wide 300s), then is verified afresh.
+    monkeypatch.setenv("ENGRAM_JWT_SECRET", "s1")
+    now[0] += 55
+    assert _validate_user_token(token) is first
+    now[0] += 6
+    assert _validate_user_token(token) is not first
+
+
+def test_last_used_at_is_flushed_in_bulk(client, db, engine):
+    workspace_id, key_id, token = _workspace_key(client)
+    _, other_id, other = _workspace_key(client)
+    key_usage.flush(db)  # drop anything earlier tests left pending
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    for t in (token, other, token):
+        assert client.get("/auth/whoami", headers={"Authorization": f"Bearer {t}"}).status_code == 200
+    assert not [s for s in statements if s.lstrip().upper().startswith("UPDATE")]
+    assert key_usage.pending() == 2
+
+    assert key_usage.flush(db) == 2
+    assert len([s for s in statements if s.lstrip().upper().startswith("UPDATE")]) == 1
+    db.expire_all()
+    first = db.get(WorkspaceApiKey, key_id).last_used_at
+    assert first is not None and db.get(WorkspaceApiKey, other_id).last_used_at is not None
+
+    # Never moves backwards.
+    key_usage.touch(key_id, at=first - timedelta(hours=1))
+    key_usage.flush(db)
+    db.expire_all()
+    assert db.get(WorkspaceApiKey, key_id).last_used_at == first
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.db import pool as db_pool
+from app.db.pool import TimedNullPool, TimedQueuePool, engine_options, pool_status
+
+
+def test_engine_options_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "2.5")
+    monkeypatch.setenv("DB_POOL_USE_LIFO", "0")
+    opts = engine_options("postgresql+psycopg2://u:p@h:6543/postgres")
+    assert opts["poolclass"] is TimedQueuePool
+    assert (opts["pool_size"], opts["max_overflow"], opts["pool_timeout"]) == (20, 0, 2.5)
+    assert opts["pool_use_lifo"] is False
+    assert opts["pool_pre_ping"] is True
+    assert "connect_args" not in opts  # psycopg2 never uses server-side prepared statements
+
+    # Transaction-mode PgBouncer safe by default for drivers that prepare statements.
+    asyncpg = engine_options("postgresql+asyncpg://u:p@h:6543/postgres", is_async=True)
+    assert asyncpg["connect_args"] == {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    assert asyncpg["poolclass"].__name__ == "TimedAsyncAdaptedQueuePool"
+    assert engine_options("postgresql+psycopg://u:p@h/db")["connect_args"] == {"prepare_threshold": None}
+    monkeypatch.setenv("DB_STATEMENT_CACHE", "1")
+    assert "connect_args" not in engine_options("postgresql+asyncpg://u:p@h/db", is_async=True)
+
+    monkeypatch.setenv("DB_DISABLE_SQLALCHEMY_POOL", "1")
+    opts = engine_options("postgresql+psycopg2://u:p@h:6543/postgres")
+    assert opts["poolclass"] is TimedNullPool and "pool_size" not in opts
+
+    # In-memory SQLite keeps SQLAlchemy's default single-connection pool.
+    monkeypatch.delenv("DB_DISABLE_SQLALCHEMY_POOL")
+    assert "poolclass" not in engine_options("sqlite:///:memory:")
+
+
+def test_checkout_wait_metrics(tmp_path, monkeypatch):
+    metrics = db_pool.PoolMetrics()
+    monkeypatch.setattr(db_pool, "metrics", metrics)
+    monkeypatch.setenv("DB_POOL_SIZE", "1")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "0.05")
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    eng = create_engine(url, future=True, **engine_options(url))
+    try:
+        with eng.connect() as conn:
+            conn.execute(text("select 1"))
+            assert pool_status(eng)["checked_out"] == 1
+            with pytest.raises(exc.TimeoutError):
+                eng.connect()
+        with eng.connect() as conn:
+            conn.execute(text("select 1"))
+    finally:
+        eng.dispose()
+
+    stats = metrics.stats()
+    assert (stats["checkouts"], stats["timeouts"]) == (2, 1)
+    assert sum(stats["wait_histogram"].values()) == 2
+    assert stats["wait_max_ms"] >= stats["wait_avg_ms"] > 0
+
+
+def test_health_pool(client):
+    body = client.get("/health/pool").json()
+    assert set(body["checkout"]) >= {"checkouts", "timeouts", "wait_avg_ms", "wait_max_ms", "wait_histogram"}
+    assert "pool" in body["sync"]
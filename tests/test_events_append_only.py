@@ -1,5 +1,16 @@
-from app.core.events import append_event, get_history
+import json
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app.core import events as events_module
+from app.core.events import append_event, append_events_bulk, get_history
 from app.core.identity import create_metric
+from app.db.models import Base, SemanticEvent, SnapshotBlob
 
 
 def test_append_only_events_increment_version(db):
@@ -53,3 +64,206 @@ def test_append_only_events_increment_version(db):
     # Ensure no overwrite: original snapshot preserved.
     assert hist[-1].snapshot["definition"]["logic"]["field"] == "x"
 
+
+
+def _bulk_event(metric_id: str, field: str) -> dict:
+    return {
+        "metric_id": metric_id,
+        "event_type": "snapshot",
+        "source_system": "dbt",
+        "source_ref": {},
+        "snapshot": {
+            "metric_id": metric_id,
+            "definition": {"display": metric_id, "logic": {"type": "sum", "field": field}},
+            "grain": "day",
+            "dimensions": [],
+            "units": "usd",
+            "meta": {},
+        },
+    }
+
+
+def test_bulk_events_allocate_versions_per_metric(client, db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    create_metric(db, "default", "orders", "Orders", None)
+    single = _bulk_event("revenue", "a")
+    single.pop("metric_id")
+    client.post("/metrics/revenue/events", json=single)
+
+    r = client.post(
+        "/events:bulk",
+        json={"events": [_bulk_event("revenue", "b"), _bulk_event("orders", "x"), _bulk_event("revenue", "c")]},
+    )
+    assert r.status_code == 200
+    assert [(e["metric_id"], e["version_id"]) for e in r.json()["events"]] == [
+        ("revenue", 2),
+        ("orders", 1),
+        ("revenue", 3),
+    ]
+
+    resolved = client.post("/metrics/revenue/resolve", json={"context": {}}).json()
+    assert resolved["base_version_id"] == 3
+    assert resolved["resolved_snapshot"]["definition"]["logic"]["field"] == "c"
+    assert [int(h.version_id) for h in get_history(db, "default", "orders")] == [1]
+
+
+def test_bulk_events_take_the_server_timestamp(db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    single = append_event(db, **_single_kwargs("a"))
+    rows = append_events_bulk(db, "default", [_bulk_event("revenue", "b"), _bulk_event("revenue", "c")])
+
+    # Same clock as single appends (func.now()), and the returned rows carry the stored value.
+    db.expire_all()
+    stored = {e.event_id: e.timestamp for e in get_history(db, "default", "revenue", limit=10)}
+    for row in rows:
+        assert row["timestamp"] == stored[row["event_id"]] >= single.timestamp
+
+
+def test_bulk_events_are_all_or_nothing(client, db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    events = [_bulk_event("revenue", "a"), _bulk_event("missing", "x")]
+    r = client.post("/events:bulk", json={"events": events})
+    assert r.status_code == 404
+    assert get_history(db, "default", "revenue") == []
+
+
+def test_concurrent_appends_get_unique_gapless_versions(tmp_path):
+    # A file database so each writer has its own connection and really races the others.
+    eng = create_engine(f"sqlite:///{tmp_path / 'race.db'}", connect_args={"timeout": 30}, future=True)
+    Base.metadata.create_all(eng)
+    Session = sessionmaker(bind=eng, future=True)
+    with Session() as s:
+        create_metric(s, "default", "revenue", "Revenue", None)
+
+    threads_n, per_thread = 6, 10
+    errors: list[BaseException] = []
+
+    def writer(i: int) -> None:
+        try:
+            with Session() as s:
+                for j in range(per_thread):
+                    append_event(s, **_single_kwargs(f"t{i}-{j}"))
+        except BaseException as e:  # surfaced by the assertion below
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(threads_n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    with Session() as s:
+        events = get_history(s, "default", "revenue", limit=1000)
+        assert sorted(int(e.version_id) for e in events) == list(range(1, threads_n * per_thread + 1))
+        # Every writer's events landed exactly once.
+        assert len({e.source_ref["commit"] for e in events}) == threads_n * per_thread
+    eng.dispose()
+
+
+def test_only_version_conflicts_are_retried(db, monkeypatch):
+    monkeypatch.setattr(events_module, "_APPEND_BACKOFF_MS", 0.0)
+    conflict = (
+        "UNIQUE constraint failed: "
+        "semantic_events.workspace_id, semantic_events.metric_id, semantic_events.version_id"
+    )
+    calls = []
+
+    def attempt(messages: list[str]):
+        def run() -> str:
+            calls.append(1)
+            if len(calls) <= len(messages):
+                raise IntegrityError("INSERT", {}, sqlite3.IntegrityError(messages[len(calls) - 1]))
+            return "ok"
+
+        return run
+
+    assert events_module._retry_version_conflicts(db, attempt([conflict, conflict])) == "ok"
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(IntegrityError):
+        events_module._retry_version_conflicts(db, attempt(["FOREIGN KEY constraint failed"]))
+    assert len(calls) == 1
+
+
+def _single_kwargs(commit: str) -> dict:
+    event = _bulk_event("revenue", "x")
+    return {
+        "workspace_id": "default",
+        "metric_id": "revenue",
+        "event_type": event["event_type"],
+        "source_system": event["source_system"],
+        "source_ref": {"commit": commit},
+        "reason": None,
+        "actor": None,
+        "snapshot": event["snapshot"],
+    }
+
+
+def test_delta_storage_rebuilds_snapshots(client, db, monkeypatch):
+    monkeypatch.setenv("ENGRAM_SNAPSHOT_DELTA_INTERVAL", "3")
+    create_metric(db, "default", "revenue", "Revenue", None)
+    for i in range(5):
+        append_event(db, **_single_kwargs(f"c{i}") | {"snapshot": _bulk_event("revenue", f"f{i}")["snapshot"]})
+    client.post("/events:bulk", json={"events": [_bulk_event("revenue", "f5")]})
+
+    events = sorted(get_history(db, "default", "revenue", limit=10), key=lambda e: e.version_id)
+    # Full snapshots at versions 1 and 4, deltas in between.
+    assert [e.snapshot_hash is not None for e in events] == [True, False, False, True, False, False]
+    assert events[0].semantic_patch == {}
+    assert events[1].semantic_patch == {
+        "ops": [{"op": "replace", "path": "/definition/logic/field", "value": "f1"}]
+    }
+
+    history = client.get("/metrics/revenue/history").json()
+    fields = [h["snapshot"]["definition"]["logic"]["field"] for h in history]
+    assert fields == ["f5", "f4", "f3", "f2", "f1", "f0"]
+    resolved = client.post("/metrics/revenue/resolve", json={"context": {}}).json()
+    assert resolved["resolved_snapshot"]["definition"]["logic"]["field"] == "f5"
+
+
+def test_identical_snapshots_share_one_blob(client, db):
+    for workspace_id in ("default", "other"):
+        create_metric(db, workspace_id, "revenue", "Revenue", None)
+        append_event(db, **_single_kwargs("a") | {"workspace_id": workspace_id})
+    append_event(db, **_single_kwargs("b"))  # re-sync with an unchanged snapshot
+
+    assert db.query(SnapshotBlob).count() == 1
+    assert db.query(SemanticEvent).count() == 3
+
+    # Opt-in no-op skipping: nothing is written, the current version comes back.
+    r = client.post("/events:bulk?skip_unchanged=true", json={"events": [_bulk_event("revenue", "x")]})
+    assert r.json() == {"events": [], "skipped": [0]}
+    single = _bulk_event("revenue", "x")
+    single.pop("metric_id")
+    r = client.post("/metrics/revenue/events?skip_unchanged=true", json=single)
+    assert r.json()["version_id"] == 2
+    assert [int(h.version_id) for h in get_history(db, "default", "revenue")] == [2, 1]
+
+
+def test_history_keyset_pages_and_ndjson_stream(client, db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    client.post("/events:bulk", json={"events": [_bulk_event("revenue", f"f{i}") for i in range(7)]})
+
+    versions, cursor = [], None
+    while True:
+        params = {"limit": 3, "view": "summary"} | ({"before_version": cursor} if cursor else {})
+        r = client.get("/metrics/revenue/history", params=params)
+        assert all("snapshot" not in item for item in r.json())
+        versions += [item["version_id"] for item in r.json()]
+        cursor = r.headers.get("X-Next-Before-Version")
+        if cursor is None:
+            break
+    assert versions == [7, 6, 5, 4, 3, 2, 1]
+
+    r = client.get("/metrics/revenue/history", params={"format": "ndjson", "before_version": 6})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [item["version_id"] for item in lines] == [5, 4, 3, 2, 1]
+    assert lines[0]["snapshot"]["definition"]["logic"]["field"] == "f4"
+
+    r = client.get("/metrics/revenue/history", params={"format": "ndjson", "view": "patch"})
+    first = json.loads(r.text.splitlines()[0])
+    assert "snapshot" not in first and "source_ref" not in first
+    assert first["semantic_patch"]["ops"][0]["value"] == "f6"
@@ -1,9 +1,18 @@
 from __future__ import annotations
 
+import random
 from datetime import datetime, timezone
 
-from app.core.overlays import select_overlays_for_context
-from app.db.models import Overlay
+from app.core.identity import create_metric
+from app.core.overlays import (
+    CompiledOverlays,
+    archive_expired_overlays,
+    list_overlays,
+    select_overlays_for_context,
+    selector_matches,
+    selector_specificity,
+)
+from app.db.models import Overlay, OverlayArchive
 
 
 def _dt(i: int) -> datetime:
@@ -62,3 +71,79 @@ def test_validity_window(db):
     chosen = select_overlays_for_context([o], {"team": "finance"}, now=now)
     assert chosen == []
 
+
+
+def test_compiled_index_matches_linear_scan():
+    rng = random.Random(7)
+    keys = {"team": ["marketing", "finance", "sales"], "region": ["eu", "us"], "product": ["a", "b"]}
+    overlays = []
+    for i in range(200):
+        selector = {k: rng.choice(vs) for k, vs in keys.items() if rng.random() < 0.5}
+        if rng.random() < 0.05:
+            selector["tags"] = ["x"]  # unhashable value -> residual path
+        overlays.append(
+            Overlay(
+                workspace_id="default",
+                metric_id="revenue",
+                selector=selector,
+                priority=rng.randint(0, 3),
+                overlay_patch={"i": i},
+                created_at=_dt(rng.randint(0, 59)),
+            )
+        )
+
+    compiled = CompiledOverlays(overlays)
+    for _ in range(50):
+        context = {k: rng.choice(vs) for k, vs in keys.items() if rng.random() < 0.8}
+        if rng.random() < 0.3:
+            context["tags"] = ["x"]
+        expected = [o for o in overlays if selector_matches(o.selector, context)]
+        expected.sort(
+            key=lambda o: (int(o.priority), selector_specificity(o.selector), o.created_at),
+            reverse=True,
+        )
+        assert compiled.select(overlays, context) == expected
+
+
+def test_validity_segments_and_next_boundary():
+    o = Overlay(
+        workspace_id="default",
+        metric_id="revenue",
+        selector={},
+        priority=0,
+        overlay_patch={"units": "eur"},
+        valid_from=_dt(10),
+        valid_to=_dt(20),
+        created_at=_dt(1),
+    )
+    compiled = CompiledOverlays([o])
+    assert compiled.select([o], {}, now=_dt(5)) == []
+    assert compiled.select([o], {}, now=_dt(10)) == [o]  # inclusive start
+    assert compiled.select([o], {}, now=_dt(15)) == [o]
+    assert compiled.select([o], {}, now=_dt(20)) == [o]  # inclusive end
+    assert compiled.select([o], {}, now=_dt(25)) == []
+    assert compiled.next_boundary(_dt(5)) == _dt(10)
+    assert compiled.next_boundary(_dt(10)) == _dt(20)
+    assert compiled.next_boundary(_dt(25)) is None
+
+
+def test_archive_expired_overlays(db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    for valid_to in (_dt(5), None):
+        db.add(
+            Overlay(
+                workspace_id="default",
+                metric_id="revenue",
+                selector={},
+                priority=0,
+                overlay_patch={},
+                valid_to=valid_to,
+                created_at=_dt(1),
+            )
+        )
+    db.commit()
+
+    assert archive_expired_overlays(db, now=_dt(30)) == 1
+    remaining = list_overlays(db, "default", "revenue")
+    assert len(remaining) == 1 and remaining[0].valid_to is None
+    assert db.query(OverlayArchive).count() == 1
@@ -1,4 +1,18 @@
-from app.utils.json_patch import apply_overlay_patch
+import copy
+import json
+import random
+
+from app.core.snapshots import snapshot_hash
+from app.utils.hashing import canonical_json_hash
+from app.utils.json_patch import (
+    apply_overlay_patch,
+    apply_snapshot_diff,
+    compose_overlay_patches,
+    diff_snapshots,
+    filter_hash,
+    filter_keys,
+    ops_create_keys,
+)
 
 
 def test_deep_merge_and_array_replace():
@@ -31,3 +45,158 @@ def test_filters_ops_add_remove():
     out = apply_overlay_patch(base, patch)
     assert out["definition"]["logic"]["filters"] == [{"field": "y", "op": "=", "value": 2}]
 
+
+
+def _reference_apply(snapshot, overlay_patch):
+    # Deepcopy-based semantics the copy-on-write engine must reproduce exactly.
+    def merge(dst, src):
+        for k, v in src.items():
+            if isinstance(v, dict) and isinstance(dst.get(k), dict):
+                merge(dst[k], v)
+            else:
+                dst[k] = copy.deepcopy(v)
+
+    base = copy.deepcopy(snapshot)
+    if "dimensions_add" in overlay_patch or "dimensions_remove" in overlay_patch:
+        dims = list(base.get("dimensions") or [])
+        dims = [d for d in dims if d not in set(overlay_patch.get("dimensions_remove") or [])]
+        for d in overlay_patch.get("dimensions_add") or []:
+            if d not in dims:
+                dims.append(d)
+        base["dimensions"] = dims
+    if "filters_add" in overlay_patch or "filters_remove" in overlay_patch:
+        logic = base.setdefault("definition", {}).setdefault("logic", {})
+        remove = {repr(f) for f in overlay_patch.get("filters_remove") or []}
+        filters = [f for f in (logic.get("filters") or []) if repr(f) not in remove]
+        for f in overlay_patch.get("filters_add") or []:
+            if repr(f) not in {repr(x) for x in filters}:
+                filters.append(f)
+        logic["filters"] = filters
+    merge(base, {k: v for k, v in overlay_patch.items() if not k.startswith(("dimensions_", "filters_"))})
+    return base
+
+
+def test_copy_on_write_matches_deepcopy_semantics_and_shares_untouched_subtrees():
+    rng = random.Random(3)
+    base = {
+        "metric_id": "revenue",
+        "definition": {"display": "A", "logic": {"type": "sum", "field": "x", "filters": [{"f": 1}]}},
+        "dimensions": ["a", "b"],
+        "meta": {"tags": ["t"], "owner": {"team": "finance"}},
+        "large": {f"k{i}": {"v": i} for i in range(100)},
+    }
+    patches = [
+        {"definition": {"display": "B"}},
+        {"meta": {"owner": {"team": "marketing"}}, "grain": "week"},
+        {"dimensions_add": ["c"], "dimensions_remove": ["a"]},
+        {"filters_add": [{"g": 2}], "filters_remove": [{"f": 1}]},
+        {"definition": {"logic": {"field": "y"}}, "filters_add": [{"h": 3}]},
+        {"meta": "flattened"},
+    ]
+    snapshot_before = json.dumps(base)
+    for _ in range(30):
+        stack = [rng.choice(patches) for _ in range(rng.randint(1, 5))]
+        expected, actual = base, base
+        for p in stack:
+            expected = _reference_apply(expected, p)
+            actual = apply_overlay_patch(actual, p)
+        assert json.dumps(actual) == json.dumps(expected)
+    assert json.dumps(base) == snapshot_before  # inputs never mutated
+
+    out = apply_overlay_patch(base, {"definition": {"display": "B"}})
+    assert out["large"] is base["large"]
+    assert out["definition"]["logic"] is base["definition"]["logic"]
+    assert out["definition"] is not base["definition"]
+
+
+def test_composed_patch_equals_sequential_application():
+    rng = random.Random(11)
+    base = {
+        "definition": {"display": "A", "logic": {"type": "sum", "filters": [{"f": 1}, {"f": 2}]}},
+        "dimensions": ["a", "b", "c"],
+        "meta": {"owner": "x"},
+    }
+    pool = [
+        {"dimensions_add": ["d", "a"]},
+        {"dimensions_remove": ["a", "d"]},
+        {"dimensions_add": ["b"], "dimensions_remove": ["b", "c"]},
+        {"dimensions": ["z"]},
+        {"filters_add": [{"f": 3}], "filters_remove": [{"f": 1}]},
+        {"filters_remove": [{"f": 3}, {"f": 2}]},
+        {"definition": {"logic": {"filters": [{"g": 1}]}}},
+        {"definition": {"display": "B", "logic": {"field": "y"}}},
+        {"meta": {"owner": "y", "tier": 1}},
+        {"meta": "flat"},
+        {"grain": "week"},
+    ]
+    # Without dimensions or filters, ops create those keys.
+    bare = {"definition": {"display": "A", "logic": {"type": "sum"}}, "meta": {"owner": "x"}}
+    composed_count = 0
+    for i in range(600):
+        snapshot = base if i % 2 else bare
+        stack = [rng.choice(pool) for _ in range(rng.randint(0, 6))]
+        expected = snapshot
+        for p in stack:
+            expected = apply_overlay_patch(expected, p)
+        composed = compose_overlay_patches(stack)
+        if composed is None or ops_create_keys(snapshot, composed):
+            continue  # e.g. {"meta": "flat"} followed by {"meta": {...}}
+        composed_count += 1
+        # Byte-identical, key order included.
+        assert json.dumps(apply_overlay_patch(snapshot, composed)) == json.dumps(expected)
+    assert composed_count > 250
+
+    stack = [{"grain": "week"}, {"dimensions_add": ["x"]}]
+    assert ops_create_keys(bare, compose_overlay_patches(stack))
+    assert list(apply_overlay_patch(apply_overlay_patch(bare, stack[0]), stack[1]))[-2:] == ["grain", "dimensions"]
+
+
+def test_filter_identity_ignores_key_order_and_uses_stored_hashes():
+    base = {"definition": {"logic": {"filters": [{"field": "x", "op": "=", "value": 1}]}}}
+    patch = {
+        "filters_remove": [{"value": 1, "op": "=", "field": "x"}],
+        "filters_add": [{"op": "=", "field": "y", "value": 2}, {"field": "y", "value": 2, "op": "="}],
+    }
+    out = apply_overlay_patch(base, patch)
+    assert out["definition"]["logic"]["filters"] == [{"op": "=", "field": "y", "value": 2}]
+
+    # A stored hash is trusted for the exact object it was computed for.
+    f = base["definition"]["logic"]["filters"][0]
+    assert filter_hash(f) == filter_hash({"value": 1, "field": "x", "op": "="})
+    known = filter_keys([f], ["stored"])
+    out = apply_overlay_patch(base, {"filters_add": [{"field": "x", "op": "=", "value": 1}]}, known)
+    assert len(out["definition"]["logic"]["filters"]) == 2
+
+
+def test_snapshot_diff_round_trips():
+    old = {
+        "definition": {"display": "A", "logic": {"type": "sum", "field": "x", "filters": []}},
+        "dimensions": ["a"],
+        "meta": {"a/b": 1, "~t": 2, "gone": None},
+    }
+    new = {
+        "definition": {"display": "B", "logic": {"type": "sum", "field": "x", "filters": [{"f": 1}]}},
+        "dimensions": ["a", "b"],
+        "meta": {"a/b": 1, "~t": 3, "extra": {"k": None}},
+    }
+    before = copy.deepcopy(old)
+    diff = diff_snapshots(old, new)
+    assert {op["path"] for op in diff["ops"]} == {
+        "/definition/display",
+        "/definition/logic/filters",
+        "/dimensions",
+        "/meta/~0t",
+        "/meta/gone",
+        "/meta/extra",
+    }
+    assert apply_snapshot_diff(old, diff) == new
+    assert old == before
+    assert diff_snapshots(new, copy.deepcopy(new)) == {}
+
+
+def test_filter_and_snapshot_hashes_share_the_canonical_json_hash():
+    value = {"field": "país", "op": "=", "value": [1, {"b": 2, "a": 1}]}
+    reordered = {"value": [1, {"a": 1, "b": 2}], "op": "=", "field": "país"}
+    assert filter_hash(value) == snapshot_hash(value) == canonical_json_hash(value) == filter_hash(reordered)
+    # Unchanged from the hashes already stored in filter_hashes / snapshot_blobs.
+    assert filter_hash({"a": 1}) == "015abd7f5cc57a2dd94b7590f04ad8084273905ee33ec5cebeae62276a97f862"
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from app.core.events import append_event
+from app.core.identity import create_metric
+from app.core.overlays import create_overlay
+from app.core import resolver
+from app.core.resolve_cache import get_cached_resolution, invalidate_metric
+from app.core.resolver import resolve_metric_state
+from app.db.models import ResolvedState
+from app.utils.cache import LRUCache, cache_stats, clear_caches
+
+
+def _snapshot(display: str) -> dict:
+    return {
+        "metric_id": "revenue",
+        "definition": {"display": display, "logic": {"type": "sum", "field": "x", "filters": []}},
+        "grain": "day",
+        "dimensions": [],
+        "units": "usd",
+        "meta": {},
+    }
+
+
+def _append(db, display: str):
+    return append_event(
+        db,
+        workspace_id="default",
+        metric_id="revenue",
+        event_type="snapshot",
+        source_system="dbt",
+        source_ref={},
+        reason=None,
+        actor=None,
+        snapshot=_snapshot(display),
+    )
+
+
+def test_lru_cache_evicts_and_counts():
+    t = [0.0]
+    c = LRUCache("test_lru", maxsize=2, ttl_seconds=10, clock=lambda: t[0])
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)  # evicts "b" (least recently used)
+    assert c.get("b") is None
+    t[0] = 11.0
+    assert c.get("a") is None  # expired
+    stats = c.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["evictions"] == 1
+    assert stats["expirations"] == 1
+
+
+def test_repeat_resolve_is_served_from_cache(db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    _append(db, "rev")
+
+    first = resolve_metric_state(db, "default", "revenue", {"team": "finance"})
+    hits_before = cache_stats()["resolve"]["hits"]
+    second = resolve_metric_state(db, "default", "revenue", {"team": "finance"})
+    assert second == first
+    assert cache_stats()["resolve"]["hits"] == hits_before + 1
+
+
+def test_event_and_overlay_writes_invalidate_cache(db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    _append(db, "rev")
+    assert resolve_metric_state(db, "default", "revenue", {})["base_version_id"] == 1
+
+    _append(db, "rev2")
+    out = resolve_metric_state(db, "default", "revenue", {})
+    assert out["base_version_id"] == 2
+    assert out["resolved_snapshot"]["definition"]["display"] == "rev2"
+
+    create_overlay(
+        db,
+        workspace_id="default",
+        metric_id="revenue",
+        selector={},
+        priority=0,
+        overlay_patch={"grain": "week"},
+        valid_from=None,
+        valid_to=None,
+        author=None,
+        reason=None,
+    )
+    out = resolve_metric_state(db, "default", "revenue", {})
+    assert out["resolved_snapshot"]["grain"] == "week"
+    assert len(out["applied_overlays"]) == 1
+
+
+def test_lru_cache_skips_values_read_before_an_invalidation():
+    c = LRUCache("test_lru_generation", maxsize=2)
+    g = c.generation("a")
+    c.delete("a")  # a write committed while "a" was being read
+    c.set("a", "old", generation=g)
+    assert c.get("a") is None
+    c.set("a", "new", generation=c.generation("a"))
+    assert c.get("a") == "new"
+
+    g = c.generation("b")
+    c.invalidate(lambda k: False)  # predicate invalidation covers keys not cached yet
+    c.set("b", "old", generation=g)
+    assert c.get("b") is None
+
+    # Pruned generations fall back to a floor that never returns to a captured value.
+    g = c.generation("x")
+    for i in range(2000):
+        c.bump(i)
+    c.set("x", "old", generation=g)
+    assert c.get("x") is None and c.stats()["stale_skips"] == 3
+
+
+def test_resolve_started_before_a_write_is_not_cached(db, monkeypatch):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    _append(db, "rev")
+    list_overlays = resolver.list_overlays
+
+    def list_overlays_then_concurrent_write(*args):
+        overlays = list_overlays(*args)
+        # Another request commits a write (and invalidates) after this resolve read the metric.
+        invalidate_metric("default", "revenue")
+        return overlays
+
+    monkeypatch.setattr(resolver, "list_overlays", list_overlays_then_concurrent_write)
+    assert resolve_metric_state(db, "default", "revenue", {})["base_version_id"] == 1
+    assert get_cached_resolution("default", "revenue", {}) is None
+
+    monkeypatch.setattr(resolver, "list_overlays", list_overlays)
+    resolve_metric_state(db, "default", "revenue", {})
+    assert get_cached_resolution("default", "revenue", {})["base_version_id"] == 1
+
+
+def test_materialized_states_refreshed_on_write_and_served(db, monkeypatch):
+    monkeypatch.setenv("ENGRAM_MATERIALIZED_RESOLVE", "1")
+    create_metric(db, "default", "revenue", "Revenue", None)
+    _append(db, "rev")
+    create_overlay(
+        db,
+        workspace_id="default",
+        metric_id="revenue",
+        selector={"team": "marketing"},
+        priority=0,
+        overlay_patch={"grain": "week"},
+        valid_from=None,
+        valid_to=None,
+        author=None,
+        reason=None,
+    )
+
+    rows = {r.selector_combination: r for r in db.query(ResolvedState).all()}
+    assert set(rows) == {"{}", '{"team":"marketing"}'}
+    assert rows['{"team":"marketing"}'].resolved_snapshot["grain"] == "week"
+
+    # Extra context keys project onto the same selector combination.
+    clear_caches()
+    out = resolve_metric_state(db, "default", "revenue", {"team": "marketing", "user": "bob"})
+    assert out["resolved_snapshot"]["grain"] == "week"
+    assert out["applied_overlays"] == rows['{"team":"marketing"}'].applied_overlays
+
+    # A new event recomputes every row in the same transaction.
+    _append(db, "rev2")
+    db.expire_all()
+    assert {r.base_version_id for r in db.query(ResolvedState).all()} == {2}
+
+    # Combinations the write path didn't materialize resolve live and are not written by reads.
+    create_overlay(
+        db,
+        workspace_id="default",
+        metric_id="revenue",
+        selector={"region": "eu"},
+        priority=0,
+        overlay_patch={"units": "eur"},
+        valid_from=None,
+        valid_to=None,
+        author=None,
+        reason=None,
+    )
+    clear_caches()
+    out = resolve_metric_state(db, "default", "revenue", {"team": "marketing", "region": "eu"})
+    assert (out["resolved_snapshot"]["grain"], out["resolved_snapshot"]["units"]) == ("week", "eur")
+    db.expire_all()
+    combinations = {r.selector_combination for r in db.query(ResolvedState).all()}
+    assert combinations == {"{}", '{"team":"marketing"}', '{"region":"eu"}'}
+
+
+def test_materialized_states_with_mixed_type_selector_values(db, monkeypatch):
+    monkeypatch.setenv("ENGRAM_MATERIALIZED_RESOLVE", "1")
+    create_metric(db, "default", "revenue", "Revenue", None)
+    _append(db, "rev")
+    for tier, units in (("gold", "eur"), (1, "gbp"), (None, "chf")):
+        create_overlay(
+            db,
+            workspace_id="default",
+            metric_id="revenue",
+            selector={"tier": tier},
+            priority=0,
+            overlay_patch={"units": units},
+            valid_from=None,
+            valid_to=None,
+            author=None,
+            reason=None,
+        )
+    _append(db, "rev2")  # refreshes every row inside the write transaction
+
+    clear_caches()
+    for tier, units in (("gold", "eur"), (1, "gbp"), (None, "chf"), ("silver", "usd")):
+        out = resolve_metric_state(db, "default", "revenue", {"tier": tier})
+        assert (out["base_version_id"], out["resolved_snapshot"]["units"]) == (2, units)
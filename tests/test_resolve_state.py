@@ -2,10 +2,13 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 
+from sqlalchemy import update
+
 from app.core.events import append_event
 from app.core.identity import create_metric
-from app.core.overlays import create_overlay
-from app.core.resolver import resolve_metric_state
+from app.core.overlays import archive_expired_overlays, create_overlay, list_overlays
+from app.core.resolver import _overlays_as_of, resolve_metric_state
+from app.db.models import Overlay, SemanticEvent
 
 
 def test_resolve_no_overlays_equals_base(db):
@@ -140,3 +143,260 @@ def test_search_ranking_exact_metric_id_beats_alias_substring(client, db):
     results = out.json()["results"]
     assert results[0]["metric_id"] == "rev"
 
+
+
+def test_batch_resolve_preserves_order_and_reports_item_errors(client, db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    create_metric(db, "default", "orders", "Orders", None)  # no events yet
+    append_event(
+        db,
+        workspace_id="default",
+        metric_id="revenue",
+        event_type="snapshot",
+        source_system="dbt",
+        source_ref={},
+        reason=None,
+        actor=None,
+        snapshot={
+            "metric_id": "revenue",
+            "definition": {"display": "rev", "logic": {"type": "sum", "field": "x", "filters": []}},
+            "grain": "day",
+            "dimensions": [],
+            "units": "usd",
+            "meta": {},
+        },
+    )
+    create_overlay(
+        db,
+        workspace_id="default",
+        metric_id="revenue",
+        selector={"team": "marketing"},
+        priority=0,
+        overlay_patch={"grain": "week"},
+        valid_from=None,
+        valid_to=None,
+        author=None,
+        reason=None,
+    )
+
+    r = client.post(
+        "/metrics/resolve:batch",
+        params={"workspace_id": "default"},
+        json={
+            "items": [
+                {"metric_id": "revenue", "context": {"team": "marketing"}},
+                {"metric_id": "missing", "context": {}},
+                {"metric_id": "orders", "context": {}},
+                {"metric_id": "revenue", "context": {"team": "finance"}},
+            ]
+        },
+    )
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [x["status"] for x in results] == ["ok", "error", "error", "ok"]
+    assert results[0]["result"]["resolved_snapshot"]["grain"] == "week"
+    assert results[1]["error"] == "metric not found"
+    assert results[3]["result"]["resolved_snapshot"]["grain"] == "day"
+    assert results[3]["result"]["applied_overlays"] == []
+
+
+def _dt(month: int, day: int) -> datetime:
+    return datetime(2026, month, day, tzinfo=timezone.utc)
+
+
+def test_as_of_resolution_uses_version_and_overlays_of_that_instant(client, db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    for display, ts in (("rev v1", _dt(1, 1)), ("rev v2", _dt(3, 1))):
+        e = append_event(
+            db,
+            workspace_id="default",
+            metric_id="revenue",
+            event_type="snapshot",
+            source_system="dbt",
+            source_ref={},
+            reason=None,
+            actor=None,
+            snapshot={
+                "metric_id": "revenue",
+                "definition": {"display": display, "logic": {"type": "sum", "field": "x", "filters": []}},
+                "grain": "day",
+                "dimensions": [],
+                "units": "usd",
+                "meta": {},
+            },
+        )
+        db.execute(update(SemanticEvent).where(SemanticEvent.event_id == e.event_id).values(timestamp=ts))
+    january = create_overlay(
+        db,
+        workspace_id="default",
+        metric_id="revenue",
+        selector={},
+        priority=0,
+        overlay_patch={"grain": "week"},
+        valid_from=None,
+        valid_to=_dt(2, 1),
+        author=None,
+        reason=None,
+    )
+    db.execute(update(Overlay).where(Overlay.overlay_id == january.overlay_id).values(created_at=_dt(1, 5)))
+    db.commit()
+    archive_expired_overlays(db)  # the January overlay only lives in the archive now
+    create_overlay(
+        db,
+        workspace_id="default",
+        metric_id="revenue",
+        selector={},
+        priority=0,
+        overlay_patch={"units": "eur"},  # created today: never applies to the past
+        valid_from=None,
+        valid_to=None,
+        author=None,
+        reason=None,
+    )
+
+    def resolve(**body):
+        r = client.post("/metrics/revenue/resolve", json={"context": {}} | body)
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    out = resolve(as_of="2026-01-10T00:00:00Z")
+    assert out["base_version_id"] == 1
+    assert out["applied_overlays"] == [str(january.overlay_id)]
+    assert out["resolved_snapshot"]["grain"] == "week"
+    assert out["resolved_snapshot"]["units"] == "usd"
+
+    out = resolve(as_of="2026-02-15T00:00:00Z")
+    assert (out["base_version_id"], out["applied_overlays"]) == (1, [])
+
+    out = resolve(as_of_version=2)
+    assert out["resolved_snapshot"]["definition"]["display"] == "rev v2"
+    assert out["applied_overlays"] == []
+
+    assert resolve()["resolved_snapshot"]["units"] == "eur"
+    before_first = client.post("/metrics/revenue/resolve", json={"context": {}, "as_of": "2025-06-01T00:00:00Z"})
+    assert before_first.status_code == 404
+
+    r = client.post(
+        "/metrics/resolve:batch",
+        json={"as_of": "2026-01-10T00:00:00Z", "items": [{"metric_id": "revenue"}, {"metric_id": "missing"}]},
+    )
+    results = r.json()["results"]
+    assert results[0]["result"]["resolved_snapshot"]["grain"] == "week"
+    assert results[1]["status"] == "error"
+
+
+def test_cached_overlay_index_survives_session_per_request(session_client):
+    c = session_client
+    c.post("/metrics", json={"metric_id": "revenue", "canonical_name": "Revenue"})
+    snapshot = {"definition": {"logic": {"type": "sum", "field": "x"}}, "grain": "day"}
+    event = {"event_type": "snapshot", "source_system": "dbt", "source_ref": {}, "snapshot": snapshot}
+    assert c.post("/metrics/revenue/events", json=event).status_code == 200
+    overlay = {"selector": {"team": "finance"}, "overlay_patch": {"grain": "week"}}
+    assert c.post("/metrics/revenue/overlays", json=overlay).status_code == 200
+
+    # Each context compiles or reuses the overlay index built by an earlier (closed) session.
+    for context in ({"team": "finance"}, {"team": "finance", "x": 1}, {"team": "sales"}):
+        r = c.post("/metrics/revenue/resolve", json={"context": context})
+        assert r.status_code == 200
+        assert r.json()["resolved_snapshot"]["grain"] == ("week" if context["team"] == "finance" else "day")
+    items = [{"metric_id": "revenue", "context": {"team": "finance", "y": 2}}]
+    batch = c.post("/metrics/resolve:batch", json={"items": items}).json()
+    assert batch["results"][0]["result"]["resolved_snapshot"]["grain"] == "week"
+
+
+def test_as_of_cache_keys_on_version_and_skips_recent_instants(client, db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+
+    def append(display: str) -> SemanticEvent:
+        return append_event(
+            db,
+            workspace_id="default",
+            metric_id="revenue",
+            event_type="snapshot",
+            source_system="dbt",
+            source_ref={},
+            reason=None,
+            actor=None,
+            snapshot={"metric_id": "revenue", "definition": {"display": display}, "grain": "day"},
+        )
+
+    # Versions written in one transaction share a timestamp.
+    for display in ("v1", "v2", "v3"):
+        e = append(display)
+        db.execute(update(SemanticEvent).where(SemanticEvent.event_id == e.event_id).values(timestamp=_dt(1, 1)))
+    db.commit()
+
+    def resolve(**body):
+        r = client.post("/metrics/revenue/resolve", json={"context": {}} | body)
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    for version in (1, 2, 3, 2):
+        out = resolve(as_of_version=version)
+        assert (out["base_version_id"], out["resolved_snapshot"]["definition"]["display"]) == (version, f"v{version}")
+
+    # A recent instant is not cached: a write that started earlier can still commit at or before it.
+    instant = datetime.now(timezone.utc)
+    assert resolve(as_of=instant.isoformat())["base_version_id"] == 3
+    e = append("v4")
+    db.execute(update(SemanticEvent).where(SemanticEvent.event_id == e.event_id).values(timestamp=instant))
+    db.commit()
+    assert resolve(as_of=instant.isoformat())["base_version_id"] == 4
+
+
+def test_overlay_ops_on_missing_keys_keep_sequential_key_order(db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    append_event(
+        db,
+        workspace_id="default",
+        metric_id="revenue",
+        event_type="snapshot",
+        source_system="dbt",
+        source_ref={},
+        reason=None,
+        actor=None,
+        snapshot={"metric_id": "revenue", "definition": {"logic": {"type": "sum"}}},  # no dimensions
+    )
+    for priority, patch in ((1, {"grain": "week"}), (0, {"dimensions_add": ["country"]})):
+        create_overlay(
+            db,
+            workspace_id="default",
+            metric_id="revenue",
+            selector={},
+            priority=priority,
+            overlay_patch=patch,
+            valid_from=None,
+            valid_to=None,
+            author=None,
+            reason=None,
+        )
+
+    snap = resolve_metric_state(db, "default", "revenue", {})["resolved_snapshot"]
+    assert list(snap) == ["metric_id", "definition", "grain", "dimensions"]
+
+
+def test_as_of_overlays_follow_the_live_order(db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    ids = []
+    for priority, created, valid_to in ((0, 1, None), (5, 2, _dt(2, 1)), (5, 3, None), (1, 4, _dt(2, 1))):
+        o = create_overlay(
+            db,
+            workspace_id="default",
+            metric_id="revenue",
+            selector={},
+            priority=priority,
+            overlay_patch={"grain": f"p{priority}"},
+            valid_from=None,
+            valid_to=valid_to,
+            author=None,
+            reason=None,
+        )
+        db.execute(update(Overlay).where(Overlay.overlay_id == o.overlay_id).values(created_at=_dt(1, created)))
+        ids.append(o.overlay_id)
+    db.commit()
+    live = [o.overlay_id for o in list_overlays(db, "default", "revenue")]
+    assert live == [ids[2], ids[1], ids[3], ids[0]]
+
+    archive_expired_overlays(db)  # two of them move to overlays_archive
+    as_of = _overlays_as_of(db, "default", ["revenue"], _dt(1, 10))["revenue"]
+    assert [o.overlay_id for o in as_of] == live
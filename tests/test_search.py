@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import random
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.core.identity import create_metric, learned_alias_metric_id, upsert_alias
+from app.core.search import _search_sql, search_metrics
+from app.core.ranked_index import osa_distance
+from app.core.search_index import SearchIndex, get_search_index
+
+
+def _rank_match(query: str, candidate: str):
+    # exact (0) > prefix (1) > substring (2) > no match (None), case-insensitive.
+    q, c = query.lower(), candidate.lower()
+    if not q:
+        return None
+    if q == c:
+        return 0
+    if c.startswith(q):
+        return 1
+    return 2 if q in c else None
+
+
+def _linear_search(metrics: dict, aliases: dict, query: str, limit: int) -> list[dict]:
+    # The original full-scan ranking, as the reference.
+    scored = []
+    for metric_id, name in metrics.items():
+        ranks = []
+        for field, text in (("metric_id", metric_id), ("canonical_name", name)):
+            r = _rank_match(query, text)
+            if r is not None:
+                ranks.append((r, field))
+        alias_ranks = [_rank_match(query, a) for (m, a) in aliases.values() if m == metric_id]
+        alias_ranks = [r for r in alias_ranks if r is not None]
+        if alias_ranks:
+            ranks.append((min(alias_ranks), "alias_name"))
+        if not ranks:
+            continue
+        rank, field = sorted(ranks, key=lambda x: x[0])[0]
+        sort_key = (rank, 0 if field == "metric_id" else 1, metric_id)
+        scored.append((sort_key, {"metric_id": metric_id, "field": field}))
+    scored.sort(key=lambda x: x[0])
+    return [row for _, row in scored[:limit]]
+
+
+def test_index_matches_linear_ranking():
+    rng = random.Random(3)
+    words = ["rev", "revenue", "net", "gross", "orders", "Order", "margin", "ARR", "mrr", "churn"]
+    metrics = {}
+    aliases = {}
+    index = SearchIndex()
+    for i in range(300):
+        metric_id = f"{rng.choice(words).lower()}_{i}"
+        name = " ".join(rng.sample(words, 2))
+        metrics[metric_id] = name
+        index.add_metric(metric_id, name, None)
+    for i in range(200):
+        metric_id = rng.choice(list(metrics))
+        key = ("custom", f"loc{rng.randint(0, 120)}")  # repeats re-point existing aliases
+        aliases[key] = (metric_id, " ".join(rng.sample(words, 2)))
+        index.upsert_alias(*key, *aliases[key])
+
+    for q in ["r", "re", "rev", "REVENUE", "net gross", "order", "rr", "xyz", "_1", "churn_9"]:
+        got = [{"metric_id": r["metric_id"], "field": r["match"]["field"]} for r in index.search(q, limit=25)]
+        assert got == _linear_search(metrics, aliases, q, 25), q
+
+
+def test_index_is_updated_by_writes(db):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    assert [r["metric_id"] for r in search_metrics(db, "default", "rev")] == ["revenue"]
+
+    # The index is built now; later writes update it in place.
+    create_metric(db, "default", "rev", "Rev short", "short")
+    upsert_alias(db, "default", "revenue", "custom", "x", "topline", 0.9)
+    assert [r["metric_id"] for r in search_metrics(db, "default", "rev")] == ["rev", "revenue"]
+    assert search_metrics(db, "default", "topline")[0]["match"] == {"field": "alias_name", "rank": 0}
+
+    upsert_alias(db, "default", "rev", "custom", "x", "bottomline", 0.9)
+    assert search_metrics(db, "default", "topline") == []
+    assert search_metrics(db, "default", "bottom")[0]["metric_id"] == "rev"
+
+
+def test_sql_backend_matches_index(db):
+    rng = random.Random(5)
+    words = ["rev", "revenue", "net", "gross", "orders", "margin", "arr", "mrr", "100%", "a_b"]
+    for i in range(60):
+        create_metric(db, "default", f"{rng.choice(words)}_{i}", " ".join(rng.sample(words, 2)), None)
+    metric_ids = [r["metric_id"] for r in search_metrics(db, "default", "_", limit=200)]
+    for i in range(40):
+        alias_name = " ".join(rng.sample(words, 2))
+        upsert_alias(db, "default", rng.choice(metric_ids), "custom", f"loc{i % 25}", alias_name, 0.5)
+
+    index = get_search_index(db, "default")
+    for q in ["r", "rev", "REV", "net gross", "100%", "a_b", "%", "_", "xyz"]:
+        assert _search_sql(db, "default", q, 30) == index.search(q, limit=30), q
+
+
+def test_osa_distance():
+    assert osa_distance("reveune", "revenue", 2) == 1  # adjacent transposition
+    assert osa_distance("revnue", "revenue", 2) == 1
+    assert osa_distance("margn", "margins", 2) == 2
+    assert osa_distance("churn", "revenue", 2) is None
+
+
+def test_ranked_search_tolerates_typos_and_partial_words(db):
+    create_metric(db, "default", "finance.net_revenue", "Net Revenue", "Revenue after refunds")
+    create_metric(db, "default", "finance.gross_revenue", "Gross Revenue", None)
+    create_metric(db, "default", "growth.churn_rate", "Churn", "Share of customers lost")
+    upsert_alias(db, "default", "growth.churn_rate", "custom", "x", "attrition", 0.9)
+
+    assert search_metrics(db, "default", "reveune") == []
+    ranked = search_metrics(db, "default", "reveune", mode="ranked")
+    assert [r["metric_id"] for r in ranked] == ["finance.net_revenue", "finance.gross_revenue"]
+    assert ranked[0]["match"]["terms"] == ["revenue"]
+
+    assert search_metrics(db, "default", "net rev", mode="ranked")[0]["metric_id"] == "finance.net_revenue"
+    assert search_metrics(db, "default", "customers lost", mode="ranked")[0]["metric_id"] == "growth.churn_rate"
+
+    # Alias updates replace the old tokens.
+    assert search_metrics(db, "default", "atrition", mode="ranked")[0]["metric_id"] == "growth.churn_rate"
+    upsert_alias(db, "default", "finance.net_revenue", "custom", "x", "topline", 0.9)
+    assert search_metrics(db, "default", "attrition", mode="ranked") == []
+    assert search_metrics(db, "default", "topline", mode="ranked")[0]["metric_id"] == "finance.net_revenue"
+
+
+def test_resolve_intent_falls_back_to_ranked_search(client):
+    client.post("/metrics", json={"metric_id": "finance.net_revenue", "canonical_name": "Net Revenue"})
+    client.post("/metrics", json={"metric_id": "growth.churn_rate", "canonical_name": "Churn"})
+
+    r = client.post("/metrics/resolve_intent", json={"query": "reveune"}).json()
+    assert r["status"] == "resolved"
+    assert r["resolved_metric"]["metric_id"] == "finance.net_revenue"
+    assert r["confidence"] == 0.75
+
+
+def test_intent_candidates_match_full_scan():
+    rng = random.Random(7)
+    words = ["rev", "Revenue", "net", "gross", "paid", "marketing", "finance", "orders", "é", "a b"]
+    metrics = {}
+    aliases = {}
+    index = SearchIndex()
+    for i in range(200):
+        metric_id = f"{rng.choice(words).lower()}.{rng.choice(words)}_{i}"
+        name, description = " ".join(rng.sample(words, 2)), rng.choice([None, " ".join(rng.sample(words, 3))])
+        status = rng.choice(["active", "active", "deprecated"])
+        metrics[metric_id] = (name, description, status)
+        index.add_metric(metric_id, name, description, status)
+    for i in range(150):
+        key = ("user_learning", f"loc{rng.randint(0, 90)}")
+        aliases[key] = (rng.choice(list(metrics) + ["missing"]), " ".join(rng.sample(words, 2)))
+        index.upsert_alias(*key, *aliases[key])
+
+    def full_scan(q: str) -> list[str]:
+        out = []
+        for metric_id, (name, description, status) in sorted(metrics.items()):
+            hay = " ".join([metric_id, name, description or ""]).lower()
+            alias_names = [a.lower() for (m, a) in aliases.values() if m == metric_id]
+            if status == "active" and (q in hay or any(q in a for a in alias_names)):
+                out.append(metric_id)
+        return out
+
+    for q in ["r", "re", "rev", "revenue", "e n", "t rev", "é", "a b", "_1", "xyz", "net gross"]:
+        assert [m for m, _, _ in index.intent_candidates(q)] == full_scan(q), q
+
+
+def test_learned_alias_hits_skip_the_db(client, engine):
+    client.post("/metrics", json={"metric_id": "finance.net_revenue", "canonical_name": "Net Revenue"})
+    client.post("/metrics", json={"metric_id": "marketing.attributed_revenue", "canonical_name": "Attributed"})
+    alias = {"source_system": "user_learning", "source_locator": "sales:finance", "alias_name": "sales"}
+    client.post("/metrics/finance.net_revenue/aliases", json=alias)
+
+    body = {"query": "Sales", "context": {"team": "finance"}}
+    # The first call builds the search index and caches the alias; the repeat reads nothing.
+    client.post("/metrics/resolve_intent", json=body)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    r = client.post("/metrics/resolve_intent", json=body).json()
+    assert r["resolved_metric"]["metric_id"] == "finance.net_revenue"
+    assert r["confidence"] == 1.0
+    assert not [s for s in statements if "metric_aliases" in s or "FROM metrics" in s]
+
+    # Re-pointing the alias takes effect immediately.
+    client.post("/metrics/marketing.attributed_revenue/aliases", json=alias)
+    r = client.post("/metrics/resolve_intent", json=body).json()
+    assert r["resolved_metric"]["metric_id"] == "marketing.attributed_revenue"
+
+
+def test_learned_alias_lookup_racing_an_upsert_is_not_cached(db, engine, monkeypatch):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    other = sessionmaker(bind=engine, future=True)()
+    read = db.execute
+
+    def read_then_concurrent_upsert(*args, **kwargs):
+        frozen = read(*args, **kwargs).freeze()
+        # Another request learns the alias after this lookup read "no alias".
+        upsert_alias(other, "default", "revenue", "user_learning", "sales:finance", "sales", None)
+        return frozen()
+
+    monkeypatch.setattr(db, "execute", read_then_concurrent_upsert)
+    assert learned_alias_metric_id(db, "default", "sales:finance") is None
+    monkeypatch.setattr(db, "execute", read)
+    assert learned_alias_metric_id(db, "default", "sales:finance") == "revenue"
+    other.close()
+
+
+def test_search_index_built_during_a_write_is_not_cached(db, engine, monkeypatch):
+    create_metric(db, "default", "revenue", "Revenue", None)
+    other = sessionmaker(bind=engine, future=True)()
+    read = db.execute
+    writes = []
+
+    def read_then_concurrent_create(*args, **kwargs):
+        frozen = read(*args, **kwargs).freeze()
+        if not writes:
+            # Another request creates a metric after the build read the metrics table.
+            writes.append(create_metric(other, "default", "refunds", "Refunds", None))
+        return frozen()
+
+    monkeypatch.setattr(db, "execute", read_then_concurrent_create)
+    assert [r["metric_id"] for r in search_metrics(db, "default", "re")] == ["revenue"]
+    monkeypatch.setattr(db, "execute", read)
+    assert {r["metric_id"] for r in search_metrics(db, "default", "re")} == {"refunds", "revenue"}
+    other.close()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import threading
+
+from sqlalchemy.orm import sessionmaker
+
+from app.core.usage_writer import UsageWriter
+from app.db.models import UsageEvent
+
+
+def _record(i: int) -> dict:
+    return {"workspace_id": "default", "query_text": f"resolve:m{i}", "context": {}, "team": None, "interface": "api"}
+
+
+def test_writer_flushes_in_bulk_and_drains_on_stop(engine, db):
+    writer = UsageWriter(
+        sessionmaker(bind=engine, future=True),
+        max_queue=100,
+        batch_size=10,
+        flush_interval_ms=50,
+    )
+    writer.start()
+    for i in range(25):
+        assert writer.submit(_record(i))
+    writer.stop()
+
+    assert db.query(UsageEvent).count() == 25
+    stats = writer.stats()
+    assert stats["written"] == 25
+    assert stats["dropped"] == 0
+    assert stats["flushes"] >= 3  # batch_size caps each INSERT
+
+
+def test_writer_drops_when_queue_is_full(engine):
+    writer = UsageWriter(sessionmaker(bind=engine, future=True), max_queue=2, enqueue_timeout_ms=0)
+    # Not started: nothing drains the queue.
+    assert writer.submit(_record(1))
+    assert writer.submit(_record(2))
+    assert not writer.submit(_record(3))
+    assert writer.stats()["dropped"] == 1
+
+
+def test_stop_keeps_a_writer_that_is_still_flushing(engine, db, caplog):
+    release = threading.Event()
+    factory = sessionmaker(bind=engine, future=True)
+
+    def slow_session():
+        release.wait(5)
+        return factory()
+
+    writer = UsageWriter(slow_session, flush_interval_ms=10)
+    writer.start()
+    writer.submit(_record(1))
+    writer.stop(timeout=0.05)
+    assert writer.stats()["running"]
+    assert "shutdown timed out" in caplog.text
+
+    release.set()
+    writer.stop()
+    assert not writer.stats()["running"]
+    assert db.query(UsageEvent).count() == 1